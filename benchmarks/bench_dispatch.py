@@ -0,0 +1,48 @@
+"""Lookup cost of the generated dispatchers by strategy and number of cases
+
+Usage: python benchmarks/bench_dispatch.py [max number of cases]
+"""
+
+import sys
+import timeit
+
+import codeg
+
+STRATEGIES = ("if", "match", "bisect", "table", "auto")
+if sys.version_info < (3, 10):
+    # match statements need python 3.10
+    STRATEGIES = tuple(e for e in STRATEGIES if e != "match")
+
+
+def dispatcher(n: int, strategy: str):
+    cases = {i * 3: f"return x + {i}" for i in range(n)}
+    return codeg.dispatch(
+        "f", ["kind", "x"], "kind", cases, "return x", strategy
+    ).build()
+
+
+def lookup_cost(n: int, strategy: str, number: int = 20000) -> float:
+    """Mean duration (ns) of a call, over keys spread in the cases"""
+    f = dispatcher(n, strategy)
+    keys = [i * 3 for i in range(0, n, max(1, n // 16))]
+    duration = timeit.timeit(
+        "for k in keys: f(k, 1)", globals={"f": f, "keys": keys}, number=number
+    )
+    return duration / number / len(keys) * 1e9
+
+
+def main():
+    max_cases = int(sys.argv[1]) if len(sys.argv) > 1 else 1024
+    sizes = []
+    n = 4
+    while n <= max_cases:
+        sizes.append(n)
+        n *= 4
+    print("cases " + "".join(f"{e:>9}" for e in STRATEGIES) + "  (ns by call)")
+    for n in sizes:
+        costs = [lookup_cost(n, strategy) for strategy in STRATEGIES]
+        print(f"{n:>5} " + "".join(f"{e:>9.0f}" for e in costs))
+
+
+if __name__ == "__main__":
+    main()
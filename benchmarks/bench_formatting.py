@@ -0,0 +1,53 @@
+"""Compare the native formatter to black on large trees
+
+Usage: python benchmarks/bench_formatting.py [number of classes]
+"""
+
+import sys
+import time
+
+import codeg
+
+
+def large_script(n_classes: int) -> codeg.BasePiece:
+    code_script = codeg.script()
+    code_script.import_("math")
+    for i in range(n_classes):
+        code_cls = code_script.cls(f"Class{i}", ["object"])
+        code_cls.annotation("name", str)
+        for j in range(10):
+            parameters = [
+                codeg.param(f"parameter_{k}", annotation=int, default=k)
+                for k in range(j)
+            ]
+            code_f = code_cls.method(f"method_{j}", parameters)
+            code_if = code_f.if_("self.name")
+            code_if.line(f"x = {j}")
+            code_if.else_().line("x = 0")
+            code_f.ret("x")
+    return code_script
+
+
+def timeit(f) -> float:
+    start = time.perf_counter()
+    f()
+    return time.perf_counter() - start
+
+
+def main():
+    n_classes = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    code_script = large_script(n_classes)
+
+    # Import black before timing
+    codeg.format_string_with_black("")
+    for formatter in codeg.FORMATTERS:
+        duration = timeit(lambda: code_script.generate_code(formatter=formatter))
+        print(f"{formatter}: {duration:.3f}s")
+
+    native = code_script.generate_code(formatter="native")
+    black = code_script.generate_code(formatter="black")
+    print("same output:", native == black)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,56 @@
+"""Compare the memory and the rendering time of a tree with repeated subtrees,
+with and without intern_tree
+
+Usage: python benchmarks/bench_interning.py [number of functions]
+"""
+
+import gc
+import sys
+import time
+import tracemalloc
+
+import codeg
+
+
+def repeated_tree(n: int) -> codeg.BasePiece:
+    """n functions with identical bodies (different names)"""
+    code_script = codeg.script()
+    for i in range(n):
+        code_f = code_script.function(f"f{i}", ["x"])
+        code_try = code_f.try_()
+        for j in range(5):
+            code_if = code_try.if_(f"x > {j}")
+            code_if.line(f"x -= {j}")
+            code_if.else_().line(f"x += {j}")
+        code_try.except_("ValueError").line("x = 0")
+        code_f.ret("x")
+    return code_script
+
+
+def measure(n: int, intern: bool):
+    """Return (memory in bytes, generate_code duration) of the tree"""
+    tracemalloc.start()
+    try:
+        tree = repeated_tree(n)
+        if intern:
+            codeg.intern_tree(tree)
+            # Dropped subtrees are reference cycles (parents links)
+            gc.collect()
+        size, _ = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    start = time.perf_counter()
+    tree.generate_code(format_with_black=False)
+    return size, time.perf_counter() - start
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    for intern in (False, True):
+        size, duration = measure(n, intern)
+        label = "interned" if intern else "plain"
+        print(f"{label:>8}: {size / 1e6:.1f} MB, generate_code {duration:.3f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,58 @@
+"""Report the memory used by a large tree (bytes per line and per piece)
+
+Usage: python benchmarks/bench_memory.py [number of lines]
+"""
+
+import sys
+import tracemalloc
+
+import codeg
+
+
+def large_tree(n_lines: int) -> codeg.BasePiece:
+    """Tree of n_lines lines (10 lines and 6 pieces per class)"""
+    code_script = codeg.script()
+    for i in range(n_lines // 10):
+        code_cls = code_script.cls(f"A{i}")
+        code_cls.annotation("x", int)
+        code_f = code_cls.method("f", ["y"])
+        code_if = code_f.if_("y")
+        code_if.line("y += 1")
+        code_if.else_().line("y -= 1")
+        code_f.comment("comment")
+        code_f.ret("y")
+        code_cls.line("z = 1")
+    return code_script
+
+
+def count_pieces(piece: codeg.BasePiece) -> int:
+    count = 0
+    stack = [piece]
+    while stack:
+        piece = stack.pop()
+        count += 1
+        for e in (*piece._pieces, *piece._sibling_pieces):
+            if isinstance(e, codeg.BasePiece):
+                stack.append(e)
+    return count
+
+
+def measure(n_lines: int):
+    """Return (bytes per line, bytes per piece) of a tree of n_lines lines"""
+    tracemalloc.start()
+    try:
+        tree = large_tree(n_lines)
+        size, _ = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return size / n_lines, size / count_pieces(tree)
+
+
+def main():
+    n_lines = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+    per_line, per_piece = measure(n_lines)
+    print(f"{n_lines} lines: {per_line:.0f} bytes per line, {per_piece:.0f} per piece")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,36 @@
+"""Measure the scaling of generate_many with the number of workers
+
+Usage: python benchmarks/bench_parallel.py [number of scripts]
+"""
+
+import os
+import sys
+import time
+
+import codeg
+
+
+def scripts(n: int):
+    for i in range(n):
+        code_script = codeg.script()
+        code_script.import_("math")
+        for j in range(20):
+            code_script.function(f"f{j}", ["x", "y"]).ret(f"math.sqrt(x*{i}+y*{j})")
+        yield code_script
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    trees = list(scripts(n))
+    workers = 1
+    while workers <= (os.cpu_count() or 1):
+        codeg.format_cache.clear()
+        start = time.perf_counter()
+        for _ in codeg.generate_many(trees, workers=workers):
+            pass
+        print(f"{workers} workers: {time.perf_counter() - start:.2f}s")
+        workers *= 2
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+"""Compare construction and comparison of record classes with hand-written
+slotted classes, dataclasses and attrs classes
+
+Usage: python benchmarks/bench_records.py
+"""
+
+import dataclasses
+import sys
+import timeit
+
+import attrs
+import codeg
+
+
+class HandWritten:
+    __slots__ = ("x", "y", "name")
+
+    def __init__(self, x, y, name):
+        self.x = x
+        self.y = y
+        self.name = name
+
+    def __eq__(self, other):
+        if other.__class__ is self.__class__:
+            return (self.x, self.y, self.name) == (other.x, other.y, other.name)
+        return NotImplemented
+
+
+# slots needs python 3.10
+DATACLASS_SLOTS = {"slots": True} if sys.version_info >= (3, 10) else {}
+
+
+@dataclasses.dataclass(**DATACLASS_SLOTS)
+class DataClass:
+    x: int
+    y: int
+    name: str
+
+
+@attrs.define
+class AttrsClass:
+    x: int
+    y: int
+    name: str
+
+
+@dataclasses.dataclass(frozen=True, **DATACLASS_SLOTS)
+class FrozenDataClass:
+    x: int
+    y: int
+    name: str
+
+
+@attrs.frozen
+class FrozenAttrsClass:
+    x: int
+    y: int
+    name: str
+
+
+def record_class(frozen=False):
+    fields = [
+        codeg.param("x", annotation=int),
+        codeg.param("y", annotation=int),
+        codeg.param("name", annotation=str),
+    ]
+    return codeg.record("Record", fields, frozen=frozen).build()
+
+
+def measure(cls, number=200_000):
+    """Return the durations (ns) of a construction and of a comparison"""
+    a, b = cls(1, 2, "a"), cls(1, 2, "a")
+    init = timeit.timeit(lambda: cls(1, 2, "a"), number=number)
+    eq = timeit.timeit(lambda: a == b, number=number)
+    return init / number * 1e9, eq / number * 1e9
+
+
+def main():
+    classes = {
+        "hand-written": HandWritten,
+        "record": record_class(),
+        "record frozen": record_class(frozen=True),
+        "dataclass": DataClass,
+        "attrs": AttrsClass,
+        "dataclass frozen": FrozenDataClass,
+        "attrs frozen": FrozenAttrsClass,
+    }
+    print(f"{'':>16} {'init':>7} {'eq':>7}  (ns)")
+    for name, cls in classes.items():
+        init, eq = measure(cls)
+        print(f"{name:>16} {init:>7.0f} {eq:>7.0f}")
+
+
+if __name__ == "__main__":
+    main()
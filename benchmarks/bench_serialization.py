@@ -0,0 +1,61 @@
+"""Compare building a large tree with loading it (dumps/loads) and with pickle
+using __getstate__ (the format used before dumps)
+
+Usage: python benchmarks/bench_serialization.py [number of lines]
+"""
+
+import copyreg
+import io
+import pickle
+import sys
+import time
+
+import codeg
+from bench_memory import large_tree
+
+
+def _timed(f):
+    start = time.perf_counter()
+    result = f()
+    return result, time.perf_counter() - start
+
+
+class _StatePickler(pickle.Pickler):
+    """Pickle pieces with __getstate__ and __setstate__ (no __reduce__)"""
+
+    def reducer_override(self, obj):
+        if isinstance(obj, codeg.BasePiece):
+            return copyreg.__newobj__, (type(obj),), obj.__getstate__()
+        return NotImplemented
+
+
+def _state_dumps(tree) -> bytes:
+    fp = io.BytesIO()
+    _StatePickler(fp, pickle.HIGHEST_PROTOCOL).dump(tree)
+    return fp.getvalue()
+
+
+def main():
+    n_lines = int(sys.argv[1]) if len(sys.argv) > 1 else 200_000
+    tree, duration = _timed(lambda: large_tree(n_lines))
+    print(f"build:  {duration:.3f}s")
+
+    data, dump_duration = _timed(lambda: codeg.dumps(tree))
+    _, load_duration = _timed(lambda: codeg.loads(data))
+    print(
+        f"codeg:  {len(data) / 1e6:.1f} MB,"
+        f" dumps {dump_duration:.3f}s, loads {load_duration:.3f}s"
+    )
+
+    # Deep recursion of pickle on the tree
+    sys.setrecursionlimit(100_000)
+    data, dump_duration = _timed(lambda: _state_dumps(tree))
+    _, load_duration = _timed(lambda: pickle.loads(data))
+    print(
+        f"pickle: {len(data) / 1e6:.1f} MB,"
+        f" dumps {dump_duration:.3f}s, loads {load_duration:.3f}s"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,209 @@
+"""Benchmark suite timing each phase of the code generation
+
+Usage:
+    python benchmarks/suite.py run [-o results.json] [--quick]
+    python benchmarks/suite.py compare baseline.json results.json [--threshold 0.2]
+
+run times the phases (construction, render, black, stub, compile, exec) on
+synthetic trees and writes the results as JSON (stdout by default).
+compare exits with status 1 when a phase of results is slower than the
+baseline by more than threshold (20% by default).
+"""
+
+import argparse
+import gc
+import json
+import platform
+import sys
+import time
+
+import codeg
+from codeg.consts import VERSION
+
+# name => (size, quick size) of the synthetic trees
+# (python refuses more than 100 levels of indentation)
+SIZES = {
+    "wide_class": (2000, 100),
+    "deep_nesting": (90, 50),
+    "small_functions": (2000, 100),
+    "flat_script": (50000, 1000),
+}
+
+
+def wide_class(n: int) -> codeg.BasePiece:
+    """One class with n annotated attributes and methods"""
+    code_script = codeg.script()
+    code_cls = code_script.cls("Wide", ["object"])
+    for i in range(n):
+        code_cls.annotation(f"attribute_{i}", int)
+        parameters = [codeg.param(f"p{j}", annotation=int, default=j) for j in range(8)]
+        code_cls.method(f"method_{i}", parameters).ret(f"p0 + {i}")
+    return code_script
+
+
+def deep_nesting(n: int) -> codeg.BasePiece:
+    """A function with n nested blocks"""
+    code_script = codeg.script()
+    piece = code_script.function("deep", ["x"])
+    for i in range(n):
+        piece.line(f"x += {i}")
+        piece = piece.if_(f"x > {i}")
+    piece.line("pass")
+    return code_script
+
+
+def small_functions(n: int) -> codeg.BasePiece:
+    code_script = codeg.script()
+    for i in range(n):
+        code_f = code_script.function(f"f{i}", ["x", "y"])
+        code_f.if_("x").ret(f"y + {i}")
+        code_f.ret(f"x * {i}")
+    return code_script
+
+
+def flat_script(n: int) -> codeg.BasePiece:
+    code_script = codeg.script()
+    for i in range(n):
+        code_script.line(f"x{i} = {i}")
+    return code_script
+
+
+GENERATORS = {
+    "wide_class": wide_class,
+    "deep_nesting": deep_nesting,
+    "small_functions": small_functions,
+    "flat_script": flat_script,
+}
+
+
+def _timeit(f, repeat: int):
+    """Return the best time of f and its last result"""
+    best = None
+    result = None
+    for _ in range(repeat):
+        gc.collect()
+        start = time.perf_counter()
+        result = f()
+        duration = time.perf_counter() - start
+        best = duration if best is None else min(best, duration)
+    return best, result
+
+
+def bench_tree(name: str, size: int, repeat: int) -> dict:
+    generator = GENERATORS[name]
+    timings = {}
+    timings["construction"], tree = _timeit(lambda: generator(size), repeat)
+    # New trees: rendering must not hit the fragments cache
+    trees = [generator(size) for _ in range(repeat)]
+    timings["render"], source = _timeit(
+        lambda: trees.pop().generate_code(format_with_black=False), repeat
+    )
+    timings["black"], _ = _timeit(lambda: codeg.format_string_with_black(source), 1)
+    timings["stub"], _ = _timeit(lambda: tree.generate_stubcode(), 1)
+    filename = "<benchmark>"
+    timings["compile"], code = _timeit(
+        lambda: compile(source, filename, "exec"), repeat
+    )
+    timings["exec"], _ = _timeit(lambda: exec(code, {}), repeat)
+    return timings
+
+
+def bench_signature(repeat: int) -> float:
+    parameters = [codeg.param(f"p{i}", annotation=int, default=i) for i in range(20)]
+    duration, _ = _timeit(
+        lambda: [codeg.generate_function_signature(parameters) for _ in range(10000)],
+        repeat,
+    )
+    return duration
+
+
+def run(quick: bool = False, repeat: int = 3) -> dict:
+    # Caches would make all the runs after the first one free
+    codeg.code_cache.enabled = False
+    codeg.format_cache.enabled = False
+    codeg.set_cache_dir(None)
+
+    import black
+
+    results = {}
+    for name, (size, quick_size) in SIZES.items():
+        size = quick_size if quick else size
+        results[name] = {"size": size, **bench_tree(name, size, repeat)}
+    results["signature"] = {"size": 10000, "render": bench_signature(repeat)}
+    return {
+        "metadata": {
+            "codeg": VERSION,
+            "black": black.__version__,
+            "python": platform.python_version(),
+            "implementation": platform.python_implementation(),
+            "machine": platform.machine(),
+            "quick": quick,
+            "repeat": repeat,
+        },
+        "results": results,
+    }
+
+
+def compare(
+    baseline: dict, current: dict, threshold: float = 0.2, min_duration: float = 0.001
+) -> list:
+    """Return the regressions as (benchmark, phase, baseline, current) tuples
+
+    Phases faster than min_duration (seconds) are too noisy to be compared
+    """
+    regressions = []
+    for name, timings in current["results"].items():
+        base_timings = baseline["results"].get(name)
+        if base_timings is None or base_timings.get("size") != timings.get("size"):
+            continue
+        for phase, duration in timings.items():
+            if phase == "size" or phase not in base_timings:
+                continue
+            if duration < min_duration:
+                continue
+            if duration > base_timings[phase] * (1 + threshold):
+                regressions.append((name, phase, base_timings[phase], duration))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    run_parser = subparsers.add_parser("run")
+    run_parser.add_argument("-o", "--output", help="JSON file (default: stdout)")
+    run_parser.add_argument("--quick", action="store_true", help="small trees")
+    run_parser.add_argument("--repeat", type=int, default=3)
+    compare_parser = subparsers.add_parser("compare")
+    compare_parser.add_argument("baseline")
+    compare_parser.add_argument("current")
+    compare_parser.add_argument("--threshold", type=float, default=0.2)
+    compare_parser.add_argument("--min-duration", type=float, default=0.001)
+    args = parser.parse_args(argv)
+
+    if args.command == "run":
+        results = run(quick=args.quick, repeat=args.repeat)
+        if args.output:
+            with open(args.output, "w") as f:
+                json.dump(results, f, indent=2)
+        else:
+            json.dump(results, sys.stdout, indent=2)
+            print()
+        return 0
+
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    with open(args.current) as f:
+        current = json.load(f)
+    regressions = compare(baseline, current, args.threshold, args.min_duration)
+    for name, phase, before, after in regressions:
+        print(
+            f"{name}.{phase}: {before:.4f}s -> {after:.4f}s (+{after / before - 1:.0%})"
+        )
+    if regressions:
+        return 1
+    print("No regression")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
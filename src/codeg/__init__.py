@@ -1,4 +1,17 @@
+import importlib
+
+from .cache import (  # noqa: F401;
+    CacheStats,
+    CodeCache,
+    DiskCodeCache,
+    DiskFormatCache,
+    FormatCache,
+    LinecacheRegistry,
+    LRUCache,
+)
 from .codeg import (  # noqa: F401; Functions,
+    FORMATTERS,
+    LINE_LENGTH,
     BaseIndentPiece,
     BasePiece,
     ClassBlock,
@@ -10,22 +23,76 @@ from .codeg import (  # noqa: F401; Functions,
     Parameter,
     block,
     build,
+    build_many,
     cls,
+    code_cache,
     comment,
+    compile_source,
     for_,
+    format_cache,
     format_string_with_black,
     function,
     generate_function_call,
+    generate_function_parameters,
     generate_function_signature,
     if_,
     import_,
     line,
+    linecache_registry,
     method,
+    metrics,
     p,
     param,
     parameter,
     script,
+    set_cache_dir,
     try_,
     while_,
+    wrap_brackets,
 )
+from .dispatchers import Dispatch, dispatch  # noqa: F401;
 from .exceptions import CodegSyntaxError  # noqa: F401;
+from .factory import FunctionFactory  # noqa: F401;
+from .interning import Interner, intern_tree  # noqa: F401;
+from .phases import Metrics, PhaseCounter, PhaseRecord  # noqa: F401;
+from .records import record  # noqa: F401;
+from .templates import Template, TemplateInstance  # noqa: F401;
+
+# Names of the submodules loading heavy modules (asyncio, concurrent.futures,
+# tempfile, ...), they are imported on first access (see __getattr__) to keep
+# `import codeg` fast
+_LAZY_NAMES = {
+    "build_async": "background",
+    "generate_code_async": "background",
+    "set_build_executor": "background",
+    "submit_build": "background",
+    "submit_generate_code": "background",
+    "write_package": "emit",
+    "GeneratedImporter": "importer",
+    "register_importer": "importer",
+    "PARALLEL_THRESHOLD": "parallel",
+    "generate_many": "parallel",
+    "generate_stubs": "parallel",
+    "FORMAT_VERSION": "serialization",
+    "dumps": "serialization",
+    "loads": "serialization",
+}
+
+
+_LAZY_MODULES = set(_LAZY_NAMES.values())
+
+
+def __getattr__(name):
+    if name in _LAZY_MODULES:
+        # The import sets the module as attribute of the package
+        return importlib.import_module(f".{name}", __name__)
+    module_name = _LAZY_NAMES.get(name)
+    if module_name is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(f".{module_name}", __name__), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted({*globals(), *_LAZY_NAMES, *_LAZY_MODULES})
@@ -0,0 +1,201 @@
+"""Build and generate code in background threads (futures and asyncio)"""
+
+import concurrent.futures
+import threading
+from typing import Any, Callable, Dict, Hashable
+
+from . import codeg
+from .codeg import BasePiece, _format_key, _normalize_formatter
+
+# Executor of the builds (threads), see set_build_executor
+_executor: concurrent.futures.Executor = None
+# Optional executor (ex: process pool) of black formatting
+_format_executor: concurrent.futures.Executor = None
+_executor_lock = threading.Lock()
+
+# key => future of the computation in progress with this key
+_in_flight: Dict[Hashable, concurrent.futures.Future] = {}
+_in_flight_lock = threading.Lock()
+
+
+def set_build_executor(
+    executor: concurrent.futures.Executor = None,
+    format_executor: concurrent.futures.Executor = None,
+):
+    """Set the default executors of submit_build, build_async, ...
+
+    executor runs the builds: it must run in the current process (threads),
+    since objects are built in the globals of the caller. By default a
+    thread pool is created on first use.
+    format_executor (ex: a process pool) formats the code with black, by
+    default black runs in the threads of executor.
+    """
+    global _executor, _format_executor
+    with _executor_lock:
+        _executor = executor
+        _format_executor = format_executor
+
+
+def _get_executor(executor) -> concurrent.futures.Executor:
+    global _executor
+    if executor is not None:
+        return executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = concurrent.futures.ThreadPoolExecutor(
+                thread_name_prefix="codeg-build"
+            )
+        return _executor
+
+
+def submit_build(
+    piece: BasePiece,
+    globals=None,
+    locals=None,
+    filename=None,
+    *,
+    formatter=None,
+    executor: concurrent.futures.Executor = None,
+    format_executor: concurrent.futures.Executor = None,
+) -> concurrent.futures.Future:
+    """Build piece in the background and return the future of piece.build()
+
+    Rendering, formatting and compilation run in executor (see
+    set_build_executor). Concurrent builds of the same source are coalesced:
+    the source is formatted and compiled once, the other builds wait for it
+    and only execute the code (in their own globals).
+    The tree must not be modified until the build is done.
+    """
+    if format_executor is None:
+        format_executor = _format_executor
+    return _get_executor(executor).submit(
+        _build, piece, globals, locals, filename, formatter, format_executor
+    )
+
+
+async def build_async(
+    piece: BasePiece,
+    globals=None,
+    locals=None,
+    filename=None,
+    *,
+    formatter=None,
+    executor: concurrent.futures.Executor = None,
+    format_executor: concurrent.futures.Executor = None,
+) -> Any:
+    """Same as submit_build, without blocking the event loop"""
+    import asyncio
+
+    future = submit_build(
+        piece,
+        globals,
+        locals,
+        filename,
+        formatter=formatter,
+        executor=executor,
+        format_executor=format_executor,
+    )
+    return await asyncio.wrap_future(future)
+
+
+def submit_generate_code(
+    piece: BasePiece,
+    *,
+    stub=False,
+    formatter=None,
+    executor: concurrent.futures.Executor = None,
+    format_executor: concurrent.futures.Executor = None,
+) -> concurrent.futures.Future:
+    """Generate the code of piece in the background and return its future
+
+    Concurrent generations of the same code are coalesced, see submit_build
+    """
+    if format_executor is None:
+        format_executor = _format_executor
+    return _get_executor(executor).submit(
+        _generate_code, piece, stub, formatter, format_executor
+    )
+
+
+async def generate_code_async(
+    piece: BasePiece,
+    *,
+    stub=False,
+    formatter=None,
+    executor: concurrent.futures.Executor = None,
+    format_executor: concurrent.futures.Executor = None,
+) -> str:
+    """Same as submit_generate_code, without blocking the event loop"""
+    import asyncio
+
+    future = submit_generate_code(
+        piece,
+        stub=stub,
+        formatter=formatter,
+        executor=executor,
+        format_executor=format_executor,
+    )
+    return await asyncio.wrap_future(future)
+
+
+def _run_coalesced(key: Hashable, f: Callable[[], Any]) -> Any:
+    """Return f(), or the result of the call with the same key in progress"""
+    with _in_flight_lock:
+        future = _in_flight.get(key)
+        owner = future is None
+        if owner:
+            future = _in_flight[key] = concurrent.futures.Future()
+    if not owner:
+        return future.result()
+
+    try:
+        result = f()
+    except BaseException as e:
+        future.set_exception(e)
+        raise
+    else:
+        future.set_result(result)
+    finally:
+        with _in_flight_lock:
+            del _in_flight[key]
+    return result
+
+
+def _formatted(piece, unformatted: str, stub: bool, formatter, format_executor):
+    """Return the code of piece formatted with formatter"""
+    if formatter == "native":
+        return piece.generate_code(stub=stub, formatter="native")
+    if formatter != "black":
+        return unformatted
+    if format_executor is None:
+        return codeg._format_code(unformatted, stub)
+
+    key = _format_key(unformatted, stub)
+    formatted = codeg.format_cache.get(key)
+    if formatted is None:
+        formatted = format_executor.submit(codeg._format_code, unformatted, stub)
+        formatted = formatted.result()
+        codeg.format_cache.set(key, formatted)
+    return formatted
+
+
+def _generate_code(piece, stub, formatter, format_executor) -> str:
+    formatter = _normalize_formatter(formatter)
+    unformatted = piece.generate_code(format_with_black=False, stub=stub)
+    return _run_coalesced(
+        ("code", unformatted, stub, formatter),
+        lambda: _formatted(piece, unformatted, stub, formatter, format_executor),
+    )
+
+
+def _build(piece, globals, locals, filename, formatter, format_executor) -> Any:
+    formatter = _normalize_formatter(formatter)
+    unformatted = piece.generate_code(format_with_black=False)
+
+    def compile_source():
+        # Fills format_cache and code_cache used by piece.build
+        source = _formatted(piece, unformatted, False, formatter, format_executor)
+        codeg.compile_source(source, filename)
+
+    _run_coalesced(("build", unformatted, formatter, filename), compile_source)
+    return piece.build(globals, locals, filename, formatter=formatter)
@@ -0,0 +1,432 @@
+import collections
+import functools
+import hashlib
+import importlib.util
+import linecache
+import marshal
+import os
+import sys
+import threading
+import types
+import weakref
+from typing import Any, Hashable, Optional, Tuple
+
+from attrs import define
+
+
+def source_digest(source: str) -> str:
+    """Return the hash used to identify a generated source"""
+    return hashlib.sha256(source.encode("utf-8")).hexdigest()
+
+
+def parts_digest(*parts: str) -> str:
+    """Return the hash of several strings (sources, formatting mode, ...)"""
+    h = hashlib.sha256()
+    for part in parts:
+        h.update(part.encode("utf-8"))
+        h.update(b"\0")
+    return h.hexdigest()
+
+
+@define(frozen=True)
+class CacheStats:
+    """Snapshot of the statistics of a cache"""
+
+    hits: int
+    misses: int
+    evictions: int
+    size: int
+    maxsize: int
+
+
+class LRUCache:
+    def __init__(self, maxsize: int = 1024, enabled: bool = True):
+        """Bounded mapping evicting the least recently used entries
+
+        The cache keep track of hits, misses and evictions so that we can tell
+        if it is useful (see stats method).
+        When the cache is disabled, get always miss and set does nothing.
+        The cache can be used from several threads.
+        """
+        self._lock = threading.RLock()
+        self._data = collections.OrderedDict()
+        self._maxsize = maxsize
+        self.enabled = enabled
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self._data)
+
+    def __contains__(self, key):
+        return key in self._data
+
+    def __repr__(self):
+        return (
+            f"<{self.__class__.__name__} size={len(self)} maxsize={self.maxsize} "
+            f"enabled={self.enabled}>"
+        )
+
+    @property
+    def maxsize(self) -> int:
+        return self._maxsize
+
+    @maxsize.setter
+    def maxsize(self, maxsize: int):
+        if maxsize < 0:
+            raise ValueError("maxsize must be positive")
+        with self._lock:
+            self._maxsize = maxsize
+            self._evict()
+
+    def get(self, key: Hashable, default=None) -> Any:
+        if not self.enabled:
+            return default
+        with self._lock:
+            try:
+                value = self._data[key]
+            except KeyError:
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key: Hashable, value: Any):
+        if not self.enabled or not self._maxsize:
+            return
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            self._evict()
+
+    def _evict(self):
+        while len(self._data) > self._maxsize:
+            self._data.popitem(last=False)
+            self.evictions += 1
+
+    def clear(self):
+        """Remove all entries and reset the statistics"""
+        with self._lock:
+            self._data.clear()
+            self.hits = 0
+            self.misses = 0
+            self.evictions = 0
+
+    def stats(self) -> CacheStats:
+        with self._lock:
+            return CacheStats(
+                hits=self.hits,
+                misses=self.misses,
+                evictions=self.evictions,
+                size=len(self._data),
+                maxsize=self._maxsize,
+            )
+
+
+class CodeCache(LRUCache):
+    """Cache of compiled code objects keyed by the hash of their source
+
+    Identical sources compiled with the same flags share one code object,
+    so building the same script many times only compile it once.
+    """
+
+    def key(self, source: str, filename=None, mode="exec", flags=0) -> Hashable:
+        return (source_digest(source), filename, mode, flags)
+
+
+class DiskCodeCache:
+    # Suffix of the cache files, used to know which files we can prune
+    suffix = ".codeg"
+    # Suffixes of the files of all the disk caches: caches sharing a directory
+    # prune their files together, so that it stays under max_size
+    pruned_suffixes = (".codeg", ".black")
+
+    def __init__(self, directory, max_size: int = 64 * 1024 * 1024):
+        """Persistent cache of marshalled code objects (like __pycache__)
+
+        Each entry is a file named after the key and the interpreter cache tag
+        (ex: cpython-311) containing the source and its code object, so that
+        the next processes can skip formatting and compilation.
+        Files are written in a temporary file then renamed, so the directory
+        can be shared by concurrent processes.
+        When the directory is bigger than max_size (bytes), the least recently
+        used files are removed (also the files of the other disk caches
+        sharing the directory, see pruned_suffixes).
+        """
+        self.directory = os.fspath(directory)
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        os.makedirs(self.directory, exist_ok=True)
+
+    def __repr__(self):
+        return f"<{self.__class__.__name__} {self.directory!r}>"
+
+    def key(self, *parts: str) -> str:
+        """Hash the parts (sources, formatting mode, ...) to a key"""
+        return parts_digest(*parts)
+
+    def path(self, key: str) -> str:
+        return os.path.join(
+            self.directory, f"{key}.{sys.implementation.cache_tag}{self.suffix}"
+        )
+
+    def get(self, key: str) -> Optional[Tuple[str, types.CodeType]]:
+        """Return the (source, code) stored for key or None"""
+        data = self._read(key)
+        if data is None:
+            return None
+
+        magic = importlib.util.MAGIC_NUMBER
+        try:
+            if not data.startswith(magic):
+                raise ValueError("bad magic number")
+            offset = len(magic)
+            source, code = marshal.loads(data[offset:])
+        except (ValueError, EOFError, TypeError):
+            # Corrupted or written by another python version, ignore it
+            self.misses += 1
+            return None
+        self.hits += 1
+        return source, code
+
+    def set(self, key: str, source: str, code: types.CodeType):
+        self._write(key, importlib.util.MAGIC_NUMBER + marshal.dumps((source, code)))
+
+    def _read(self, key: str) -> Optional[bytes]:
+        """Return the content of the file of key (None is counted as a miss)"""
+        path = self.path(key)
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+        except OSError:
+            self.misses += 1
+            return None
+
+        # Update access time for the LRU pruning
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        return data
+
+    def _write(self, key: str, data: bytes):
+        import tempfile
+
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, self.path(key))
+        except BaseException:
+            try:
+                os.unlink(tmp_path)
+            except OSError:
+                pass
+            raise
+        self.prune()
+
+    def prune(self):
+        """Remove the least recently used files until the size is under max_size"""
+        entries = []
+        total_size = 0
+        with os.scandir(self.directory) as it:
+            for entry in it:
+                if not entry.name.endswith(self.pruned_suffixes):
+                    continue
+                try:
+                    stat = entry.stat()
+                except OSError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+                total_size += stat.st_size
+
+        if total_size <= self.max_size:
+            return
+
+        entries.sort()
+        for _, size, path in entries:
+            if total_size <= self.max_size:
+                break
+            try:
+                os.unlink(path)
+            except OSError:
+                # Already removed by another process
+                pass
+            else:
+                self.evictions += 1
+            total_size -= size
+
+    def clear(self):
+        with os.scandir(self.directory) as it:
+            for entry in it:
+                if entry.name.endswith(self.suffix):
+                    try:
+                        os.unlink(entry.path)
+                    except OSError:
+                        pass
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def stats(self) -> CacheStats:
+        return CacheStats(
+            hits=self.hits,
+            misses=self.misses,
+            evictions=self.evictions,
+            size=sum(
+                1 for e in os.scandir(self.directory) if e.name.endswith(self.suffix)
+            ),
+            maxsize=self.max_size,
+        )
+
+
+class DiskFormatCache(DiskCodeCache):
+    """Persistent cache of the sources formatted by black
+
+    Files contain the formatted source (utf-8), the key must include the
+    black version since the output change between versions.
+    """
+
+    suffix = ".black"
+
+    def get(self, key: str) -> Optional[str]:
+        data = self._read(key)
+        if data is None:
+            return None
+        try:
+            formatted = data.decode("utf-8")
+        except UnicodeDecodeError:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return formatted
+
+    def set(self, key: str, formatted: str):
+        self._write(key, formatted.encode("utf-8"))
+
+
+class FormatCache(LRUCache):
+    def __init__(self, maxsize: int = 256, enabled: bool = True):
+        """Cache of the sources formatted by black
+
+        Formatting identical unformatted sources returns the memoized result.
+        An optional disk tier (disk attribute, see codeg.set_cache_dir) is
+        used when the source is not in memory, so that the next processes
+        do not run black again.
+        """
+        super().__init__(maxsize=maxsize, enabled=enabled)
+        self.disk: Optional[DiskFormatCache] = None
+
+    def key(self, source: str, stub: bool, version: str, mode: str) -> str:
+        return parts_digest(source, str(stub), version, mode)
+
+    def get(self, key: str, default=None) -> Any:
+        value = super().get(key)
+        if value is not None or not self.enabled:
+            return default if value is None else value
+        if self.disk is not None:
+            value = self.disk.get(key)
+            if value is not None:
+                super().set(key, value)
+                return value
+        return default
+
+    def set(self, key: str, value: str):
+        if not self.enabled:
+            return
+        super().set(key, value)
+        if self.disk is not None:
+            self.disk.set(key, value)
+
+
+class LinecacheRegistry:
+    # Prefix of the filenames generated for the sources
+    filename_prefix = "<generated with ScripBuilder "
+
+    def __init__(self):
+        """Register generated sources in linecache without leaking memory
+
+        linecache is used to show the lines of generated code in tracebacks.
+        A source stays in linecache as long as a code object compiled from it
+        is alive: functions and classes built from the source, or the code
+        cache. Once all of them are garbage collected, the entry is removed
+        and its generated filename is reused (python keeps filenames of
+        executed code forever, so generating new ones would leak memory).
+        The registry can be used from several threads, a filename is never
+        given twice while it is in use.
+        """
+        # Reentrant: weakref callbacks can run during a registration (gc)
+        self._lock = threading.RLock()
+        # filename => number of alive code objects compiled with this filename
+        self._counts = {}
+        # id(code) => weak reference of the code object
+        self._refs = {}
+        # Generated filenames that are not used anymore
+        self._free_filenames = []
+        self._counter = 0
+
+    def __len__(self):
+        return len(self._counts)
+
+    def __contains__(self, filename):
+        return filename in self._counts
+
+    def new_filename(self) -> str:
+        """Return an unused filename"""
+        with self._lock:
+            if self._free_filenames:
+                return self._free_filenames.pop()
+            self._counter += 1
+            return f"{self.filename_prefix}{self._counter}>"
+
+    def register(self, code: types.CodeType, source: str, replace: bool = False):
+        """Add source to linecache while code (or its nested code) is alive
+
+        Generated filenames are unique for a source, so an existing entry is
+        kept unless replace is True (used for filenames given by the user)
+        """
+        filename = code.co_filename
+        with self._lock:
+            if replace or filename not in linecache.cache:
+                linecache.cache[filename] = (
+                    len(source),
+                    None,
+                    source.splitlines(True),
+                    filename,
+                )
+            self._track(code)
+
+    def _track(self, code: types.CodeType):
+        if id(code) in self._refs:
+            # Already tracked (code coming from the code cache)
+            return
+
+        filename = code.co_filename
+        stack = [code]
+        while stack:
+            code = stack.pop()
+            key = id(code)
+            if key in self._refs:
+                continue
+            self._refs[key] = weakref.ref(
+                code, functools.partial(self._release, key, filename)
+            )
+            self._counts[filename] = self._counts.get(filename, 0) + 1
+            stack.extend(e for e in code.co_consts if isinstance(e, types.CodeType))
+
+    def _release(self, key: int, filename: str, ref=None):
+        with self._lock:
+            self._refs.pop(key, None)
+            count = self._counts.get(filename, 0) - 1
+            if count > 0:
+                self._counts[filename] = count
+                return
+
+            self._counts.pop(filename, None)
+            linecache.cache.pop(filename, None)
+            if filename.startswith(self.filename_prefix):
+                self._free_filenames.append(filename)
@@ -1,13 +1,39 @@
 import abc
 import collections.abc
-import linecache
-from typing import Any, Callable, List, Type, Union  # noqa: TYP001
+import functools
+import threading
+import time
+import types
+from typing import (  # noqa: TYP001
+    TYPE_CHECKING,
+    Any,
+    Callable,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Type,
+    Union,
+)
 
 from attrs import define, field
 import attrs
-import black
 
+from .cache import (
+    CodeCache,
+    DiskCodeCache,
+    DiskFormatCache,
+    FormatCache,
+    LinecacheRegistry,
+)
 from .exceptions import CodegSyntaxError
+from .phases import Metrics
+
+if TYPE_CHECKING:
+    import ast
+    import concurrent.futures
+
+    from .factory import FunctionFactory
 
 
 def _attr_nothing_factory():
@@ -17,8 +43,67 @@ def _attr_nothing_factory():
 
 
 def format_string_with_black(string: str, stub: bool = False) -> str:
-    """Format python code with PEP8 using black"""
-    return black.format_str(string, mode=black.FileMode(is_pyi=stub))
+    """Format python code with PEP8 using black
+
+    black is imported on first use: it is by far the heaviest dependency
+    and it is not needed to generate unformatted code or to build it.
+    Results are memoized in format_cache"""
+    key = _format_key(string, stub)
+    formatted = format_cache.get(key)
+    if formatted is None:
+        import black
+
+        formatted = black.format_str(string, mode=black.FileMode(is_pyi=stub))
+        format_cache.set(key, formatted)
+    return formatted
+
+
+def _format_key(string: str, stub: bool) -> str:
+    """Key of format_cache, black mode options are the ones of format_string_with_black"""
+    mode_options = {"is_pyi": stub}
+    return format_cache.key(string, stub, _black_version(), repr(mode_options))
+
+
+@functools.lru_cache(maxsize=None)
+def _black_version() -> str:
+    """Version of black, read from the package metadata to avoid importing it"""
+    import importlib.metadata
+
+    try:
+        return importlib.metadata.version("black")
+    except importlib.metadata.PackageNotFoundError:
+        import black
+
+        return black.__version__
+
+
+# Maximum length of the lines generated by the native formatter (same as black)
+LINE_LENGTH = 88
+FORMATTERS = ("black", "native")
+
+
+def _normalize_formatter(formatter, format_with_black=True):
+    if formatter is None:
+        return "black" if format_with_black else None
+    if formatter not in FORMATTERS:
+        raise ValueError(f"formatter must be one of {FORMATTERS} not {formatter!r}")
+    return formatter
+
+
+def _format_code(script: str, stub: bool = False) -> str:
+    try:
+        if not metrics.enabled:
+            return format_string_with_black(script, stub=stub)
+        start = time.perf_counter()
+        formatted = format_string_with_black(script, stub=stub)
+        metrics.record("black", time.perf_counter() - start, formatted)
+        return formatted
+    except Exception as e:
+        import coloring
+
+        coloring.print_red(script)
+        coloring.print_red("========== ERORR ===========")
+        raise e
 
 
 def annotation_to_str(annotation) -> str:
@@ -50,6 +135,52 @@ def build(source: str, globals=None, locals=None, filename=None) -> Any:
     """Compile the script and return the objects in a dict
     Subclass can return specific objects (not always dict)
     """
+    c = compile_source(source, filename)
+    return _exec_code(c, globals, locals)
+
+
+def build_many(
+    pieces: Iterable["BasePiece"],
+    globals=None,
+    locals=None,
+    filename=None,
+    *,
+    formatter=None,
+) -> Dict["BasePiece", Any]:
+    """Build named pieces (functions, classes) together and return a dict
+    piece => built object
+
+    The pieces are joined in one script compiled once (and registered once
+    in linecache, so tracebacks show the lines of each piece).
+    The names of the pieces must be unique, ValueError is raised otherwise.
+    """
+    pieces = list(pieces)
+    names = {}
+    for piece in pieces:
+        name = getattr(piece, "name", None)
+        if name is None:
+            raise ValueError(f"{piece!r} has no name, it can not be built with others")
+        if name in names:
+            raise ValueError(f"Several pieces are named {name!r}")
+        names[name] = piece
+
+    formatter = _normalize_formatter(formatter)
+    if formatter == "native":
+        source = "\n\n".join(
+            piece.generate_code(formatter="native") for piece in pieces
+        )
+    else:
+        source = "\n\n\n".join(
+            piece.generate_code(format_with_black=False) for piece in pieces
+        )
+        if formatter == "black":
+            source = _format_code(source)
+
+    namespace = build(source, globals=globals, locals=locals, filename=filename)
+    return {piece: namespace[piece.name] for piece in pieces}
+
+
+def _exec_code(code: types.CodeType, globals=None, locals=None) -> Any:
     if globals is None and locals is None:
         globals = {}
         locals = globals
@@ -60,24 +191,255 @@ def build(source: str, globals=None, locals=None, filename=None) -> Any:
     if locals is None:
         locals = {}
 
+    if not metrics.enabled:
+        eval(code, globals, locals)
+        return locals
+
+    start = time.perf_counter()
+    eval(code, globals, locals)
+    metrics.record("exec", time.perf_counter() - start)
+    return locals
+
+
+def compile_source(source: str, filename=None, flags: int = 0):
+    """Compile the source (mode exec) and return the code object
+
+    Code objects are shared through code_cache: compiling a source that was
+    already compiled with the same flags (and the same filename if given)
+    return the cached code object without calling compile again.
+    If a cache directory is set (see set_cache_dir), code objects are also
+    stored on disk and reused by the next processes.
+    When filename is not given, a unique filename is generated.
+    """
+    return _compile_source(source, filename, flags)
+
+
+def _compile_source(source: str, filename=None, flags: int = 0, disk_key=None):
+    """disk_key is used by callers that already looked up the disk cache
+    with their own key, in this case the code is stored under this key"""
+    key = code_cache.key(source, filename, "exec", flags)
+    code = code_cache.get(key)
+    if code is None:
+        entry = None
+        if disk_cache is not None and disk_key is None:
+            disk_key = disk_cache.key("source", str(flags), source)
+            entry = disk_cache.get(disk_key)
+
+        if entry is not None:
+            code = _relabel_code(entry[1], filename)
+        else:
+            start = time.perf_counter() if metrics.enabled else None
+            code = compile(
+                source,
+                filename or linecache_registry.new_filename(),
+                "exec",
+                flags,
+                True,
+            )
+            if start is not None:
+                metrics.record("compile", time.perf_counter() - start, source)
+            if disk_cache is not None:
+                disk_cache.set(disk_key, source, code)
+        code_cache.set(key, code)
+
+    _register_source(code, source, filename)
+    return code
+
+
+def _register_source(code: types.CodeType, source: str, filename=None):
+    """Register the source of code in linecache (see LinecacheRegistry)"""
+    if not metrics.enabled:
+        linecache_registry.register(code, source, replace=bool(filename))
+        return
+    start = time.perf_counter()
+    linecache_registry.register(code, source, replace=bool(filename))
+    metrics.record("linecache", time.perf_counter() - start, source)
+
+
+def _relabel_code(code: types.CodeType, filename=None) -> types.CodeType:
+    """Change the filename of a code object loaded from the disk cache
+
+    The filename was generated by another process, so we generate a new one
+    to not collide with the filenames of the current process
+    """
     if not filename:
-        global _counter_filename
-        _counter_filename += 1
-        filename = f"<generated with ScripBuilder {_counter_filename}>"
+        filename = linecache_registry.new_filename()
+    consts = tuple(
+        _relabel_code(e, filename) if isinstance(e, types.CodeType) else e
+        for e in code.co_consts
+    )
+    return code.replace(co_filename=filename, co_consts=consts)
 
-    # Adding linecache to facilitate debuging and show lines of errors
-    linecache.cache[filename] = (len(source), None, source.splitlines(True), filename)
 
-    c = compile(source, filename, "exec")
-    eval(c, globals, locals)
-    return locals
+def set_cache_dir(directory, max_size: int = 64 * 1024 * 1024):
+    """Store compiled code in directory to reuse it in the next processes
+
+    Sources formatted by black are stored in the same directory (see format_cache).
+    The directory can be shared by concurrent processes, files of both caches
+    are pruned together (least recently used first) when they are bigger than
+    max_size bytes.
+    Use None to disable the disk cache.
+    """
+    global disk_cache
+    if directory is None:
+        disk_cache = None
+        format_cache.disk = None
+    else:
+        disk_cache = DiskCodeCache(directory, max_size=max_size)
+        format_cache.disk = DiskFormatCache(directory, max_size=max_size)
+    return disk_cache
+
+
+# Compiled code objects shared between builds of identical sources
+code_cache = CodeCache()
+# Optional persistent cache, see set_cache_dir
+disk_cache = None
+# Sources formatted by black
+format_cache = FormatCache()
+# Generated sources shown in tracebacks
+linecache_registry = LinecacheRegistry()
+# Durations of the phases of the builds, disabled by default
+metrics = Metrics()
+
+
+# Shared by the pieces without child or sibling pieces (lists are created when needed)
+_NO_PIECES = ()
+# Locks of the pieces mutations, shared by pieces (a lock by piece would be too big)
+_PIECE_LOCKS = tuple(threading.RLock() for _ in range(64))
+
+
+def _piece_lock(piece) -> threading.RLock:
+    return _PIECE_LOCKS[(id(piece) >> 4) % len(_PIECE_LOCKS)]
+
+
+class _HeaderList(list):
+    """List held by a piece (decorators, parameters, ...): modifying it
+    invalidates the generated code cache of the piece"""
+
+    __slots__ = ("_piece",)
+
+    @classmethod
+    def _of(cls, piece: "BasePiece", values=()) -> "_HeaderList":
+        # Faster than a python __init__ (pieces are created in bulk)
+        tracked = cls(values)
+        tracked._piece = piece
+        return tracked
+
+    def __reduce__(self):
+        # Copied and pickled as a list (without the piece)
+        return list, (list(self),)
+
+    def _modified(self, added=()):
+        self._piece.invalidate()
+
+    def append(self, value):
+        super().append(value)
+        self._modified((value,))
+
+    def extend(self, values):
+        values = list(values)
+        super().extend(values)
+        self._modified(values)
+
+    def insert(self, index, value):
+        super().insert(index, value)
+        self._modified((value,))
+
+    def __setitem__(self, index, value):
+        if isinstance(index, slice):
+            value = list(value)
+            super().__setitem__(index, value)
+            self._modified(value)
+        else:
+            super().__setitem__(index, value)
+            self._modified((value,))
 
+    def __iadd__(self, values):
+        self.extend(values)
+        return self
+
+    def __imul__(self, n):
+        super().__imul__(n)
+        self._modified()
+        return self
+
+    def __delitem__(self, index):
+        super().__delitem__(index)
+        self._modified()
+
+    def pop(self, index=-1):
+        value = super().pop(index)
+        self._modified()
+        return value
+
+    def remove(self, value):
+        super().remove(value)
+        self._modified()
+
+    def clear(self):
+        super().clear()
+        self._modified()
+
+    def sort(self, *, key=None, reverse=False):
+        super().sort(key=key, reverse=reverse)
+        self._modified()
+
+    def reverse(self):
+        super().reverse()
+        self._modified()
+
+
+class _PieceList(_HeaderList):
+    """pieces or sibling_pieces of a piece: the added pieces are linked to it"""
+
+    __slots__ = ()
+
+    def _modified(self, added=()):
+        # No lock held here: _add_parent takes the lock of the added piece
+        for piece in added:
+            if isinstance(piece, BasePiece):
+                piece._add_parent(self._piece)
+        self._piece.invalidate()
+
+
+def _header_slot(slot) -> property:
+    """Property of a slot used to generate the header of a piece (name,
+    parameters, ...): assigning it invalidates the cache of the piece, lists
+    are copied to _HeaderList"""
 
-# Used to generate unique filename when compiling python code
-_counter_filename = 0
+    def set_value(piece, value):
+        if type(value) is list or isinstance(value, _HeaderList):
+            value = _HeaderList._of(piece, value)
+        slot.__set__(piece, value)
+        if piece._fragments is not None:
+            piece.invalidate()
+
+    return property(slot.__get__, set_value, slot.__delete__)
+
+
+@functools.lru_cache(maxsize=None)
+def _slot_names(cls) -> tuple:
+    return tuple(
+        name for klass in cls.__mro__ for name in vars(klass).get("__slots__", ())
+    )
 
 
 class BasePiece(abc.ABC):
+    # Pieces are compact (no __dict__): trees can contain millions of them
+    __slots__ = ("_pieces", "_sibling_pieces", "_parents", "_fragments")
+    tab = "    "
+    # Pieces nested deeper than this do not cache their generated code
+    max_cached_height = 4
+    # Functions and classes are surrounded by blank lines (native formatter)
+    is_definition = False
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        # Public slots generate the header of the pieces, see _header_slot
+        for name in vars(cls).get("__slots__", ()):
+            if not name.startswith("_"):
+                setattr(cls, name, _header_slot(vars(cls)[name]))
+
     def __init__(self):
         """Base class used to generate a script dynamically and execute it
 
@@ -87,12 +449,101 @@ class BasePiece(abc.ABC):
                 Example: all instructions inside a 'for' loop are included in the 'pieces' list
             Each piece have a list of sibling_pieces
                 Example: an 'if' piece can have 'else' piece or 'elif' piece in the same level (siblings)
-            generate_code is the main function that will generate the script recursively
+            generate_code is the main function that will generate the script (see iter_lines)
                 generate_code will call generate_atomic_script of each piece
+
+        Each piece cache its generated code (fragment) by indent and mode.
+        Adding pieces (line, function, else_, ...), modifying the lists of a
+        piece (pieces, parameters, decorators, ...) or assigning its attributes
+        (name, ...) invalidate the cache of the piece and its parents.
+        invalidate must be called after modifying other objects used by a
+        piece (ex: a Parameter of parameters).
+        """
+        self._pieces = _NO_PIECES
+        self._sibling_pieces = _NO_PIECES
+        # Piece (or list of pieces) containing this piece
+        # (in their pieces or sibling_pieces)
+        self._parents = None
+        # (indent, stub) => generated code
+        self._fragments = None
+
+    @property
+    def pieces(self) -> list:
+        """Child pieces (the list is created on first access)
+
+        Modifying the list invalidates the cache of the piece
         """
-        self.pieces = []
-        self.sibling_pieces = []
-        self.tab = "    "
+        pieces = self._pieces
+        if type(pieces) is _PieceList:
+            return pieces
+        return self._piece_list("_pieces")
+
+    @pieces.setter
+    def pieces(self, pieces: list):
+        pieces = self._pieces = _PieceList._of(self, pieces)
+        pieces._modified(pieces)
+
+    @property
+    def sibling_pieces(self) -> list:
+        """Sibling pieces (the list is created on first access)
+
+        Modifying the list invalidates the cache of the piece
+        """
+        sibling_pieces = self._sibling_pieces
+        if type(sibling_pieces) is _PieceList:
+            return sibling_pieces
+        return self._piece_list("_sibling_pieces")
+
+    @sibling_pieces.setter
+    def sibling_pieces(self, sibling_pieces: list):
+        sibling_pieces = self._sibling_pieces = _PieceList._of(self, sibling_pieces)
+        sibling_pieces._modified(sibling_pieces)
+
+    def _piece_list(self, name: str) -> "_PieceList":
+        """Return the slot name (_pieces or _sibling_pieces) as a _PieceList
+
+        The slot can be empty or a list set internally (ex: by loads), it is
+        replaced once under the lock of the piece
+        """
+        with _piece_lock(self):
+            pieces = getattr(self, name)
+            if type(pieces) is not _PieceList:
+                pieces = _PieceList._of(self, pieces)
+                setattr(self, name, pieces)
+        return pieces
+
+    def __getstate__(self):
+        # Parents are not pickled (picking a piece would pickle all the tree)
+        state = dict(getattr(self, "__dict__", ()))
+        for name in _slot_names(type(self)):
+            if name not in ("_parents", "_fragments") and hasattr(self, name):
+                state[name] = getattr(self, name)
+        return state
+
+    def __setstate__(self, state):
+        self._parents = None
+        self._fragments = None
+        for name, value in state.items():
+            if type(value) is _PieceList:
+                # The lists of the child pieces belong to their piece
+                value = list(value)
+            setattr(self, name, value)
+        for piece in (*self._pieces, *self._sibling_pieces):
+            if isinstance(piece, BasePiece):
+                piece._add_parent(self)
+
+    def __reduce__(self):
+        # Pickled with the compact format (faster, no recursion on deep trees)
+        from .serialization import dumps, loads
+
+        return loads, (dumps(self),)
+
+    def __copy__(self):
+        # Shallow copy (pickle and deepcopy use __reduce__)
+        cls = type(self)
+        piece = cls.__new__(cls)
+        piece.__setstate__(self.__getstate__())
+        return piece
 
     def __str__(self):
         return f"<{self.__class__.__name__}>"
@@ -106,114 +557,377 @@ class BasePiece(abc.ABC):
         This function should be reimplemented in all subclasses"""
         return ""
 
+    def generate_atomic_script_pep8(
+        self, prefix: str, suffix: str = ""
+    ) -> Union[str, List[str]]:
+        """generate_atomic_script used by the native formatter
+
+        prefix is the indentation of the piece and suffix is added at the end
+        of the last line (ex: ":"), subclasses can reimplement this function to
+        wrap lines longer than LINE_LENGTH"""
+        return self.generate_atomic_script()
+
     def generate_code(
-        self, format_with_black=True, *, _indent=0, _aslist=False, stub=False
+        self,
+        format_with_black=True,
+        *,
+        _indent=0,
+        _aslist=False,
+        stub=False,
+        formatter=None,
     ):
-        """Recursive function to generate the script(str) from the picies and siblings_pieces"""
-        # use list instead of str to optimize, 'str +=' have O(n) complexity
-        script_as_list = []
-
-        for sibling_piece in [self] + self.sibling_pieces:
-            _atomic_script = sibling_piece.generate_atomic_script()
-            # If atomic script is empty string do nothing
-            if _atomic_script:
-                # Normalize script if it's str or list[str]
-                if isinstance(_atomic_script, str):
-                    _atomic_script = [_atomic_script]
-                elif not isinstance(_atomic_script, list):
-                    raise ValueError(
-                        f"return of generate_atomic_script must be str or List[str]"
-                        f"not {type(_atomic_script)}"
-                    )
-
-                _atomic_script = self.tab * _indent + ("\n" + self.tab * _indent).join(
-                    _atomic_script
-                )
-                # all blocks ends with ":"
-                if isinstance(sibling_piece, BaseIndentPiece):
-                    _atomic_script += ":"
-
-                script_as_list.append(_atomic_script)
-
-                # add pass if no blocks inside
-                if (
-                    isinstance(sibling_piece, BaseIndentPiece)
-                    and not sibling_piece.pieces
-                ):
-                    # Fixme: if we have only comments also add blocks!
-                    if stub:
-                        pass_or_elips = "..."
-                    else:
-                        pass_or_elips = "pass"
-                    script_as_list.append(self.tab * (_indent + 1) + pass_or_elips)
-
-            # Recursively generate sub blocks
-            if sibling_piece.pieces:
-                _new_indent = _indent
-                if isinstance(sibling_piece, BaseIndentPiece):
-                    _new_indent += 1
-                for block in sibling_piece.pieces:
-                    if isinstance(block, str):
-                        script_as_list.append((_new_indent * self.tab) + block)
-                        continue
-                    elif not isinstance(block, BasePiece):
-                        raise ValueError(f"Type {type(block)!r} unhandled")
-
-                    script_as_list.extend(
-                        block.generate_code(
-                            _indent=_new_indent,
-                            format_with_black=False,
-                            _aslist=True,
-                            stub=stub,
-                        )
-                    )
-        # Return
-        if _aslist:
-            return script_as_list
+        """Generate the script(str) from the pieces and siblings_pieces
 
-        script = "\n".join(script_as_list)
-        if format_with_black:
-            try:
-                script = format_string_with_black(script, stub=stub)
-            except Exception as e:
-                import coloring
+        formatter can be "black" (default if format_with_black is True)
+        or "native": codeg formats the code itself (PEP8 blank lines between
+        definitions and long signatures wrapped), without calling black
+        """
+        formatter = _normalize_formatter(formatter, format_with_black)
+        native = formatter == "native"
+        if _aslist:
+            return list(self.iter_lines(stub=stub, _indent=_indent, _native=native))
 
-                coloring.print_red(script)
-                coloring.print_red("========== ERORR ===========")
-                raise e
+        if metrics.enabled:
+            start = time.perf_counter()
+            script = self._render(_indent, stub, native)
+            metrics.record("render", time.perf_counter() - start, script, self)
+        else:
+            script = self._render(_indent, stub, native)
+        if formatter == "black":
+            script = _format_code(script, stub=stub)
+        elif native and script:
+            script += "\n"
 
         return script
 
-    def generate_stubcode(self) -> str:
-        """Generate the stubfile code (file containing class names, annotations, function signature, ...)"""
-        stubcodde = script()
-        for piece in self.pieces:
-            if isinstance(piece, (ImportPiece, AnnotationPiece)):
-                stubcodde.pieces.append(piece)
-
-            elif isinstance(piece, ClassBlock):
-                stubcls = stubcodde.cls(piece.name, piece.bases)
-                for cls_piece in piece.pieces:
-                    if isinstance(cls_piece, AnnotationPiece):
-                        stubcls.pieces.append(cls_piece)
-
-                    if isinstance(cls_piece, FunctionBlock):
-                        stubcls.function(
-                            cls_piece.name,
-                            parameters=cls_piece.parameters,
-                            add_self=cls_piece.add_self,
-                            replace_defaults_with_none=cls_piece.replace_defaults_with_none,
-                        )
-
-        return stubcodde.generate_code(stub=True)
-
-    def build(self, globals=None, locals=None, filename=None) -> Any:
+    def iter_lines(self, *, stub=False, _indent=0, _native=False) -> Iterator[str]:
+        """Generate the script line by line (without black formatting)
+
+        The tree is walked with an explicit stack of iterators (one per nesting
+        level) instead of recursion, so deeply nested pieces do not hit the
+        recursion limit and lines are produced without copying child scripts.
+        """
+        tab = self.tab
+        stack = [_iter_level(self, _indent, stub, _native)]
+        while stack:
+            item = next(stack[-1], None)
+            if item is None:
+                stack.pop()
+                continue
+
+            piece, indent, is_header = item
+            if not is_header:
+                if piece is None:
+                    # Blank line
+                    yield ""
+                elif isinstance(piece, str):
+                    yield tab * indent + piece
+                elif isinstance(piece, BasePiece):
+                    stack.append(_iter_level(piece, indent, stub, _native))
+                else:
+                    raise ValueError(f"Type {type(piece)!r} unhandled")
+                continue
+
+            yield from _header_lines(piece, indent, stub, _native)
+
+    def _render(self, indent: int, stub: bool, native: bool = False) -> str:
+        """Generate the script using and filling the fragments cache
+
+        Same output as iter_lines, but the code of each piece is cached so that
+        after a modification only the modified pieces (and their parents) are
+        generated again. Use an explicit stack (no recursion).
+
+        Only pieces with a height (nesting levels below them) lower or equal to
+        max_cached_height (or with several parents) are cached, since the
+        fragment of a piece include the code of all its child pieces, caching
+        every level of deep trees would use memory proportional to the size of
+        the code times its depth. The other pieces get an empty cache, so that
+        invalidate goes through them up to the cached shared pieces.
+        """
+        key = (indent, stub, native)
+        if self._fragments is not None and key in self._fragments:
+            return self._fragments[key][1]
+
+        max_cached_height = self.max_cached_height
+        # frames: [piece, key, generated parts, iterator of the level, height]
+        stack = [[self, key, [], _iter_level(self, indent, stub, native), 0]]
+        while True:
+            frame = stack[-1]
+            item = next(frame[3], None)
+            if item is None:
+                piece, key, parts, _, height = stack.pop()
+                # Shared pieces (see intern_tree) are cached whatever their
+                # height: their code is used by each parent
+                if height <= max_cached_height or isinstance(piece._parents, list):
+                    fragment = "\n".join(parts)
+                    if piece._fragments is None:
+                        piece._fragments = {}
+                    piece._fragments[key] = (height, fragment)
+                    # Siblings (else, except, ...) are generated with the piece,
+                    # mark them so that invalidate goes through them
+                    for sibling_piece in piece._sibling_pieces:
+                        if sibling_piece._fragments is None:
+                            sibling_piece._fragments = {}
+                    parts = [fragment] if fragment else []
+                elif piece._fragments is None:
+                    piece._fragments = {}
+                if not stack:
+                    return "\n".join(parts)
+                parent_frame = stack[-1]
+                parent_frame[2].extend(parts)
+                parent_frame[4] = max(parent_frame[4], height + 1)
+                continue
+
+            piece, indent, is_header = item
+            if is_header:
+                frame[2].extend(_header_lines(piece, indent, stub, native))
+            elif piece is None:
+                # Blank line
+                frame[2].append("")
+            elif isinstance(piece, str):
+                frame[2].append(self.tab * indent + piece)
+                frame[4] = max(frame[4], 1)
+            elif isinstance(piece, BasePiece):
+                key = (indent, stub, native)
+                if piece._fragments is not None and key in piece._fragments:
+                    height, fragment = piece._fragments[key]
+                    if fragment:
+                        frame[2].append(fragment)
+                    frame[4] = max(frame[4], height + 1)
+                else:
+                    level = _iter_level(piece, indent, stub, native)
+                    stack.append([piece, key, [], level, 0])
+            else:
+                raise ValueError(f"Type {type(piece)!r} unhandled")
+
+    def invalidate(self):
+        """Clear the generated code cache of this piece and all its parents
+
+        Called when the piece is modified (ex: piece.pieces.append(...),
+        piece.name = ...), must be called after modifying an object used by
+        the piece (ex: a Parameter of piece.parameters)
+        """
+        if self._fragments is None:
+            # Fast path (ex: attributes set by __init__), see below
+            return
+        stack = [self]
+        while stack:
+            piece = stack.pop()
+            if piece._fragments is None:
+                # Parents of a piece without cache can not have a cache
+                # (rendered pieces always have a cache, maybe empty, see _render)
+                continue
+            piece._fragments = None
+            if isinstance(piece._parents, list):
+                stack.extend(piece._parents)
+            elif piece._parents is not None:
+                stack.append(piece._parents)
+
+    def _add_parent(self, parent: "BasePiece"):
+        # Pieces have one parent most of the time, a list is created for more
+        with _piece_lock(self):
+            if self._parents is None:
+                self._parents = parent
+            elif isinstance(self._parents, list):
+                if parent not in self._parents:
+                    self._parents.append(parent)
+            elif self._parents is not parent:
+                self._parents = [self._parents, parent]
+
+    def _add_piece(self, piece):
+        """Add a child piece (or str line) and invalidate the cache"""
+        pieces = self._pieces
+        if type(pieces) is not _PieceList:
+            pieces = self._piece_list("_pieces")
+        # list.append: the piece is linked below
+        list.append(pieces, piece)
+        if isinstance(piece, BasePiece):
+            self._adopt(piece)
+        else:
+            self.invalidate()
+
+    def _add_sibling_piece(self, piece: "BasePiece"):
+        list.append(self._piece_list("_sibling_pieces"), piece)
+        self._adopt(piece)
+
+    def _adopt(self, piece: "BasePiece"):
+        """Link a piece added to pieces or sibling_pieces and invalidate the cache
+
+        Must be called without holding the lock of self: a thread never holds
+        the locks of two pieces, so they can not deadlock
+        """
+        piece._add_parent(self)
+        self.invalidate()
+
+    def write_code(self, fp, format_with_black=False, *, stub=False, formatter=None):
+        """Write the script in a file object (file, io.StringIO, ...)
+
+        Without black, lines are streamed to fp as they are generated, so
+        the whole script is never held in memory.
+        Formatting with black needs the whole script, it is generated first.
+        """
+        formatter = _normalize_formatter(formatter, format_with_black)
+        if formatter == "black":
+            fp.write(self.generate_code(stub=stub))
+        else:
+            lines = self.iter_lines(stub=stub, _native=formatter == "native")
+            fp.writelines(line + "\n" for line in lines)
+
+    def generate_stubcode(self, formatter="black") -> str:
+        """Generate the stubfile code (file containing class names, annotations, function signature, ...)
+
+        formatter can be "black" or "native" (see generate_code)
+        """
+        return self.stub_script().generate_code(stub=True, formatter=formatter)
+
+    def write_stubcode(self, fp, formatter="native"):
+        """Write the stubfile code in a file object, see generate_stubcode
+
+        With the native formatter, lines are streamed to fp as they are generated
+        """
+        self.stub_script().write_code(fp, stub=True, formatter=formatter)
+
+    def stub_script(self) -> "BasePiece":
+        """Return a script with the declarations of the stubfile: imports,
+        annotations, classes (nested classes included) and function signatures
+
+        Imports and annotations are shared with the tree, the script must not
+        be modified. A definition (function, class, template instance,
+        dispatcher, ... see is_definition) is declared itself, other pieces
+        declare their child pieces.
+        """
+        stub = script()
+        stub._pieces = _stub_pieces([self] if self.is_definition else self._pieces)
+        return stub
+
+    def _stub_declarations(self) -> list:
+        """Pieces declaring this definition piece (see is_definition) in stubs
+
+        By default, the declarations of the child pieces
+        """
+        return _stub_pieces(self._pieces)
+
+    def to_ast(self) -> "ast.Module":
+        """Convert the script to a python AST (ast.Module)
+
+        Line numbers match the code generated without black.
+        Each line (see line method) must be a complete statement.
+        """
+        from .lowering import to_ast
+
+        return to_ast(self)
+
+    def build(
+        self,
+        globals=None,
+        locals=None,
+        filename=None,
+        *,
+        from_ast=False,
+        formatter=None,
+    ) -> Any:
         """Compile the current script and return the objects in a dict
         Subclass can return specific objects (not always dict)
         Example: FunctionPiece return a function and not a dict
+
+        With from_ast, the pieces are converted to an AST and compiled directly:
+        the code is not formatted with black and not parsed as a whole
+        (the unformatted code is registered in linecache for tracebacks).
+        The statements of each piece are cached, so a tree modified between
+        builds only lowers its modified pieces again
+        With formatter="native", the code is formatted by codeg (see generate_code)
         """
-        source = self.generate_code()
-        return build(source, globals=globals, locals=locals, filename=filename)
+        formatter = _normalize_formatter(formatter)
+        if metrics.enabled:
+            with metrics.building(self):
+                return self._build(globals, locals, filename, from_ast, formatter)
+        return self._build(globals, locals, filename, from_ast, formatter)
+
+    def submit_build(
+        self, globals=None, locals=None, filename=None, *, formatter=None, **kwargs
+    ) -> "concurrent.futures.Future":
+        """Build in a background thread and return the future of build()
+        (see codeg.submit_build for the executors and coalescing)"""
+        from .background import submit_build
+
+        return submit_build(
+            self, globals, locals, filename, formatter=formatter, **kwargs
+        )
+
+    async def build_async(
+        self, globals=None, locals=None, filename=None, *, formatter=None, **kwargs
+    ) -> Any:
+        """Same as build, without blocking the event loop (see submit_build)"""
+        from .background import build_async
+
+        return await build_async(
+            self, globals, locals, filename, formatter=formatter, **kwargs
+        )
+
+    async def generate_code_async(self, *, stub=False, formatter=None, **kwargs) -> str:
+        """Same as generate_code, without blocking the event loop"""
+        from .background import generate_code_async
+
+        return await generate_code_async(self, stub=stub, formatter=formatter, **kwargs)
+
+    def _build(self, globals, locals, filename, from_ast, formatter) -> Any:
+        if from_ast:
+            return self._build_from_ast(globals, locals, filename)
+
+        if disk_cache is None or formatter == "native":
+            source = self.generate_code(formatter=formatter)
+            return build(source, globals=globals, locals=locals, filename=filename)
+
+        # With a disk cache, the unformatted code is used as key
+        # so that a cache hit skip both black formatting and compilation
+        unformatted = self.generate_code(format_with_black=False)
+        key = disk_cache.key("black", unformatted)
+        entry = disk_cache.get(key)
+        if entry is None:
+            source = _format_code(unformatted)
+            code = _compile_source(source, filename, disk_key=key)
+        else:
+            source, code = entry
+            code = _relabel_code(code, filename)
+            code_cache.set(code_cache.key(source, filename), code)
+            _register_source(code, source, filename)
+        return _exec_code(code, globals, locals)
+
+    def _build_from_ast(self, globals=None, locals=None, filename=None) -> Any:
+        # Cheap when the fragments are cached, used as key and for linecache
+        start = time.perf_counter() if metrics.enabled else None
+        source = self._render(0, False)
+        if start is not None:
+            metrics.record("render", time.perf_counter() - start, source, self)
+        key = code_cache.key(source, filename, "ast")
+        code = code_cache.get(key)
+        if code is None:
+            entry = None
+            if disk_cache is not None:
+                disk_key = disk_cache.key("ast", source)
+                entry = disk_cache.get(disk_key)
+
+            if entry is not None:
+                code = _relabel_code(entry[1], filename)
+            else:
+                filename = filename or linecache_registry.new_filename()
+                start = time.perf_counter() if metrics.enabled else None
+                from .lowering import to_ast
+
+                # The lowered statements of the pieces are cached (see lowering)
+                tree = to_ast(self, cache=True)
+                if start is not None:
+                    metrics.record("lower", time.perf_counter() - start, source)
+                    start = time.perf_counter()
+                code = compile(tree, filename, "exec", dont_inherit=True)
+                if start is not None:
+                    metrics.record("compile", time.perf_counter() - start, source)
+                if disk_cache is not None:
+                    disk_cache.set(disk_key, source, code)
+            code_cache.set(key, code)
+
+        _register_source(code, source, filename)
+        return _exec_code(code, globals, locals)
 
     def bound_to_class(self, cls, attribute_name=None):
         if attribute_name is None:
@@ -244,37 +958,44 @@ class BasePiece(abc.ABC):
 
     def if_(self, test):
         piece = if_(test)
-        self.pieces.append(piece)
+        self._add_piece(piece)
         return piece
 
     def while_(self, test):
         piece = while_(test)
-        self.pieces.append(piece)
+        self._add_piece(piece)
         return piece
 
     def for_(self, target, iter):
         piece = for_(target, iter)
-        self.pieces.append(piece)
+        self._add_piece(piece)
         return piece
 
     def try_(self):
         piece = try_()
-        self.pieces.append(piece)
+        self._add_piece(piece)
+        return piece
+
+    def add(self, piece: "BasePiece"):
+        """Add an existing piece (ex: TemplateInstance) and return it"""
+        if not isinstance(piece, BasePiece):
+            raise TypeError("piece must be a BasePiece, use line to add an str")
+        self._add_piece(piece)
         return piece
 
     def line(self, line: str):
         if not isinstance(line, str):
             raise TypeError("line must be an str")
-        self.pieces.append(line)
+        self._add_piece(line)
         return self
 
     def annotation(self, var, annotation):
-        self.pieces.append(AnnotationPiece(var, annotation))
+        self._add_piece(AnnotationPiece(var, annotation))
         return self
 
     def import_(self, *modules, frm=None):
         piece = import_(*modules, frm=frm)
-        self.pieces.append(piece)
+        self._add_piece(piece)
         return self
 
     def return_(self, value):
@@ -283,12 +1004,12 @@ class BasePiece(abc.ABC):
     ret = return_
 
     def comment(self, comment: str, title=None):
-        self.pieces.append(CommentPiece(comment, title=title))
+        self._add_piece(CommentPiece(comment, title=title))
         return self
 
     def class_(self, name, bases=None):
         block = ClassBlock(name, bases=bases)
-        self.pieces.append(block)
+        self._add_piece(block)
         return block
 
     cls = class_
@@ -302,7 +1023,7 @@ class BasePiece(abc.ABC):
             add_self=add_self,
             replace_defaults_with_none=replace_defaults_with_none,
         )
-        self.pieces.append(block)
+        self._add_piece(block)
         return block
 
     def method(self, name, parameters=None, *, replace_defaults_with_none=None):
@@ -315,21 +1036,190 @@ class BasePiece(abc.ABC):
 
     def block(self, name):
         block = GenericBlock(name)
-        self.pieces.append(block)
+        self._add_piece(block)
         return block
 
     def condition(self, condition):
         block = If(condition)
-        self.pieces.append(block)
+        self._add_piece(block)
         return block
 
 
+def _iter_level(piece: BasePiece, indent: int, stub=False, native=False):
+    """Iterate over one level of the tree: the piece and its siblings (headers)
+    each followed by its child pieces, as (piece, indent, is_header) tuples
+
+    With the native formatter, blank lines are yielded as None pieces
+    """
+    for sibling_piece in (piece, *piece._sibling_pieces):
+        yield sibling_piece, indent, True
+        new_indent = indent
+        if isinstance(sibling_piece, BaseIndentPiece):
+            new_indent += 1
+        if native:
+            blocks = _with_blank_lines(sibling_piece._pieces, new_indent, stub)
+        else:
+            blocks = sibling_piece._pieces
+        for block in blocks:
+            yield block, new_indent, False
+
+
+def _stub_pieces(pieces: list) -> list:
+    """Declarations of pieces (see stub_script), shared pieces are not adopted"""
+    stubs = []
+    for piece in pieces:
+        if isinstance(piece, (ImportPiece, AnnotationPiece)):
+            stubs.append(piece)
+        elif _is_definition(piece):
+            stubs.extend(piece._stub_declarations())
+    return stubs
+
+
+def _is_definition(piece) -> bool:
+    return isinstance(piece, BasePiece) and piece.is_definition
+
+
+def _with_blank_lines(pieces: list, indent: int, stub: bool):
+    """Insert blank lines (None) around definitions and after imports like black
+
+    Top level definitions are surrounded by 2 blank lines and nested ones by 1
+    (comments just before a definition are attached to it).
+    In stubs, only top level definitions are separated by 1 blank line,
+    except consecutive functions and empty classes, nested classes are
+    separated like black does (see _nested_stub_blank_lines)
+    """
+    if stub:
+        blank_lines = 1 if indent == 0 else 0
+    else:
+        blank_lines = 2 if indent == 0 else 1
+
+    previous = None
+    # True when the previous pieces are comments attached to the current definition
+    attached = False
+    # End of the current run of comments and whether a definition follows it,
+    # each run is looked ahead once so the pieces are walked in linear time
+    comments_end = 0
+    comments_attached = False
+    for i, piece in enumerate(pieces):
+        is_comment = isinstance(piece, CommentPiece)
+        if is_comment and i >= comments_end:
+            comments_end = i + 1
+            while comments_end < len(pieces) and isinstance(
+                pieces[comments_end], CommentPiece
+            ):
+                comments_end += 1
+            comments_attached = comments_end < len(pieces) and _is_definition(
+                pieces[comments_end]
+            )
+
+        count = 0
+        if previous is not None and stub and indent:
+            count = _nested_stub_blank_lines(previous, piece)
+        elif previous is not None and not attached:
+            starts_definition = _is_definition(piece) or (
+                is_comment and comments_attached
+            )
+            if starts_definition or _is_definition(previous):
+                if not stub or not _stub_grouped(previous, piece):
+                    count = blank_lines
+            # One blank line after imports
+            if isinstance(previous, ImportPiece) and not isinstance(piece, ImportPiece):
+                count = max(count, 1)
+        yield from [None] * count
+
+        attached = is_comment and comments_attached
+        previous = piece
+        yield piece
+
+
+def _nested_stub_blank_lines(previous, piece) -> int:
+    """Blank lines between two pieces of a class in stubs: 1 around classes,
+    except between empty classes and after an empty class (unless a function)"""
+    if isinstance(piece, ClassBlock):
+        return 0 if _stub_grouped(previous, piece) else 1
+    if isinstance(previous, ClassBlock):
+        return 1 if previous._pieces or isinstance(piece, FunctionBlock) else 0
+    return 0
+
+
+def _stub_grouped(previous, piece) -> bool:
+    """In stubs, consecutive functions and empty classes are not separated"""
+    if isinstance(previous, FunctionBlock) and isinstance(piece, FunctionBlock):
+        return True
+    return (
+        isinstance(previous, ClassBlock)
+        and isinstance(piece, ClassBlock)
+        and not previous._pieces
+        and not piece._pieces
+    )
+
+
+def _atomic_lines(
+    piece: BasePiece, pep8_prefix: str = None, pep8_suffix: str = ""
+) -> List[str]:
+    """Return generate_atomic_script of the piece as a (new) list of lines
+
+    If pep8_prefix (indentation) is given, generate_atomic_script_pep8 is used
+    """
+    if pep8_prefix is None:
+        _atomic_script = piece.generate_atomic_script()
+    else:
+        _atomic_script = piece.generate_atomic_script_pep8(pep8_prefix, pep8_suffix)
+    # If atomic script is empty string do nothing
+    if not _atomic_script:
+        return []
+    # Normalize script if it's str or list[str]
+    if isinstance(_atomic_script, str):
+        return [_atomic_script]
+    elif not isinstance(_atomic_script, list):
+        raise ValueError(
+            f"return of generate_atomic_script must be str or List[str]"
+            f"not {type(_atomic_script)}"
+        )
+    return list(_atomic_script)
+
+
+def _header_lines(
+    piece: BasePiece, indent: int, stub: bool, native: bool = False
+) -> List[str]:
+    """Generate the lines of a piece without its child pieces"""
+    prefix = piece.tab * indent
+    is_block = isinstance(piece, BaseIndentPiece)
+    # black put '...' in the same line in stubs
+    inline_ellipsis = native and stub and is_block and not piece._pieces
+    suffix = ""
+    if is_block:
+        suffix = ": ..." if inline_ellipsis else ":"
+
+    if native:
+        _atomic_script = _atomic_lines(piece, prefix, suffix)
+    else:
+        _atomic_script = _atomic_lines(piece)
+    if not _atomic_script:
+        return []
+
+    # No trailing whitespace on blank lines (multi lines pieces like templates)
+    lines = [prefix + e if e else e for e in _atomic_script]
+    if is_block:
+        # all blocks ends with ":"
+        lines[-1] += suffix
+        if inline_ellipsis:
+            return lines
+        # add pass if no blocks inside
+        if not piece._pieces:
+            # Fixme: if we have only comments also add blocks!
+            lines.append(prefix + piece.tab + ("..." if stub else "pass"))
+    return lines
+
+
 # FIXME: handle the case where only comment are in block (must also add pass)
 class BaseIndentPiece(BasePiece):
-    pass
+    __slots__ = ()
 
 
 class CommentPiece(BasePiece):
+    __slots__ = ("comments",)
+
     def __init__(self, comment, title=None):
         super().__init__()
         if not title:
@@ -344,6 +1234,9 @@ class CommentPiece(BasePiece):
 
 
 class DecoratorMixin:
+    # Subclasses define the "decorators" slot (mixins can not have slots)
+    __slots__ = ()
+
     def __init__(self):
         self.decorators = []
 
@@ -353,6 +1246,9 @@ class DecoratorMixin:
 
 
 class ClassBlock(BaseIndentPiece, DecoratorMixin):
+    __slots__ = ("decorators", "name", "bases")
+    is_definition = True
+
     def __init__(self, name, bases=None):
         BaseIndentPiece.__init__(self)
         DecoratorMixin.__init__(self)
@@ -365,6 +1261,11 @@ class ClassBlock(BaseIndentPiece, DecoratorMixin):
         self.name = name
         self.bases = bases
 
+    def _stub_declarations(self) -> list:
+        stub_cls = ClassBlock(self.name, self.bases)
+        stub_cls._pieces = _stub_pieces(self._pieces) or _NO_PIECES
+        return [stub_cls]
+
     def generate_atomic_script(self):
         ret_list = [f"@{e}" for e in self.decorators]
         if self.bases:
@@ -374,11 +1275,40 @@ class ClassBlock(BaseIndentPiece, DecoratorMixin):
         ret_list.append(f"class {self.name}{bases}")
         return ret_list
 
-    def build(self, globals=None, locals=None, filename=None) -> Type:
-        return super().build(globals, locals, filename)[self.name]
+    def generate_atomic_script_pep8(self, prefix: str, suffix: str = "") -> List[str]:
+        """Same as generate_atomic_script, with long bases wrapped"""
+        if not self.bases:
+            return self.generate_atomic_script()
+        ret_list = [f"@{e}" for e in self.decorators]
+        ret_list.extend(wrap_brackets(prefix, f"class {self.name}", self.bases, suffix))
+        # suffix is added by the caller
+        ret_list[-1] = ret_list[-1][: len(ret_list[-1]) - len(suffix)]
+        return ret_list
+
+    def build(
+        self,
+        globals=None,
+        locals=None,
+        filename=None,
+        *,
+        from_ast=False,
+        formatter=None,
+    ) -> Type:
+        return super().build(
+            globals, locals, filename, from_ast=from_ast, formatter=formatter
+        )[self.name]
 
 
 class FunctionBlock(BaseIndentPiece, DecoratorMixin):
+    __slots__ = (
+        "decorators",
+        "name",
+        "parameters",
+        "add_self",
+        "replace_defaults_with_none",
+    )
+    is_definition = True
+
     def __init__(
         self, name, parameters=None, add_self=None, replace_defaults_with_none=None
     ):
@@ -398,6 +1328,16 @@ class FunctionBlock(BaseIndentPiece, DecoratorMixin):
         self.add_self = add_self
         self.replace_defaults_with_none = replace_defaults_with_none
 
+    def _stub_declarations(self) -> list:
+        return [
+            FunctionBlock(
+                self.name,
+                parameters=self.parameters,
+                add_self=self.add_self,
+                replace_defaults_with_none=self.replace_defaults_with_none,
+            )
+        ]
+
     def generate_atomic_script(self):
         ret_list = [f"@{e}" for e in self.decorators]
         # f"({self.}):\n"
@@ -409,6 +1349,34 @@ class FunctionBlock(BaseIndentPiece, DecoratorMixin):
         ret_list.append(f"def {self.name}({signature})")
         return ret_list
 
+    def generate_atomic_script_pep8(self, prefix: str, suffix: str = "") -> List[str]:
+        """Same as generate_atomic_script, with long signatures wrapped"""
+        ret_list = [f"@{e}" for e in self.decorators]
+        parameters = generate_function_parameters(
+            self.parameters,
+            add_self=self.add_self,
+            replace_defaults_with_none=self.replace_defaults_with_none,
+        )
+        ret_list.extend(wrap_brackets(prefix, f"def {self.name}", parameters, suffix))
+        # suffix is added by the caller
+        ret_list[-1] = ret_list[-1][: len(ret_list[-1]) - len(suffix)]
+        return ret_list
+
+    def build_factory(
+        self, freevars=(), globals=None, *, formatter=None
+    ) -> "FunctionFactory":
+        """Compile the function once and return a factory of functions sharing
+        its code object (see FunctionFactory)
+
+        freevars are names used by the function that are closure variables,
+        their values are given to the factory. Default values are evaluated
+        once (with closure variables set to None), other defaults can be
+        given to the factory.
+        """
+        from .factory import build_factory
+
+        return build_factory(self, freevars, globals, formatter)
+
     def bound_to_instance(self, instance, attribute_name: str = None):
         if attribute_name is None:
             attribute_name = self.name
@@ -426,11 +1394,23 @@ class FunctionBlock(BaseIndentPiece, DecoratorMixin):
         locals = self.build(globals, locals=locals, filename=filename)
         setattr(cls, attribute_name, locals[self.name])
 
-    def build(self, globals=None, locals=None, filename=None) -> Callable:
-        return super().build(globals, locals, filename)[self.name]
+    def build(
+        self,
+        globals=None,
+        locals=None,
+        filename=None,
+        *,
+        from_ast=False,
+        formatter=None,
+    ) -> Callable:
+        return super().build(
+            globals, locals, filename, from_ast=from_ast, formatter=formatter
+        )[self.name]
 
 
 class ImportPiece(BasePiece):
+    __slots__ = ("frm", "libs")
+
     def __init__(self, *libs, frm=None):
         super().__init__()
         normalized_libs = []
@@ -460,6 +1440,8 @@ class ImportPiece(BasePiece):
 
 
 class AnnotationPiece(BasePiece):
+    __slots__ = ("variable", "annotation")
+
     def __init__(self, variable, annotation):
         super().__init__()
         self.variable = variable
@@ -470,6 +1452,8 @@ class AnnotationPiece(BasePiece):
 
 
 class GenericBlock(BaseIndentPiece):
+    __slots__ = ("text",)
+
     def __init__(self, text):
         BaseIndentPiece.__init__(self)
         self.text = text
@@ -479,20 +1463,29 @@ class GenericBlock(BaseIndentPiece):
 
 
 class ElseMixin:
+    # Subclasses define the "_else_called" slot
+    __slots__ = ()
+
     def __init__(self):
         self._else_called = False
 
     def else_(self):
-        if self._else_called:
-            raise CodegSyntaxError("Can not have more than one else in same block")
-
         piece = Else()
-        self.sibling_pieces.append(piece)
-        self._else_called = True
+        with _piece_lock(self):
+            self._check_else()
+            list.append(self._piece_list("_sibling_pieces"), piece)
+            self._else_called = True
+        self._adopt(piece)
         return piece
 
+    def _check_else(self):
+        if self._else_called:
+            raise CodegSyntaxError("Can not have more than one else in same block")
+
 
 class If(BaseIndentPiece, ElseMixin):
+    __slots__ = ("_else_called", "_condition")
+
     def __init__(self, condition):
         BaseIndentPiece.__init__(self)
         ElseMixin.__init__(self)
@@ -500,11 +1493,12 @@ class If(BaseIndentPiece, ElseMixin):
         self._condition = condition
 
     def elif_(self, test):
-        if self._else_called:
-            raise CodegSyntaxError("Can not have elif after else")
-
         piece = Elif(test)
-        self.sibling_pieces.append(piece)
+        with _piece_lock(self):
+            if self._else_called:
+                raise CodegSyntaxError("Can not have elif after else")
+            list.append(self._piece_list("_sibling_pieces"), piece)
+        self._adopt(piece)
         return piece
 
     def generate_atomic_script(self):
@@ -512,11 +1506,15 @@ class If(BaseIndentPiece, ElseMixin):
 
 
 class Else(BaseIndentPiece):
+    __slots__ = ()
+
     def generate_atomic_script(self):
         return f"else"
 
 
 class Elif(BaseIndentPiece):
+    __slots__ = ("test",)
+
     def __init__(self, test):
         super().__init__()
         self.test = test
@@ -526,6 +1524,8 @@ class Elif(BaseIndentPiece):
 
 
 class Try(BaseIndentPiece, ElseMixin):
+    __slots__ = ("_else_called", "_finally_called")
+
     def __init__(self):
         BaseIndentPiece.__init__(self)
         ElseMixin.__init__(self)
@@ -534,31 +1534,36 @@ class Try(BaseIndentPiece, ElseMixin):
     def generate_atomic_script(self):
         return f"try"
 
-    def else_(self):
+    def _check_else(self):
         if self._finally_called:
             raise CodegSyntaxError("else can not be called after finally")
-        return super().else_()
+        super()._check_else()
 
     def except_(self, type=None, name=None):
-        if self._else_called:
-            raise CodegSyntaxError("except can not be called after else")
-        if self._finally_called:
-            raise CodegSyntaxError("except_ can not be called after finally")
         piece = Except(type, name)
-        self.sibling_pieces.append(piece)
+        with _piece_lock(self):
+            if self._else_called:
+                raise CodegSyntaxError("except can not be called after else")
+            if self._finally_called:
+                raise CodegSyntaxError("except_ can not be called after finally")
+            list.append(self._piece_list("_sibling_pieces"), piece)
+        self._adopt(piece)
         return piece
 
     def finally_(self):
-        if self._finally_called:
-            raise CodegSyntaxError("finally can not be called twice")
         piece = Finally()
-        self.sibling_pieces.append(piece)
-
-        self._finally_called = True
+        with _piece_lock(self):
+            if self._finally_called:
+                raise CodegSyntaxError("finally can not be called twice")
+            list.append(self._piece_list("_sibling_pieces"), piece)
+            self._finally_called = True
+        self._adopt(piece)
         return piece
 
 
 class Except(BaseIndentPiece):
+    __slots__ = ("type", "name")
+
     def __init__(self, type=None, name=None):
         if name is not None and type is None:
             raise ValueError("When name is present, type must be provided")
@@ -577,6 +1582,8 @@ class Except(BaseIndentPiece):
 
 
 class Raise(BasePiece):
+    __slots__ = ("exception",)
+
     def __init__(self, exception):
         super().__init__()
         self.exception = exception
@@ -586,11 +1593,15 @@ class Raise(BasePiece):
 
 
 class Finally(BaseIndentPiece):
+    __slots__ = ()
+
     def generate_atomic_script(self):
         return f"finally"
 
 
 class While(BaseIndentPiece, ElseMixin):
+    __slots__ = ("_else_called", "test")
+
     def __init__(self, test: str):
         BaseIndentPiece.__init__(self)
         ElseMixin.__init__(self)
@@ -601,6 +1612,8 @@ class While(BaseIndentPiece, ElseMixin):
 
 
 class For(BaseIndentPiece, ElseMixin):
+    __slots__ = ("_else_called", "target", "iter")
+
     def __init__(self, target, iter):
         BaseIndentPiece.__init__(self)
         ElseMixin.__init__(self)
@@ -728,16 +1741,25 @@ def generate_function_signature(
     parameters: List[Parameter] = None, add_self=False, replace_defaults_with_none=False
 ) -> str:
     """Create the function signature based on the attributes (name, annotation, default)"""
+    return ", ".join(
+        generate_function_parameters(
+            parameters,
+            add_self=add_self,
+            replace_defaults_with_none=replace_defaults_with_none,
+        )
+    )
+
+
+def generate_function_parameters(
+    parameters: List[Parameter] = None, add_self=False, replace_defaults_with_none=False
+) -> List[str]:
+    """Same as generate_function_signature, but return the list of parameters"""
     parameters = normalize_parameters(parameters)
 
-    script = ""
+    attributes_params = []
     if add_self:
-        if parameters:
-            script += "self, "
-        else:
-            script += "self"
+        attributes_params.append("self")
 
-    attributes_params = []
     kw_only = False
     for a in parameters:
         if kw_only is False and a.kw_only:
@@ -760,9 +1782,26 @@ def generate_function_signature(
                 a_param += f"={a_default!r}"
 
         attributes_params.append(a_param)
-    script += ", ".join(attributes_params)
-    script += ""
-    return script
+    return attributes_params
+
+
+def wrap_brackets(
+    prefix: str, head: str, items: List[str], tail: str = ""
+) -> List[str]:
+    """Wrap 'head(items)tail' as black do when it is longer than LINE_LENGTH
+
+    prefix is the indentation, it is not included in the returned lines
+    ex: def f(  =>  [def f(, "    a, b", ")"] or [def f(, "    a,", "    b,", ")"]
+    """
+    joined = ", ".join(items)
+    line = f"{head}({joined}){tail}"
+    if not items or len(prefix) + len(line) <= LINE_LENGTH:
+        return [line]
+
+    tab = BasePiece.tab
+    if len(prefix) + len(tab) + len(joined) <= LINE_LENGTH:
+        return [f"{head}(", tab + joined, f"){tail}"]
+    return [f"{head}(", *[f"{tab}{item}," for item in items], f"){tail}"]
 
 
 # FIXME: there are mixing naming between generic block and indent block, block means indent block or piece of code?!
@@ -0,0 +1,212 @@
+"""Dispatchers: functions running the body of the case matching a key"""
+
+from typing import Any, Callable, List, Mapping, Union
+
+from .codeg import (
+    BasePiece,
+    FunctionBlock,
+    If,
+    Parameter,
+    generate_function_call,
+    normalize_parameters,
+)
+
+STRATEGIES = ("auto", "if", "match", "bisect", "table")
+# Number of cases up to which an if/elif chain is the fastest
+# (see benchmarks/bench_dispatch.py)
+IF_CHAIN_MAX = 8
+# Number of int cases up to which a bisect tree is faster than a table
+BISECT_MAX = 256
+# Number of cases compared by if/elif chains at the leaves of bisect trees
+BISECT_LEAF_SIZE = 4
+
+# Body of a case: a line, lines or a piece (added to the generated function)
+Body = Union[str, List[str], BasePiece]
+
+
+class Dispatch(BasePiece):
+    __slots__ = ("name", "parameters", "subject", "strategy")
+    is_definition = True
+
+    def __init__(
+        self,
+        name: str,
+        parameters,
+        subject: str,
+        cases: Mapping[Any, Body],
+        default: Body = None,
+        strategy: str = "auto",
+    ):
+        """Function returning the result of the body of the case matching subject
+
+        cases maps keys (literals: int, str, bytes, bool, None) to bodies, a
+        body is the body of a function of parameters (use return to return a
+        value). default is the body for other keys (the function returns None
+        by default). The generated code depends on strategy:
+
+        - "if": an if/elif chain, linear in the number of cases
+        - "match": a match statement (python 3.10), linear too
+        - "bisect": a balanced tree of comparisons, for int keys (subjects
+          that are not int go to default)
+        - "table": a dict of functions (one function by case), constant time
+        - "auto": "if" for IF_CHAIN_MAX cases or less, "bisect" for
+          BISECT_MAX int cases or less and "table" otherwise
+
+        The pieces are generated on creation, the dispatch can not be modified.
+        """
+        super().__init__()
+        if strategy not in STRATEGIES:
+            raise ValueError(f"strategy must be one of {STRATEGIES} not {strategy!r}")
+        cases = dict(cases)
+        for key in cases:
+            if type(key) not in (int, str, bytes, bool, type(None)):
+                raise TypeError(f"Keys must be literals, not {key!r}")
+        int_keys = all(type(key) is int for key in cases)
+        if strategy == "auto":
+            if len(cases) <= IF_CHAIN_MAX:
+                strategy = "if"
+            elif int_keys and len(cases) <= BISECT_MAX:
+                strategy = "bisect"
+            else:
+                strategy = "table"
+        if strategy == "bisect" and not int_keys:
+            raise TypeError("bisect strategy needs int keys")
+
+        self.name = name
+        self.parameters = normalize_parameters(parameters)
+        self.subject = subject
+        self.strategy = strategy
+        generate: Callable = getattr(self, f"_generate_{strategy}")
+        generate(cases, default)
+
+    def __str__(self):
+        return f"<{self.__class__.__name__} {self.name} {self.strategy}>"
+
+    def _stub_declarations(self) -> list:
+        # The helper functions and tables are not declared
+        return [FunctionBlock(self.name, self.parameters)]
+
+    def _function(self, name: str, bound=()) -> FunctionBlock:
+        """Add a function of the parameters, the names of bound (helper functions,
+        tables) are bound as default values of keyword only parameters, so the
+        dispatcher does not look up globals and also works in a class body"""
+        parameters = [
+            *self.parameters,
+            *[Parameter(e, default=_Name(e), kw_only=True) for e in bound],
+        ]
+        code_f = FunctionBlock(name, parameters)
+        self._add_piece(code_f)
+        return code_f
+
+    def _call(self, name: str) -> str:
+        return f"return {name}({generate_function_call(self.parameters)})"
+
+    def _generate_if(self, cases, default):
+        code_f = self._function(self.name)
+        code_if = self._if_chain(code_f, cases, list(cases))
+        if default is not None:
+            _add_body(code_if.else_() if code_if is not None else code_f, default)
+        elif code_if is None:
+            code_f.line("return None")
+
+    def _if_chain(self, piece: BasePiece, cases, keys) -> If:
+        """Add an if/elif chain testing keys to piece and return the if (or None)"""
+        code_if = None
+        for key in keys:
+            test = f"{self.subject} == {key!r}"
+            if code_if is None:
+                code_if = piece.if_(test)
+                _add_body(code_if, cases[key])
+            else:
+                _add_body(code_if.elif_(test), cases[key])
+        return code_if
+
+    def _generate_match(self, cases, default):
+        code_f = self._function(self.name)
+        code_match = code_f.block(f"match {self.subject}")
+        for key, body in cases.items():
+            _add_body(code_match.block(f"case {key!r}"), body)
+        if default is not None:
+            _add_body(code_match.block("case _"), default)
+        elif not cases:
+            code_match.block("case _").line("return None")
+
+    def _generate_bisect(self, cases, default):
+        default_name = f"_{self.name}_default"
+        _add_body(self._function(default_name), default)
+        code_f = self._function(self.name, [default_name])
+        # Other types can not be compared with the keys
+        code_f.if_(f"not isinstance({self.subject}, int)").line(
+            self._call(default_name)
+        )
+        keys = sorted(cases)
+        # (piece, keys of the piece) with an explicit stack (no recursion)
+        stack = [(code_f, keys)]
+        while stack:
+            piece, keys = stack.pop()
+            if len(keys) <= BISECT_LEAF_SIZE:
+                code_if = self._if_chain(piece, cases, keys)
+                leaf = code_if.else_() if code_if is not None else piece
+                leaf.line(self._call(default_name))
+                continue
+            middle = len(keys) // 2
+            code_if = piece.if_(f"{self.subject} < {keys[middle]!r}")
+            stack.append((code_if, keys[:middle]))
+            stack.append((code_if.else_(), keys[middle:]))
+
+    def _generate_table(self, cases, default):
+        table = []
+        for i, (key, body) in enumerate(cases.items()):
+            case_name = f"_{self.name}_case_{i}"
+            _add_body(self._function(case_name), body)
+            table.append(f"{key!r}: {case_name}")
+        default_name = f"_{self.name}_default"
+        _add_body(self._function(default_name), default)
+
+        table_name = f"_{self.name}_table"
+        # One entry by line (as black formats long dicts), in a single piece:
+        # each str piece must be a complete statement (see lowering.to_ast)
+        entries = "".join(f"{self.tab}{entry},\n" for entry in table)
+        self.line(f"{table_name} = {{\n{entries}}}")
+        code_f = self._function(self.name, [table_name, default_name])
+        code_f.line(self._call(f"{table_name}.get({self.subject}, {default_name})"))
+
+    def build(self, globals=None, locals=None, filename=None, **kwargs) -> Callable:
+        """Return the built dispatcher function"""
+        return super().build(globals, locals, filename, **kwargs)[self.name]
+
+
+class _Name:
+    """Default value written as a name in the signature"""
+
+    __slots__ = ("name",)
+
+    def __init__(self, name: str):
+        self.name = name
+
+    def __repr__(self):
+        return self.name
+
+
+def _add_body(piece: BasePiece, body: Body):
+    if body is None:
+        piece.line("return None")
+    elif isinstance(body, str):
+        piece.line(body)
+    elif isinstance(body, BasePiece):
+        piece.add(body)
+    else:
+        for line in body:
+            piece.line(line)
+
+
+def dispatch(
+    name: str,
+    parameters,
+    subject: str,
+    cases: Mapping[Any, Body],
+    default: Body = None,
+    strategy: str = "auto",
+) -> Dispatch:
+    """See Dispatch"""
+    return Dispatch(name, parameters, subject, cases, default, strategy)
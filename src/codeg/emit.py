@@ -0,0 +1,114 @@
+"""Write generated trees as an importable package (ahead of time generation)"""
+
+import importlib.util
+import os
+import py_compile
+import tempfile
+from typing import List, Mapping
+
+from .codeg import BasePiece
+from .parallel import generate_many, generate_stubs
+
+
+def write_package(
+    directory,
+    modules: Mapping[str, BasePiece],
+    *,
+    stubs: bool = False,
+    precompile: bool = True,
+    formatter=None,
+    invalidation_mode=py_compile.PycInvalidationMode.CHECKED_HASH,
+    workers: int = 1,
+) -> List[str]:
+    """Write the trees in directory as a package and return the written files
+
+    modules maps module names relative to the package ("models.user", use
+    "__init__" for the package itself) to trees. The packages of the modules
+    get an empty __init__.py if they have no tree. A module which also has
+    submodules ("models" and "models.user") is written as a package
+    (models/__init__.py).
+    Files are only written when their content changed, so that a deploy
+    rewrites (and recompiles) only what changed.
+    With stubs, a .pyi file is written next to each module (generate_stubcode).
+    With workers > 1, black formatting is spread over a pool of processes
+    (see generate_many and generate_stubs).
+    With precompile, modules are compiled in __pycache__: by default the pyc
+    are checked against the hash of the source (not its mtime), so that
+    copying the package does not invalidate them.
+    """
+    directory = os.fspath(directory)
+    packages = set()
+    for name in modules:
+        parts = name.split(".")
+        for i in range(1, len(parts)):
+            packages.add(tuple(parts[:i]))
+
+    files = {}
+    paths = []
+    for name in modules:
+        parts = name.split(".")
+        if parts[-1] == "__init__":
+            parts.pop()
+            path = os.path.join(directory, *parts, "__init__")
+        elif tuple(parts) in packages:
+            # Python imports the package, a module file would be ignored
+            path = os.path.join(directory, *parts, "__init__")
+        else:
+            path = os.path.join(directory, *parts)
+        if path in paths:
+            raise ValueError(f"Module {name!r} is given twice")
+        paths.append(path)
+
+        # Packages of the module
+        for i in range(len(parts)):
+            init = os.path.join(directory, *parts[:i], "__init__.py")
+            files.setdefault(init, "")
+
+    trees = list(modules.values())
+    for path, code in zip(paths, generate_many(trees, workers, formatter=formatter)):
+        files[path + ".py"] = code
+    if stubs:
+        stub_formatter = formatter or "black"
+        for path, code in zip(
+            paths, generate_stubs(trees, workers, formatter=stub_formatter)
+        ):
+            files[path + ".pyi"] = code
+
+    written = []
+    for path, content in files.items():
+        if _write_if_changed(path, content):
+            written.append(path)
+        if precompile and path.endswith(".py"):
+            pyc = importlib.util.cache_from_source(path)
+            if path in written or not os.path.exists(pyc):
+                py_compile.compile(
+                    path, cfile=pyc, doraise=True, invalidation_mode=invalidation_mode
+                )
+    return written
+
+
+def _write_if_changed(path: str, content: str) -> bool:
+    """Write content in path (atomically) if it is different from the file"""
+    data = content.encode("utf-8")
+    try:
+        with open(path, "rb") as f:
+            if f.read() == data:
+                return False
+    except OSError:
+        pass
+
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        # mkstemp creates files readable only by the owner
+        os.chmod(tmp_path, 0o644)
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.unlink(tmp_path)
+        except OSError:
+            pass
+        raise
+    return True
@@ -0,0 +1,107 @@
+"""Functions objects created from one compiled code object"""
+
+import types
+from typing import Any, Callable, Dict, Iterable
+
+from .codeg import FunctionBlock, _format_code, _normalize_formatter, compile_source
+
+# Name of the function returning the built function (with closure variables)
+_WRAPPER_NAME = "__codeg_factory__"
+
+
+class FunctionFactory:
+    def __init__(self, prototype: types.FunctionType, freevars: Iterable[str] = ()):
+        """Create functions sharing the code object of prototype
+
+        Functions only differ by their globals, defaults, closure variables
+        (freevars), name and qualname. Creating a function does not compile
+        anything: it costs about the same as a def statement.
+        """
+        self.prototype = prototype
+        self.code = prototype.__code__
+        # Declared closure variables (the code only has the ones it uses)
+        self.freevars = tuple(freevars)
+
+    def __repr__(self):
+        return f"<{self.__class__.__name__} {self.code.co_name}>"
+
+    def __call__(
+        self,
+        *,
+        globals: Dict[str, Any] = None,
+        defaults: tuple = None,
+        kwdefaults: Dict[str, Any] = None,
+        name: str = None,
+        qualname: str = None,
+        **closure_values,
+    ) -> types.FunctionType:
+        """Return a new function, closure_values are the values of freevars
+
+        Arguments not given are the ones of the prototype
+        """
+        unknown = set(closure_values) - set(self.freevars)
+        if unknown:
+            raise TypeError(f"Unknown closure variables: {sorted(unknown)}")
+        missing = set(self.freevars) - set(closure_values)
+        if missing:
+            raise TypeError(f"Missing closure variables: {sorted(missing)}")
+        closure = None
+        if self.code.co_freevars:
+            closure = tuple(
+                types.CellType(closure_values[e]) for e in self.code.co_freevars
+            )
+
+        prototype = self.prototype
+        f = types.FunctionType(
+            self.code,
+            prototype.__globals__ if globals is None else globals,
+            name or prototype.__name__,
+            prototype.__defaults__ if defaults is None else defaults,
+            closure,
+        )
+        kwdefaults = prototype.__kwdefaults__ if kwdefaults is None else kwdefaults
+        if kwdefaults:
+            f.__kwdefaults__ = dict(kwdefaults)
+        f.__qualname__ = qualname or name or prototype.__qualname__
+        if prototype.__annotations__:
+            f.__annotations__ = prototype.__annotations__
+        return f
+
+
+def build_factory(
+    piece: FunctionBlock,
+    freevars: Iterable[str] = (),
+    globals: Dict[str, Any] = None,
+    formatter=None,
+) -> FunctionFactory:
+    """See FunctionBlock.build_factory"""
+    if piece.decorators:
+        raise ValueError("Functions with decorators can not be created by a factory")
+
+    formatter = _normalize_formatter(formatter)
+    freevars = tuple(freevars)
+    if globals is None:
+        globals = {}
+
+    if freevars:
+        # The function is defined in a wrapper function so that the names
+        # of freevars are closure variables and not global variables
+        native = formatter == "native"
+        source = (
+            f"def {_WRAPPER_NAME}({', '.join(freevars)}):\n"
+            f"{piece._render(1, False, native)}\n"
+            f"{piece.tab}return {piece.name}\n"
+        )
+        if formatter == "black":
+            source = _format_code(source)
+        exec(compile_source(source), globals)
+        wrapper: Callable = globals.pop(_WRAPPER_NAME)
+        # Closure variables are None while evaluating the defaults
+        prototype = wrapper(*(None for _ in freevars))
+        prototype.__qualname__ = piece.name
+    else:
+        source = piece.generate_code(formatter=formatter)
+        namespace = {}
+        exec(compile_source(source), globals, namespace)
+        prototype = namespace[piece.name]
+    return FunctionFactory(prototype, freevars)
@@ -0,0 +1,122 @@
+"""Import hook generating modules on first import (see register_importer)"""
+
+import importlib.abc
+import importlib.machinery
+import linecache
+import sys
+import types
+from typing import Callable, Optional
+
+from .codeg import BasePiece
+
+
+class GeneratedImporter(importlib.abc.MetaPathFinder, importlib.abc.Loader):
+    def __init__(
+        self,
+        prefix: str,
+        generate: Callable[[str], Optional[BasePiece]],
+        *,
+        is_package: Callable[[str], bool] = None,
+        formatter=None,
+    ):
+        """Finder and loader of the modules named prefix.*
+
+        generate is called with the full name of the module being imported
+        ("ourgen.foo") and returns its tree, or None if the module does not
+        exist. Nothing is generated until a module is imported: the module
+        is then generated, compiled (with code_cache and the disk cache, see
+        set_cache_dir), executed and kept in sys.modules like any module.
+        The prefix module is a package (empty if generate returns None for
+        it), other modules are packages when is_package(name) is True.
+        """
+        self.prefix = prefix
+        self.generate = generate
+        self.is_package = is_package
+        self.formatter = formatter
+
+    def __repr__(self):
+        return f"<{self.__class__.__name__} {self.prefix}>"
+
+    def filename(self, fullname: str) -> str:
+        """Filename of the module (__file__, tracebacks and linecache)"""
+        return f"<codeg {fullname}>"
+
+    def _is_package(self, fullname: str) -> bool:
+        if fullname == self.prefix:
+            return True
+        return self.is_package is not None and self.is_package(fullname)
+
+    def find_spec(self, fullname, path=None, target=None):
+        if fullname != self.prefix and not fullname.startswith(self.prefix + "."):
+            return None
+        tree = self.generate(fullname)
+        is_package = self._is_package(fullname)
+        if tree is None and not is_package:
+            return None
+
+        spec = importlib.machinery.ModuleSpec(
+            fullname,
+            self,
+            origin=self.filename(fullname),
+            loader_state=tree,
+            is_package=is_package,
+        )
+        spec.has_location = True
+        return spec
+
+    def create_module(self, spec):
+        # Default module creation
+        return None
+
+    def exec_module(self, module: types.ModuleType):
+        tree = module.__spec__.loader_state
+        if tree is None:
+            return
+        # BasePiece.build: subclasses return the built object, not the namespace
+        BasePiece.build(
+            tree,
+            module.__dict__,
+            module.__dict__,
+            self.filename(module.__name__),
+            formatter=self.formatter,
+        )
+
+    def get_source(self, fullname: str) -> Optional[str]:
+        """Source of an imported module (used by inspect, pdb, ...)"""
+        filename = self.filename(fullname)
+        lines = linecache.getlines(filename)
+        if lines:
+            return "".join(lines)
+        tree = self.generate(fullname)
+        if tree is None:
+            return ""
+        return tree.generate_code(formatter=self.formatter)
+
+    def unregister(self):
+        """Remove the importer from sys.meta_path (imported modules are kept)"""
+        try:
+            sys.meta_path.remove(self)
+        except ValueError:
+            pass
+
+
+def register_importer(
+    prefix: str,
+    generate: Callable[[str], Optional[BasePiece]],
+    *,
+    is_package: Callable[[str], bool] = None,
+    formatter=None,
+) -> GeneratedImporter:
+    """Generate the modules named prefix.* when they are imported
+
+        codeg.register_importer("ourgen", trees.get)
+        import ourgen.foo  # only ourgen.foo is generated
+
+    See GeneratedImporter for the arguments. The parent package of prefix
+    (if prefix is dotted) must be importable.
+    """
+    importer = GeneratedImporter(
+        prefix, generate, is_package=is_package, formatter=formatter
+    )
+    sys.meta_path.insert(0, importer)
+    return importer
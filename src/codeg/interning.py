@@ -0,0 +1,104 @@
+"""Hash-consing: share the structurally identical subtrees of trees"""
+
+from typing import Dict, Hashable, Tuple
+
+from .codeg import BasePiece, _atomic_lines
+
+
+class Interner:
+    def __init__(self):
+        """Table of the distinct pieces and lines of the interned trees
+
+        Two pieces are identical when they have the same type, the same
+        generated header (generate_atomic_script) and identical child and
+        sibling pieces. An identical piece is stored once and shared by all
+        its parents, so its code is generated and cached once (see _render)
+        for all its occurrences.
+        The same interner can be used for several trees (ex: the modules of a
+        package) to share their subtrees too.
+        """
+        # structure => distinct piece
+        self._pieces: Dict[Tuple[Hashable, ...], BasePiece] = {}
+        # id(distinct piece) => number used in the structure of its parents
+        self._numbers: Dict[int, int] = {}
+        self._lines: Dict[str, str] = {}
+
+    def __len__(self):
+        """Number of distinct pieces"""
+        return len(self._pieces)
+
+    def intern(self, tree: BasePiece) -> BasePiece:
+        """Replace the subtrees of tree by the identical distinct ones and return tree
+
+        tree itself is kept. Shared pieces must not be modified anymore:
+        a modification would change all their occurrences.
+        """
+        # id(piece) => (piece, distinct piece identical to piece)
+        replacements = {}
+        # Post-order walk with an explicit stack (no recursion)
+        stack = [(tree, False)]
+        while stack:
+            piece, visited = stack.pop()
+            if id(piece) in self._numbers or id(piece) in replacements:
+                # Already interned, or seen twice in tree
+                continue
+            if not visited:
+                stack.append((piece, True))
+                for e in (*piece._pieces, *piece._sibling_pieces):
+                    if isinstance(e, BasePiece):
+                        stack.append((e, False))
+                continue
+
+            if piece is not tree:
+                structure = (
+                    type(piece),
+                    tuple(_atomic_lines(piece)),
+                    self._structure(piece._pieces, replacements),
+                    self._structure(piece._sibling_pieces, replacements),
+                )
+                distinct = self._pieces.setdefault(structure, piece)
+                if distinct is not piece:
+                    # piece is dropped, its children are not linked to distinct pieces
+                    replacements[id(piece)] = (piece, distinct)
+                    continue
+                self._numbers[id(piece)] = len(self._numbers)
+            self._replace_children(piece, replacements)
+        return tree
+
+    def _structure(self, children, replacements) -> tuple:
+        structure = []
+        for e in children:
+            if isinstance(e, BasePiece):
+                if id(e) in replacements:
+                    e = replacements[id(e)][1]
+                e = self._numbers[id(e)]
+            structure.append(e)
+        return tuple(structure)
+
+    def _replace_children(self, parent: BasePiece, replacements):
+        """Replace the children of parent by the distinct ones"""
+        replaced = False
+        for children in (parent._pieces, parent._sibling_pieces):
+            for i, e in enumerate(children):
+                # list.__setitem__: the parent is invalidated once below
+                if isinstance(e, str):
+                    list.__setitem__(children, i, self._lines.setdefault(e, e))
+                elif isinstance(e, BasePiece) and id(e) in replacements:
+                    distinct = replacements[id(e)][1]
+                    list.__setitem__(children, i, distinct)
+                    distinct._add_parent(parent)
+                    replaced = True
+        if replaced:
+            # Distinct pieces may not have cached their code
+            parent.invalidate()
+
+
+def intern_tree(tree: BasePiece, interner: Interner = None) -> BasePiece:
+    """Share the identical subtrees and lines of tree (see Interner)
+
+    Memory and generate_code time then depend on the number of distinct
+    subtrees. The tree must not be modified after.
+    """
+    if interner is None:
+        interner = Interner()
+    return interner.intern(tree)
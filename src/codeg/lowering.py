@@ -0,0 +1,204 @@
+"""Convert a tree of pieces to a python AST (used to build without formatting)
+
+Line numbers and columns of the nodes match the code generated by
+BasePiece.generate_code(format_with_black=False), so that tracebacks can
+show the generated lines.
+
+When building, the statements of each piece are cached with its generated code
+(see BasePiece._render), so after a modification only the modified pieces and
+their parents are lowered again.
+"""
+
+import ast
+from typing import List, Tuple
+
+from .codeg import BaseIndentPiece, BasePiece, _atomic_lines
+
+
+def to_ast(piece: BasePiece, cache: bool = False) -> ast.Module:
+    """With cache, the nodes are shared with the cache of the pieces:
+    they must not be modified"""
+    body, _ = lower_piece(piece, 1, 0, cache)
+    return ast.Module(body=list(body), type_ignores=[])
+
+
+def lower_piece(
+    piece: BasePiece, lineno: int, indent: int, cache: bool = False
+) -> Tuple[List[ast.stmt], int]:
+    """Return the statements of piece (with its siblings and childs pieces)
+    and the line number following the piece"""
+    if cache and piece._fragments is not None:
+        cached = piece._fragments.get("ast")
+        # The nodes have the positions of the piece when it was lowered
+        if cached is not None and cached[:2] == (lineno, indent):
+            return cached[2], cached[3]
+
+    if isinstance(piece, BaseIndentPiece):
+        try:
+            statements, next_lineno = _lower_block(piece, lineno, indent, cache)
+        except _HeaderError as error:
+            if error.piece is piece:
+                raise
+            # A child block can not be parsed alone (ex: case of a match)
+            statements, next_lineno = _parse_generated(piece, lineno, indent)
+    else:
+        statements = []
+        next_lineno = lineno
+        lines = _atomic_lines(piece)
+        if lines:
+            # Each atomic line is indented
+            prefix = piece.tab * indent
+            statements.extend(_parse("\n".join(lines), lineno, prefix, all_lines=True))
+            next_lineno += len(lines)
+        body, next_lineno = _lower_pieces(piece._pieces, next_lineno, indent, cache)
+        statements.extend(body)
+
+    if cache:
+        if piece._fragments is None:
+            piece._fragments = {}
+        piece._fragments["ast"] = (lineno, indent, statements, next_lineno)
+        # Siblings are lowered with the piece, mark them so that invalidate
+        # goes through them (as _render does)
+        for sibling_piece in piece._sibling_pieces:
+            if sibling_piece._fragments is None:
+                sibling_piece._fragments = {}
+    return statements, next_lineno
+
+
+class _HeaderError(SyntaxError):
+    """The headers of a block (and its siblings) can not be parsed"""
+
+    def __init__(self, piece: BaseIndentPiece, error: SyntaxError):
+        super().__init__(error.msg, error.args[1] if len(error.args) > 1 else None)
+        self.piece = piece
+
+
+def _lower_pieces(
+    pieces, lineno: int, indent: int, cache: bool
+) -> Tuple[List[ast.stmt], int]:
+    statements = []
+    for piece in pieces:
+        if isinstance(piece, str):
+            statements.extend(_parse(piece, lineno, BasePiece.tab * indent))
+            lineno += piece.count("\n") + 1
+        elif isinstance(piece, BasePiece):
+            body, lineno = lower_piece(piece, lineno, indent, cache)
+            statements.extend(body)
+        else:
+            raise ValueError(f"Type {type(piece)!r} unhandled")
+    return statements, lineno
+
+
+def _lower_block(
+    piece: BaseIndentPiece, lineno: int, indent: int, cache: bool
+) -> Tuple[List[ast.stmt], int]:
+    """Lower a block and its siblings (elif, else, except, ...)
+
+    The headers are parsed together (with a 'pass' placeholder as body),
+    then the placeholders are replaced by the lowered child pieces
+    """
+    first_lineno = lineno
+    header_source = []
+    bodies = []
+    for sibling_piece in (piece, *piece._sibling_pieces):
+        lines = _atomic_lines(sibling_piece)
+        lines[-1] += ":"
+        header_source.extend(lines)
+        lineno += len(lines)
+
+        body, next_lineno = _lower_pieces(
+            sibling_piece._pieces, lineno, indent + 1, cache
+        )
+        if not sibling_piece._pieces:
+            # 'pass' generated for empty blocks
+            next_lineno += 1
+        bodies.append(body)
+        # Placeholder, then blank lines so that the next header is at its line
+        header_source.append(" pass")
+        header_source.extend([""] * (next_lineno - lineno - 1))
+        lineno = next_lineno
+
+    prefix = piece.tab * indent
+    try:
+        statements = _parse(
+            "\n".join(header_source), first_lineno, prefix, all_lines=True
+        )
+    except SyntaxError as error:
+        raise _HeaderError(piece, error) from error
+
+    placeholders = []
+    for node in ast.walk(statements[0]):
+        for _, value in ast.iter_fields(node):
+            if isinstance(value, list) and len(value) == 1:
+                if isinstance(value[0], ast.Pass):
+                    placeholders.append((value[0].lineno, value))
+    placeholders.sort(key=lambda e: e[0])
+    if len(statements) != 1 or len(placeholders) != len(bodies):
+        raise SyntaxError(f"Can not convert {piece} to ast")
+
+    for (_, placeholder), body in zip(placeholders, bodies):
+        if body:
+            # placeholder is the body list of a node of the header
+            placeholder[:] = body
+        else:
+            node = placeholder[0]
+            node.col_offset = len(prefix) + len(piece.tab)
+            node.end_col_offset = node.col_offset + 4
+    _fix_end_position(statements[0], {id(e[1]) for e in placeholders})
+    return statements, lineno
+
+
+def _parse_generated(
+    piece: BasePiece, lineno: int, indent: int
+) -> Tuple[List[ast.stmt], int]:
+    """Parse the generated code of piece (with its siblings and childs pieces)"""
+    source = "\n".join(piece.iter_lines(_indent=indent))
+    next_lineno = lineno + source.count("\n") + 1
+    if not indent:
+        return _parse(source, lineno, ""), next_lineno
+    # Indented code is parsed as the body of a block, at its columns
+    (block,) = _parse("if 1:\n" + source, lineno - 1, "")
+    return block.body, next_lineno
+
+
+def _fix_end_position(node: ast.AST, bodies_ids):
+    """Extend the end of the compound statements to the end of their bodies
+
+    Lowered bodies (bodies_ids) already have the right positions, only the
+    nodes parsed from the headers (ex: elif, except) are visited
+    """
+    end = (node.end_lineno, node.end_col_offset)
+    for _, value in ast.iter_fields(node):
+        if not isinstance(value, list) or not value:
+            continue
+        if id(value) not in bodies_ids:
+            for child in value:
+                if isinstance(child, (ast.stmt, ast.excepthandler)):
+                    _fix_end_position(child, bodies_ids)
+        last = value[-1]
+        if isinstance(last, (ast.stmt, ast.excepthandler)):
+            end = max(end, (last.end_lineno, last.end_col_offset))
+    node.end_lineno, node.end_col_offset = end
+
+
+def _parse(
+    source: str, lineno: int, prefix: str, all_lines: bool = False
+) -> List[ast.stmt]:
+    """Parse a fragment of code located at lineno and indented with prefix
+
+    When all_lines is False, only the first line is indented
+    (continuation lines of str pieces are generated as is)
+    """
+    statements = ast.parse(source).body
+    offset = len(prefix)
+    for statement in statements:
+        for node in ast.walk(statement):
+            if "lineno" not in node._attributes:
+                continue
+            if offset and (all_lines or node.lineno == 1):
+                node.col_offset += offset
+                if node.end_lineno == node.lineno or all_lines:
+                    node.end_col_offset += offset
+            node.lineno += lineno - 1
+            node.end_lineno += lineno - 1
+    return statements
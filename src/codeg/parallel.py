@@ -0,0 +1,153 @@
+"""Generate the code (or stubs) of many independent trees with a pool of processes"""
+
+import collections
+import concurrent.futures
+import itertools
+import os
+from typing import Iterable, Iterator
+
+from .codeg import (
+    BasePiece,
+    _format_code,
+    _format_key,
+    _normalize_formatter,
+    format_cache,
+)
+
+# Under this number of trees, the code is generated in the current process
+# (starting processes costs more than formatting a few scripts)
+PARALLEL_THRESHOLD = 16
+
+
+def generate_many(
+    trees: Iterable[BasePiece],
+    workers: int = None,
+    *,
+    format_with_black=True,
+    stub=False,
+    formatter=None,
+    executor: concurrent.futures.Executor = None,
+) -> Iterator[str]:
+    """Generate the code of each tree, results are yielded in the same order
+
+    Black formatting (the expensive part) is spread over a pool of workers
+    processes (os.cpu_count() by default). The trees are rendered in the
+    current process: rendering is linear and pickling the trees to send them
+    to the workers would cost as much, while sources are cheap to send.
+    trees can be a lazy iterable (ex: a pipeline stage), only a bounded number
+    of sources are waiting to be formatted.
+    Without black, with one worker or less than PARALLEL_THRESHOLD trees,
+    everything runs in the current process.
+    An executor can be given to reuse a pool between calls.
+    """
+    formatter = _normalize_formatter(formatter, format_with_black)
+    if workers is None:
+        workers = os.cpu_count() or 1
+    if workers < 1:
+        raise ValueError("workers must be at least 1")
+
+    trees = iter(trees)
+    head = list(itertools.islice(trees, PARALLEL_THRESHOLD))
+    if (
+        formatter != "black"
+        or (workers == 1 and executor is None)
+        or len(head) < PARALLEL_THRESHOLD
+    ):
+        for tree in itertools.chain(head, trees):
+            yield tree.generate_code(stub=stub, formatter=formatter)
+        return
+
+    sources = (
+        tree.generate_code(format_with_black=False, stub=stub)
+        for tree in itertools.chain(head, trees)
+    )
+    yield from _format_in_pool(sources, stub, executor, workers)
+
+
+def generate_stubs(
+    trees: Iterable[BasePiece],
+    workers: int = None,
+    *,
+    formatter="native",
+    executor: concurrent.futures.Executor = None,
+) -> Iterator[str]:
+    """Generate the stubfile code of each tree (see generate_stubcode),
+    results are yielded in the same order
+
+    Same as generate_many: the stub scripts are rendered in the current process
+    and, with black, formatted by a pool of workers processes. The native
+    formatter is much faster than black and gives the same stubs for the
+    pieces of codeg, it is the default.
+    """
+    formatter = _normalize_formatter(formatter)
+    if workers is None:
+        workers = os.cpu_count() or 1
+    if workers < 1:
+        raise ValueError("workers must be at least 1")
+
+    trees = iter(trees)
+    head = list(itertools.islice(trees, PARALLEL_THRESHOLD))
+    if (
+        formatter != "black"
+        or (workers == 1 and executor is None)
+        or len(head) < PARALLEL_THRESHOLD
+    ):
+        for tree in itertools.chain(head, trees):
+            yield tree.generate_stubcode(formatter=formatter)
+        return
+
+    sources = (
+        tree.stub_script().generate_code(format_with_black=False, stub=True)
+        for tree in itertools.chain(head, trees)
+    )
+    yield from _format_in_pool(sources, True, executor, workers)
+
+
+def _format_in_pool(
+    sources: Iterable[str],
+    stub: bool,
+    executor: concurrent.futures.Executor,
+    workers: int,
+) -> Iterator[str]:
+    """Format the sources with black in executor (a new pool if None)"""
+    if executor is not None:
+        yield from _format_in_executor(sources, stub, executor, workers)
+        return
+
+    # Import black before forking, so that workers do not import it again
+    import black  # noqa: F401
+
+    with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as executor:
+        yield from _format_in_executor(sources, stub, executor, workers)
+
+
+def _format_in_executor(
+    sources: Iterable[str],
+    stub: bool,
+    executor: concurrent.futures.Executor,
+    workers: int,
+) -> Iterator[str]:
+    # Enough pending sources to keep the workers busy while results are consumed
+    max_pending = 4 * workers
+    # (format_cache key, future or formatted source)
+    pending = collections.deque()
+
+    def pop_result():
+        key, result = pending.popleft()
+        if isinstance(result, concurrent.futures.Future):
+            result = result.result()
+            format_cache.set(key, result)
+        return result
+
+    for source in sources:
+        key = _format_key(source, stub)
+        formatted = format_cache.get(key)
+        if formatted is None:
+            formatted = executor.submit(_format_code, source, stub)
+        pending.append((key, formatted))
+
+        while len(pending) >= max_pending:
+            yield pop_result()
+
+    while pending:
+        yield pop_result()
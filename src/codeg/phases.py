@@ -0,0 +1,157 @@
+"""Durations and sizes of the phases of the builds (render, black, compile, ...)"""
+
+import contextlib
+import contextvars
+import threading
+from typing import Callable, Dict, List
+
+from attrs import define
+
+PHASES = ("render", "black", "lower", "compile", "linecache", "exec")
+
+
+@define(frozen=True)
+class PhaseRecord:
+    """One phase of a build"""
+
+    phase: str
+    duration: float
+    source_size: int
+    line_count: int
+    # Number of pieces of the built tree (0 when building a source)
+    piece_count: int
+
+
+@define
+class PhaseCounter:
+    """Cumulative values of the records of a phase"""
+
+    count: int = 0
+    duration: float = 0.0
+    source_size: int = 0
+    line_count: int = 0
+    piece_count: int = 0
+
+
+def count_pieces(piece) -> int:
+    from .codeg import BasePiece
+
+    count = 0
+    stack = [piece]
+    while stack:
+        piece = stack.pop()
+        count += 1
+        for e in (*piece._pieces, *piece._sibling_pieces):
+            if isinstance(e, BasePiece):
+                stack.append(e)
+    return count
+
+
+class Metrics:
+    def __init__(self):
+        """Record the phases of the builds
+
+        Nothing is measured while the metrics are disabled: codeg only checks
+        the enabled attribute. Metrics are enabled by enable() (cumulative
+        counters, see counters()) or when hooks are added (called with a
+        PhaseRecord for each phase).
+        """
+        self.enabled = False
+        self._collect = False
+        self._hooks: List[Callable[[PhaseRecord], None]] = []
+        self._counters: Dict[str, PhaseCounter] = {}
+        self._lock = threading.Lock()
+        # (piece, piece count) of the current build
+        self._build_piece = contextvars.ContextVar("build_piece", default=None)
+
+    def enable(self):
+        """Keep cumulative counters of the phases"""
+        self._collect = True
+        self._update_enabled()
+
+    def disable(self):
+        self._collect = False
+        self._update_enabled()
+
+    def add_hook(self, hook: Callable[[PhaseRecord], None]):
+        self._hooks.append(hook)
+        self._update_enabled()
+
+    def remove_hook(self, hook: Callable[[PhaseRecord], None]):
+        self._hooks.remove(hook)
+        self._update_enabled()
+
+    def _update_enabled(self):
+        self.enabled = self._collect or bool(self._hooks)
+
+    @contextlib.contextmanager
+    def recording(self):
+        """Context manager returning the list of the records of the phases"""
+        records = []
+        self.add_hook(records.append)
+        try:
+            yield records
+        finally:
+            self.remove_hook(records.append)
+
+    @contextlib.contextmanager
+    def building(self, piece):
+        """Attribute the phases recorded in the context to the build of piece"""
+        token = self._build_piece.set((piece, None))
+        try:
+            yield
+        finally:
+            self._build_piece.reset(token)
+
+    def record(self, phase: str, duration: float, source: str = "", piece=None):
+        piece_count = self._piece_count(piece)
+        record = PhaseRecord(
+            phase=phase,
+            duration=duration,
+            source_size=len(source),
+            line_count=source.count("\n") + bool(source and source[-1] != "\n"),
+            piece_count=piece_count,
+        )
+        if self._collect:
+            with self._lock:
+                counter = self._counters.get(phase)
+                if counter is None:
+                    counter = self._counters[phase] = PhaseCounter()
+                counter.count += 1
+                counter.duration += duration
+                counter.source_size += record.source_size
+                counter.line_count += record.line_count
+                counter.piece_count += piece_count
+        for hook in tuple(self._hooks):
+            hook(record)
+
+    def _piece_count(self, piece) -> int:
+        """Count the pieces of piece (default: the piece being built)"""
+        build_piece = self._build_piece.get()
+        if build_piece is None or (piece is not None and piece is not build_piece[0]):
+            return 0 if piece is None else count_pieces(piece)
+
+        # Counted once by build
+        piece, piece_count = build_piece
+        if piece_count is None:
+            piece_count = count_pieces(piece)
+            self._build_piece.set((piece, piece_count))
+        return piece_count
+
+    def counters(self) -> Dict[str, PhaseCounter]:
+        """Return a copy of the cumulative counters by phase"""
+        with self._lock:
+            return {
+                phase: PhaseCounter(
+                    count=e.count,
+                    duration=e.duration,
+                    source_size=e.source_size,
+                    line_count=e.line_count,
+                    piece_count=e.piece_count,
+                )
+                for phase, e in self._counters.items()
+            }
+
+    def reset(self):
+        with self._lock:
+            self._counters.clear()
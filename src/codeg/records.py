@@ -0,0 +1,113 @@
+"""Record classes: slotted classes generated from typed fields"""
+
+from typing import List
+
+import attrs
+
+from .codeg import ClassBlock, Parameter, normalize_parameters
+
+
+def record(
+    name: str,
+    fields,
+    *,
+    bases=None,
+    frozen: bool = False,
+    eq: bool = True,
+    hash: bool = None,
+    repr: bool = True,
+) -> ClassBlock:
+    """Return a class with __slots__, __init__, __eq__, __hash__ and __repr__
+    generated for fields (Parameter or names, see param)
+
+    The methods are written out field by field (no loop nor getattr at run
+    time), like a hand-written slotted class:
+    - __init__ takes the fields as parameters (with their defaults, kw_only)
+    - __eq__ compares the tuples of the fields of instances of the same class
+    - __hash__ hashes the tuple of the fields, by default only if the class is
+      frozen and has __eq__ (mutable classes with __eq__ are not hashable)
+    - frozen classes can not be modified after __init__ (AttributeError)
+
+    Other methods can be added to the returned class.
+    """
+    fields = normalize_parameters(fields)
+    _check_fields(fields)
+    if hash is None:
+        hash = eq and frozen
+
+    code_cls = ClassBlock(name, bases)
+    names = tuple(field.name for field in fields)
+    # Double quotes like black (names are identifiers)
+    slots = _tuple([f'"{e}"' for e in names])
+    code_cls.line(f"__slots__ = {slots}")
+    for field in fields:
+        if field.annotation is not None:
+            code_cls.annotation(field.name, field.annotation)
+
+    code_init = code_cls.method("__init__", fields)
+    if frozen and fields:
+        # __setattr__ raises an error, the slots are set by object.__setattr__
+        code_init.line("_setattr = object.__setattr__")
+        for field in fields:
+            code_init.line(f'_setattr(self, "{field.name}", {field.name})')
+    else:
+        for field in fields:
+            code_init.line(f"self.{field.name} = {field.name}")
+
+    if repr:
+        values = ", ".join(f"{e}={{self.{e}!r}}" for e in names)
+        code_cls.method("__repr__").ret(f'f"{{self.__class__.__qualname__}}({values})"')
+
+    if eq:
+        code_eq = code_cls.method("__eq__", ["other"])
+        code_eq.if_("other.__class__ is self.__class__").ret(
+            f"{_fields_tuple('self', names)} == {_fields_tuple('other', names)}"
+        )
+        code_eq.ret("NotImplemented")
+
+    if hash:
+        code_cls.method("__hash__").ret(f"hash({_fields_tuple('self', names)})")
+    elif eq:
+        code_cls.line("__hash__ = None")
+
+    if frozen:
+        error = 'f"{self.__class__.__qualname__} is frozen"'
+        code_cls.method("__setattr__", ["name", "value"]).line(
+            f"raise AttributeError({error})"
+        )
+        code_cls.method("__delattr__", ["name"]).line(f"raise AttributeError({error})")
+    return code_cls
+
+
+def _fields_tuple(variable: str, names) -> str:
+    return _tuple([f"{variable}.{e}" for e in names])
+
+
+def _tuple(values: List[str]) -> str:
+    """Code of the tuple of values"""
+    if len(values) == 1:
+        return f"({values[0]},)"
+    return f"({', '.join(values)})"
+
+
+def _check_fields(fields: List[Parameter]):
+    names = set()
+    has_default = False
+    kw_only = False
+    for field in fields:
+        if field.name in names:
+            raise ValueError(f"Field {field.name!r} is defined twice")
+        names.add(field.name)
+        if type(field.default) in (list, dict, set):
+            raise ValueError(
+                f"Mutable default {field.default!r} of field {field.name!r}"
+                " would be shared by all the instances"
+            )
+        # Keyword only parameters can be in any order
+        kw_only = kw_only or field.kw_only
+        if kw_only:
+            continue
+        if field.default is not attrs.NOTHING:
+            has_default = True
+        elif has_default:
+            raise ValueError(f"Field {field.name!r} without default follows a default")
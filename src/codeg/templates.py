@@ -0,0 +1,159 @@
+"""Pieces generated once and instantiated by filling holes ($name)"""
+
+import string
+from typing import Any, Dict, List, Tuple
+
+from .cache import LRUCache
+from .codeg import BasePiece
+
+
+class Template:
+    def __init__(self, piece: BasePiece, maxsize: int = 4096):
+        """Piece containing holes, instantiated with different values
+
+        Holes use the string.Template syntax: $name or ${name} ($$ for $) and
+        can be in names, expressions, annotations, ... of the piece:
+
+            template = codeg.Template(codeg.function("get_$field", ["self"]).ret("self.$field"))
+            code = template.render(field="name")
+
+        The piece is rendered and split around its holes once (by mode), then
+        an instance only costs the substitution of the holes. Rendered codes are
+        memoized by values of the holes (maxsize codes are kept).
+        The piece must not be modified after the creation of the template.
+        With the native formatter, long lines are wrapped according to the
+        length of the template (with the holes, not the values).
+        """
+        self.piece = piece
+        # (indent, stub, native) => literal parts and hole names (odd indexes)
+        self._parts: Dict[Tuple, List[str]] = {}
+        self._holes = None
+        self.cache = LRUCache(maxsize)
+
+    def __repr__(self):
+        return f"<{self.__class__.__name__} {self.piece} holes={self.holes}>"
+
+    def __getstate__(self):
+        # Rendered codes are not pickled (and the cache has a lock)
+        return {"piece": self.piece, "maxsize": self.cache.maxsize}
+
+    def __setstate__(self, state):
+        self.__init__(state["piece"], state["maxsize"])
+
+    @property
+    def holes(self) -> Tuple[str, ...]:
+        """Names of the holes, in order of first appearance"""
+        if self._holes is None:
+            names = self._split(0, False, False)[1::2]
+            self._holes = tuple(dict.fromkeys(names))
+        return self._holes
+
+    def _split(self, indent: int, stub: bool, native: bool) -> List[str]:
+        key = (indent, stub, native)
+        parts = self._parts.get(key)
+        if parts is None:
+            # Stubs render the declarations only (see BasePiece.stub_script)
+            piece = self.piece.stub_script() if stub else self.piece
+            text = piece._render(indent, stub, native)
+            parts = self._parts[key] = _split_holes(text)
+        return parts
+
+    def render(self, *, _indent=0, _stub=False, _native=False, **values) -> str:
+        """Return the code of the piece with the holes filled with values
+
+        Values are converted with str, KeyError is raised for missing values
+        """
+        values = tuple(str(values[name]) for name in self.holes)
+        key = (_indent, _stub, _native, values)
+        code = self.cache.get(key)
+        if code is None:
+            parts = self._split(_indent, _stub, _native)
+            mapping = dict(zip(self.holes, values))
+            filled = parts.copy()
+            for i in range(1, len(parts), 2):
+                filled[i] = mapping[parts[i]]
+            code = "".join(filled)
+            self.cache.set(key, code)
+        return code
+
+    def instance(self, **values) -> "TemplateInstance":
+        """Return a piece generating the template filled with values"""
+        return TemplateInstance(self, values)
+
+
+def _split_holes(text: str) -> List[str]:
+    """Split text in literal parts and hole names: [literal, name, literal, ...]"""
+    parts = []
+    literal = []
+    position = 0
+    for match in string.Template.pattern.finditer(text):
+        start = match.start()
+        literal.append(text[position:start])
+        position = match.end()
+        if match.group("escaped") is not None:
+            literal.append("$")
+            continue
+        name = match.group("named") or match.group("braced")
+        if name is None:
+            raise ValueError(f"Invalid hole at position {match.start()} in {text!r}")
+        parts.append("".join(literal))
+        parts.append(name)
+        literal = []
+    literal.append(text[position:])
+    parts.append("".join(literal))
+    return parts
+
+
+class TemplateInstance(BasePiece):
+    __slots__ = ("template", "values", "_stub")
+
+    def __init__(self, template: Template, values: Dict[str, Any]):
+        """Piece generating a template with its holes filled
+
+        It can be added to other pieces (see BasePiece.add) and built
+        """
+        super().__init__()
+        self.template = template
+        self.values = values
+        # Declaration in a stub (see _stub_declarations)
+        self._stub = False
+
+    def __str__(self):
+        return f"<{self.__class__.__name__} {self.values}>"
+
+    @property
+    def is_definition(self) -> bool:
+        return self.template.piece.is_definition
+
+    @property
+    def name(self) -> str:
+        """Name of the templated function or class (holes filled)"""
+        name = getattr(self.template.piece, "name", None)
+        if name is None:
+            raise AttributeError(f"{self.template.piece} has no name")
+        return string.Template(name).substitute(self.values)
+
+    def _stub_declarations(self) -> list:
+        stub = TemplateInstance(self.template, self.values)
+        stub._stub = True
+        return [stub]
+
+    def generate_atomic_script(self) -> List[str]:
+        return self.template.render(_stub=self._stub, **self.values).split("\n")
+
+    def generate_atomic_script_pep8(self, prefix: str, suffix: str = "") -> List[str]:
+        # Long lines are wrapped according to the indentation
+        indent = len(prefix) // len(self.tab)
+        code = self.template.render(
+            _indent=indent, _stub=self._stub, _native=True, **self.values
+        )
+        offset = len(prefix)
+        return [line[offset:] for line in code.split("\n")]
+
+    def build(self, globals=None, locals=None, filename=None, **kwargs) -> Any:
+        """Return the built function or class (or the dict of the objects
+        if the template has no name)"""
+        objects = super().build(globals, locals, filename, **kwargs)
+        if getattr(self.template.piece, "name", None) is None:
+            return objects
+        return objects[self.name]
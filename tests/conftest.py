@@ -0,0 +1,10 @@
+import codeg
+import pytest
+
+
+@pytest.fixture
+def no_code_cache():
+    codeg.code_cache.clear()
+    codeg.code_cache.enabled = False
+    yield
+    codeg.code_cache.enabled = True
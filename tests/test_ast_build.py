@@ -0,0 +1,162 @@
+import ast
+import sys
+import traceback
+
+import codeg
+import codeg.lowering
+import pytest
+
+
+def _script():
+    code_script = codeg.script()
+    code_script.import_("math")
+    code_script.comment("functions")
+    code_script.annotation("counter", int)
+    code_script.line("counter = 0")
+    code_script.line("identity = lambda f: f")
+
+    code_f = code_script.function(
+        "f", ["x", codeg.param("y", annotation=int, default=2, kw_only=True)]
+    )
+    code_f.decorator("identity")
+    code_if = code_f.if_("x > 10")
+    code_if.ret("'big'")
+    code_if.elif_("x > 5").ret("'medium'")
+    code_if.else_()
+
+    code_for = code_f.for_("i", "range(x)")
+    code_for.if_("i == y").line("break")
+    code_for.else_().line("pass")
+
+    code_try = code_f.try_()
+    code_try.line("z = math.sqrt(x)")
+    code_try.except_("ValueError", "e").ret("str(e)")
+    code_try.else_().line("z += 1")
+    code_try.finally_().line("global counter").line("counter += 1")
+
+    code_f.while_("z > 100").line("z = z / 2")
+    code_f.ret("z")
+
+    code_cls = code_script.cls("A", ["object"])
+    code_cls.annotation("name", str)
+    code_cls.method("__init__", ["name"]).line("self.name = name")
+    code_cls.method("g")
+    code_script.block("with open(__file__) as fp").line("pass")
+    return code_script
+
+
+def _assert_same_ast(code_script):
+    generated = code_script.generate_code(format_with_black=False)
+    assert ast.dump(code_script.to_ast()) == ast.dump(ast.parse(generated))
+
+    # Line and column numbers match the generated code
+    expected_nodes = list(ast.walk(ast.parse(generated)))
+    nodes = list(ast.walk(code_script.to_ast()))
+    for node, expected in zip(nodes, expected_nodes):
+        for attribute in ("lineno", "col_offset", "end_lineno", "end_col_offset"):
+            assert getattr(node, attribute, None) == getattr(
+                expected, attribute, None
+            ), (ast.dump(expected), attribute)
+
+
+def test_to_ast_match_generated_code():
+    _assert_same_ast(_script())
+
+
+@pytest.mark.skipif(sys.version_info < (3, 10), reason="python < 3.10")
+def test_blocks_parsed_with_their_parent():
+    # case blocks can not be parsed without their match
+    code_script = codeg.script()
+    code_cls = code_script.cls("A")
+    code_match = code_cls.method("f", ["x"]).block("match x")
+    code_match.block("case 1").ret("'one'")
+    code_match.block("case _").ret("'other'")
+    code_script.function("g").ret("0")
+    _assert_same_ast(code_script)
+    namespace = code_script.build(from_ast=True)
+    assert namespace["A"]().f(1) == "one"
+    assert namespace["A"]().f(2) == "other"
+
+
+def test_build_from_ast_same_result():
+    namespace = {"__file__": __file__}
+    _script().build(namespace, namespace, from_ast=True)
+    f = namespace["f"]
+    assert f(11) == "big"
+    assert f(6) == "medium"
+    assert f(4) == 3.0
+    assert namespace["counter"] == 1
+    assert namespace["A"]("rex").name == "rex"
+
+
+def test_function_and_cls_build_from_ast():
+    f = codeg.function("f", ["x"]).ret("x * 2").build(from_ast=True)
+    assert f(2) == 4
+
+    code_cls = codeg.cls("A")
+    code_cls.method("f").ret("1")
+    assert code_cls.build(from_ast=True)().f() == 1
+
+
+def test_build_from_ast_does_not_call_black(monkeypatch):
+    def fail(*args, **kwargs):
+        raise AssertionError("black must not be called")
+
+    monkeypatch.setattr(codeg.codeg, "format_string_with_black", fail)
+    f = codeg.function("f", ["x"]).ret("x * 3").build(from_ast=True)
+    assert f(2) == 6
+
+
+def test_traceback_from_ast():
+    code_function = codeg.function("f")
+    code_function.line("x = 1")
+    code_function.if_("x").line("y = 1 / 0")
+    f = code_function.build(from_ast=True)
+    try:
+        f()
+    except ZeroDivisionError:
+        formatted = traceback.format_exc()
+    assert "y = 1 / 0" in formatted
+
+
+def test_incomplete_line():
+    code_function = codeg.function("f").line("if x:").line("    pass")
+    with pytest.raises(SyntaxError):
+        code_function.build(from_ast=True)
+
+
+def test_build_from_ast_after_modification(monkeypatch):
+    code_script = codeg.script()
+    code_f = code_script.function("f", ["x"])
+    code_if = code_f.if_("x")
+    code_if.ret("1")
+    code_else = code_if.else_()
+    code_else.ret("2")
+    code_script.function("g").ret("0")
+    assert code_script.build(from_ast=True)["f"](0) == 2
+
+    # Only the modified pieces are lowered again
+    parsed = []
+    parse = codeg.lowering._parse
+
+    def spy(source, *args, **kwargs):
+        parsed.append(source)
+        return parse(source, *args, **kwargs)
+
+    monkeypatch.setattr(codeg.lowering, "_parse", spy)
+    code_script.function("h").ret("3")
+    namespace = code_script.build(from_ast=True)
+    assert namespace["h"]() == 3
+    assert sorted(parsed) == ["def h():\n pass", "return 3"]
+
+    code_else.pieces.insert(0, "x = 5")
+    code_else.invalidate()
+    namespace = code_script.build(from_ast=True)
+    assert namespace["f"](0) == 2
+    assert namespace["g"]() == 0
+    # The positions of the cached statements match the generated code
+    generated = code_script.generate_code(format_with_black=False)
+    tree = codeg.lowering.to_ast(code_script, cache=True)
+    assert ast.dump(tree, include_attributes=True) == ast.dump(
+        ast.parse(generated), include_attributes=True
+    )
@@ -0,0 +1,109 @@
+import asyncio
+import concurrent.futures
+import threading
+import time
+
+import codeg
+import codeg.background
+import pytest
+
+
+@pytest.fixture
+def executor():
+    with concurrent.futures.ThreadPoolExecutor(5) as executor:
+        yield executor
+
+
+@pytest.fixture
+def slow_black(monkeypatch):
+    """black blocked until released"""
+    import black
+
+    calls = []
+    release = threading.Event()
+    format_str = black.format_str
+
+    def slow_format_str(string, **kwargs):
+        calls.append(string)
+        release.wait(30)
+        return format_str(string, **kwargs)
+
+    monkeypatch.setattr(black, "format_str", slow_format_str)
+    codeg.format_cache.clear()
+    codeg.code_cache.clear()
+    yield calls, release
+    release.set()
+
+
+def _function(value=1):
+    return codeg.function("f", ["x"]).ret(f"x + {value}")
+
+
+def test_submit_build(executor):
+    future = _function().submit_build(executor=executor)
+    assert future.result(30)(1) == 2
+
+    future = codeg.submit_build(codeg.script().line("a = 1"), executor=executor)
+    assert future.result(30)["a"] == 1
+
+
+def test_default_executor():
+    assert codeg.submit_build(_function()).result(30)(1) == 2
+
+
+def test_build_async(executor):
+    async def main():
+        code_f = _function()
+        functions = await asyncio.gather(
+            code_f.build_async(executor=executor),
+            codeg.build_async(_function(2), executor=executor),
+        )
+        code = await code_f.generate_code_async(executor=executor)
+        return functions, code
+
+    (f, g), code = asyncio.run(main())
+    assert f(1) == 2
+    assert g(1) == 3
+    assert code == _function().generate_code()
+
+
+def test_concurrent_builds_are_coalesced(executor, slow_black):
+    calls, release = slow_black
+    namespaces = [{"y": i} for i in range(5)]
+    futures = [
+        _function().submit_build(namespaces[i], executor=executor) for i in range(5)
+    ]
+    time.sleep(0.2)
+    release.set()
+    functions = [future.result(30) for future in futures]
+
+    assert len(calls) == 1
+    # Each build has its own globals
+    assert [f.__globals__["y"] for f in functions] == [0, 1, 2, 3, 4]
+
+
+def test_concurrent_generations_are_coalesced(executor, slow_black):
+    calls, release = slow_black
+    futures = [
+        codeg.submit_generate_code(_function(), executor=executor) for _ in range(5)
+    ]
+    time.sleep(0.2)
+    release.set()
+    codes = {future.result(30) for future in futures}
+    assert len(calls) == 1
+    assert codes == {_function().generate_code()}
+
+
+def test_errors_are_raised(executor):
+    future = codeg.submit_build(codeg.script().line("1 +"), executor=executor)
+    with pytest.raises(Exception):
+        future.result(30)
+    assert not codeg.background._in_flight
+
+
+def test_format_executor(executor):
+    with concurrent.futures.ThreadPoolExecutor(1) as format_executor:
+        future = _function(3).submit_build(
+            executor=executor, format_executor=format_executor
+        )
+        assert future.result(30)(1) == 4
@@ -0,0 +1,56 @@
+import importlib.util
+import json
+import os
+
+import pytest
+
+SUITE_PATH = os.path.join(os.path.dirname(__file__), "..", "benchmarks", "suite.py")
+
+
+@pytest.fixture(scope="module")
+def suite():
+    spec = importlib.util.spec_from_file_location("benchmark_suite", SUITE_PATH)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def _results(**timings):
+    return {"results": {"flat_script": {"size": 10, **timings}}}
+
+
+@pytest.mark.parametrize(
+    "name", ["wide_class", "deep_nesting", "small_functions", "flat_script"]
+)
+def test_generators_produce_valid_code(suite, name):
+    tree = suite.GENERATORS[name](5)
+    compile(tree.generate_code(format_with_black=False), "<test>", "exec")
+
+
+@pytest.mark.parametrize("quick", [False, True])
+def test_sizes_compile(suite, quick):
+    # The compile phase of the suite must not fail (ex: too deep indentation)
+    for name, sizes in suite.SIZES.items():
+        tree = suite.GENERATORS[name](sizes[quick])
+        compile(tree.generate_code(format_with_black=False), "<test>", "exec")
+
+
+def test_compare(suite):
+    baseline = _results(render=1.0, black=1.0, exec=0.0001)
+    current = _results(render=1.1, black=1.5, exec=0.0009)
+    assert suite.compare(baseline, current) == [("flat_script", "black", 1.0, 1.5)]
+    assert suite.compare(baseline, current, threshold=0.05) == [
+        ("flat_script", "render", 1.0, 1.1),
+        ("flat_script", "black", 1.0, 1.5),
+    ]
+
+
+def test_compare_command(suite, tmp_path, capsys):
+    baseline = tmp_path / "baseline.json"
+    current = tmp_path / "current.json"
+    baseline.write_text(json.dumps(_results(render=1.0)))
+    current.write_text(json.dumps(_results(render=2.0)))
+
+    assert suite.main(["compare", str(baseline), str(current)]) == 1
+    assert "flat_script.render" in capsys.readouterr().out
+    assert suite.main(["compare", str(current), str(baseline)]) == 0
@@ -0,0 +1,58 @@
+import traceback
+
+import codeg
+import pytest
+
+
+@pytest.fixture
+def code_cache():
+    codeg.code_cache.clear()
+    yield codeg.code_cache
+    codeg.code_cache.clear()
+
+
+def _pieces(n):
+    pieces = [codeg.function(f"f{i}", ["x"]).ret(f"x + {i}") for i in range(n)]
+    code_cls = codeg.cls("A")
+    code_cls.method("double", ["x"]).ret("x * 2")
+    pieces.append(code_cls)
+    return pieces
+
+
+@pytest.mark.parametrize("formatter", [None, "native"])
+def test_build_many(code_cache, formatter):
+    pieces = _pieces(100)
+    objects = codeg.build_many(pieces, formatter=formatter)
+
+    assert list(objects) == pieces
+    assert [objects[piece](1) for piece in pieces[:-1]] == list(range(1, 101))
+    assert objects[pieces[-1]]().double(3) == 6
+    # Only one compilation unit
+    assert code_cache.stats().misses == 1
+    assert len({f.__code__.co_filename for f in list(objects.values())[:-1]}) == 1
+
+
+def test_build_many_globals():
+    piece = codeg.function("f").ret("y")
+    objects = codeg.build_many([piece], {"y": 5})
+    assert objects[piece]() == 5
+
+
+def test_name_clash():
+    with pytest.raises(ValueError, match="'f'"):
+        codeg.build_many([codeg.function("f"), codeg.cls("f")])
+
+
+def test_piece_without_name():
+    with pytest.raises(ValueError):
+        codeg.build_many([codeg.line("x = 1")])
+
+
+def test_traceback_show_piece_lines():
+    pieces = [codeg.function("f").ret("1"), codeg.function("g").ret("1 / 0")]
+    g = codeg.build_many(pieces)[pieces[1]]
+    try:
+        g()
+    except ZeroDivisionError:
+        formatted = traceback.format_exc()
+    assert "return 1 / 0" in formatted
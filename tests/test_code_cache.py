@@ -0,0 +1,85 @@
+import linecache
+
+import codeg
+import pytest
+
+
+@pytest.fixture
+def code_cache():
+    maxsize = codeg.code_cache.maxsize
+    codeg.code_cache.clear()
+    yield codeg.code_cache
+    codeg.code_cache.clear()
+    codeg.code_cache.maxsize = maxsize
+    codeg.code_cache.enabled = True
+
+
+def test_identical_sources_share_code_object(code_cache):
+    f1 = codeg.function("f").ret("5").build()
+    f2 = codeg.function("f").ret("5").build()
+
+    assert f1 is not f2
+    assert f1.__code__ is f2.__code__
+    assert f1() == f2() == 5
+    assert code_cache.stats().hits == 1
+    assert code_cache.stats().misses == 1
+
+
+def test_different_sources_are_compiled(code_cache):
+    f1 = codeg.function("f").ret("5").build()
+    f2 = codeg.function("f").ret("6").build()
+
+    assert f1.__code__ is not f2.__code__
+    assert (f1(), f2()) == (5, 6)
+    assert code_cache.stats().misses == 2
+
+
+def test_cache_hit_keeps_linecache(code_cache):
+    source = "def f():\n    return 5\n"
+    codeg.build(source)
+    f = codeg.build(source)["f"]
+
+    filename = f.__code__.co_filename
+    linecache.cache.pop(filename)
+    codeg.build(source)
+    assert linecache.getline(filename, 2) == "    return 5\n"
+
+
+def test_explicit_filename_is_part_of_the_key(code_cache):
+    source = "def f():\n    return 5\n"
+    f1 = codeg.build(source, filename="<a>")["f"]
+    f2 = codeg.build(source, filename="<b>")["f"]
+
+    assert f1.__code__.co_filename == "<a>"
+    assert f2.__code__.co_filename == "<b>"
+
+
+def test_eviction(code_cache):
+    code_cache.maxsize = 2
+    for i in range(5):
+        codeg.build(f"x = {i}")
+
+    stats = code_cache.stats()
+    assert stats.size == 2
+    assert stats.evictions == 3
+    assert stats.misses == 5
+
+    # shrinking the cache evict the oldest entries
+    code_cache.maxsize = 1
+    assert len(code_cache) == 1
+    assert code_cache.stats().evictions == 4
+
+
+def test_disabled_cache(code_cache):
+    code_cache.enabled = False
+    f1 = codeg.function("f").ret("5").build()
+    f2 = codeg.function("f").ret("5").build()
+
+    assert f1.__code__ is not f2.__code__
+    assert len(code_cache) == 0
+    assert code_cache.stats().hits == 0
+
+
+def test_negative_maxsize(code_cache):
+    with pytest.raises(ValueError):
+        code_cache.maxsize = -1
@@ -0,0 +1,130 @@
+import linecache
+import os
+
+import codeg
+import codeg.codeg
+import pytest
+
+
+@pytest.fixture
+def disk_cache(tmp_path):
+    codeg.code_cache.clear()
+    cache = codeg.set_cache_dir(tmp_path / "cache")
+    yield cache
+    codeg.set_cache_dir(None)
+    codeg.code_cache.clear()
+
+
+def _new_process():
+    """Simulate a new process: the memory cache is empty"""
+    codeg.code_cache.clear()
+
+
+def _cache_files(cache):
+    return [e for e in os.listdir(cache.directory) if e.endswith(cache.suffix)]
+
+
+def test_build_reuse_disk_cache(disk_cache, monkeypatch):
+    f = codeg.function("f", ["x"]).ret("x * 2").build()
+    assert f(2) == 4
+    assert disk_cache.stats().misses == 1
+    assert _cache_files(disk_cache)
+
+    _new_process()
+
+    def fail(*args, **kwargs):
+        raise AssertionError("black must not be called")
+
+    monkeypatch.setattr(codeg.codeg, "format_string_with_black", fail)
+    monkeypatch.setattr(codeg.codeg, "compile", fail, raising=False)
+    f = codeg.function("f", ["x"]).ret("x * 2").build()
+    assert f(3) == 6
+    assert disk_cache.stats().hits == 1
+
+
+def test_build_source_reuse_disk_cache(disk_cache):
+    source = "def f():\n    return 1 / 0\n"
+    codeg.build(source)
+    _new_process()
+
+    f = codeg.build(source)["f"]
+    assert disk_cache.stats().hits == 1
+
+    # The loaded code get a new filename registered in linecache
+    filename = f.__code__.co_filename
+    assert linecache.getline(filename, 2) == "    return 1 / 0\n"
+
+    f = codeg.build(source, filename="<explicit>")["f"]
+    assert f.__code__.co_filename == "<explicit>"
+
+
+def test_corrupted_file_is_ignored(disk_cache):
+    source = "x = 5\n"
+    codeg.build(source)
+    for name in _cache_files(disk_cache):
+        with open(os.path.join(disk_cache.directory, name), "wb") as f:
+            f.write(b"garbage")
+
+    _new_process()
+    assert codeg.build(source)["x"] == 5
+
+
+def test_no_temporary_files_left(disk_cache):
+    for i in range(5):
+        codeg.build(f"x = {i}\n")
+
+    assert len(os.listdir(disk_cache.directory)) == 5
+    assert len(_cache_files(disk_cache)) == 5
+
+
+def test_prune_least_recently_used(disk_cache):
+    codeg.build("x = 0\n")
+    size = os.path.getsize(
+        os.path.join(disk_cache.directory, _cache_files(disk_cache)[0])
+    )
+    # Sizes differ a little with the length of the generated filenames
+    disk_cache.max_size = int(size * 3.5)
+
+    for i in range(1, 6):
+        codeg.build(f"x = {i}\n")
+        # Make sure mtimes are ordered
+        for name in _cache_files(disk_cache):
+            path = os.path.join(disk_cache.directory, name)
+            st = os.stat(path)
+            os.utime(path, (st.st_atime - 1, st.st_mtime - 1))
+
+    assert len(_cache_files(disk_cache)) == 3
+    assert disk_cache.stats().evictions == 3
+
+    _new_process()
+    codeg.build("x = 5\n")
+    assert disk_cache.stats().hits == 1
+    codeg.build("x = 0\n")
+    assert disk_cache.stats().misses == 7
+
+
+def test_disable_disk_cache(tmp_path):
+    codeg.set_cache_dir(tmp_path)
+    codeg.set_cache_dir(None)
+    codeg.build("x = 1\n")
+    assert os.listdir(tmp_path) == []
+
+
+def _directory_size(cache):
+    return sum(e.stat().st_size for e in os.scandir(cache.directory))
+
+
+def test_code_and_format_caches_share_max_size(disk_cache):
+    format_disk = codeg.format_cache.disk
+    codeg.format_cache.clear()
+    try:
+        codeg.function("f").ret("0").build()
+        max_size = disk_cache.max_size = format_disk.max_size = int(
+            _directory_size(disk_cache) * 5.5
+        )
+        for i in range(1, 20):
+            codeg.function("f").ret(str(i)).build()
+            assert _directory_size(disk_cache) <= max_size
+    finally:
+        codeg.format_cache.clear()
+    assert _cache_files(disk_cache) and _cache_files(format_disk)
@@ -0,0 +1,112 @@
+import sys
+
+import codeg
+import codeg.dispatchers
+import pytest
+
+# match statements need python 3.10
+MATCH = pytest.param(
+    "match",
+    marks=pytest.mark.skipif(sys.version_info < (3, 10), reason="python < 3.10"),
+)
+STRATEGIES = ("if", MATCH, "bisect", "table")
+
+
+def _cases(n):
+    return {i * 3: f"return x + {i}" for i in range(n)}
+
+
+@pytest.mark.parametrize("strategy", STRATEGIES)
+@pytest.mark.parametrize("n", [0, 1, 5, 40])
+def test_strategies(strategy, n):
+    f = codeg.dispatch("f", ["kind", "x"], "kind", _cases(n), "return -1", strategy)
+    f = f.build()
+    for i in range(n):
+        assert f(i * 3, 10) == 10 + i
+    assert f(1, 10) == -1
+    assert f(-3, 10) == -1
+    assert f(n * 3, 10) == -1
+
+
+@pytest.mark.parametrize("strategy", ["if", MATCH, "table"])
+def test_str_keys_and_bodies(strategy):
+    code_body = codeg.script()
+    code_body.line("y = x * 2")
+    code_body.ret("y")
+    cases = {"double": code_body, "lines": ["y = x + 1", "return y"], None: "return 0"}
+    f = codeg.dispatch("f", ["kind", "x"], "kind", cases, strategy=strategy).build()
+    assert f("double", 3) == 6
+    assert f("lines", 3) == 4
+    assert f(None, 3) == 0
+    # No default: None
+    assert f("other", 3) is None
+
+
+def test_auto():
+    def strategy(cases):
+        return codeg.dispatch("f", ["kind"], "kind", cases).strategy
+
+    assert strategy(_cases(codeg.dispatchers.IF_CHAIN_MAX)) == "if"
+    assert strategy(_cases(20)) == "bisect"
+    assert strategy({str(i): "return 1" for i in range(20)}) == "table"
+    assert strategy(_cases(1000)) == "table"
+
+
+def test_invalid():
+    with pytest.raises(ValueError):
+        codeg.dispatch("f", ["k"], "k", {}, strategy="unknown")
+    with pytest.raises(TypeError):
+        codeg.dispatch("f", ["k"], "k", {"a": "return 1"}, strategy="bisect")
+    with pytest.raises(TypeError):
+        codeg.dispatch("f", ["k"], "k", {(1, 2): "return 1"})
+
+
+def test_in_script_native_same_as_black():
+    code_script = codeg.script()
+    code_script.import_("os")
+    parameters = ["kind", "x"]
+    code_script.add(
+        codeg.dispatch("f", parameters, "kind", _cases(20), strategy="table")
+    )
+    code_script.add(codeg.dispatch("g", parameters, "kind", _cases(20), "return 0"))
+    assert code_script.generate_code(formatter="native") == code_script.generate_code()
+    namespace = code_script.build()
+    assert namespace["f"](3, 1) == 2
+    assert namespace["f"](4, 1) is None
+    assert namespace["g"](4, 1) == 0
+
+
+@pytest.mark.parametrize("strategy", STRATEGIES)
+def test_from_ast(strategy):
+    code_script = codeg.script()
+    code_script.add(
+        codeg.dispatch("f", ["kind", "x"], "kind", _cases(20), "return -1", strategy)
+    )
+    code_script.line("y = 1")
+    namespace = code_script.build(from_ast=True)
+    assert namespace["f"](3, 10) == 11
+    assert namespace["f"](4, 10) == -1
+    assert namespace["y"] == 1
+
+
+@pytest.mark.parametrize("n", [codeg.dispatchers.IF_CHAIN_MAX, 9, 40, 1000])
+def test_other_subject_types(n):
+    f = codeg.dispatch("f", ["kind", "x"], "kind", _cases(n), "return -1").build()
+    assert f("x", 10) == -1
+    assert f(None, 10) == -1
+    # bool is an int, as in the if/elif chains
+    assert f(False, 10) == 10
+
+
+@pytest.mark.parametrize("strategy", STRATEGIES)
+def test_in_class(strategy):
+    code_cls = codeg.cls("A")
+    parameters = ["self", "kind", "x"]
+    code_cls.add(
+        codeg.dispatch("f", parameters, "kind", _cases(20), "return 0", strategy)
+    )
+    code_cls.add(codeg.dispatch("g", parameters, "kind", _cases(20)))
+    a = code_cls.build()()
+    assert a.f(3, 10) == 11
+    assert a.f(4, 10) == 0
+    assert a.g(6, 10) == 12
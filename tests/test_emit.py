@@ -0,0 +1,102 @@
+import importlib
+import importlib.util
+import os
+import sys
+
+import codeg
+import pytest
+
+
+@pytest.fixture
+def package_dir(tmp_path, monkeypatch):
+    monkeypatch.syspath_prepend(str(tmp_path))
+    yield tmp_path / "generated_pkg"
+    for name in list(sys.modules):
+        if name.startswith("generated_pkg"):
+            del sys.modules[name]
+
+
+def _modules(value=1):
+    code_user = codeg.script()
+    code_user.import_("dataclasses")
+    code_cls = code_user.cls("User")
+    code_cls.annotation("name", str)
+    code_cls.method("value").ret(str(value))
+
+    code_init = codeg.script()
+    code_init.line("VERSION = 1")
+    return {
+        "__init__": code_init,
+        "models.user": code_user,
+        "helpers": codeg.function("helper").ret("42"),
+    }
+
+
+def test_write_and_import(package_dir):
+    written = codeg.write_package(package_dir, _modules(), stubs=True)
+    assert {os.path.relpath(e, package_dir) for e in written} == {
+        "__init__.py",
+        "__init__.pyi",
+        "models/__init__.py",
+        "models/user.py",
+        "models/user.pyi",
+        "helpers.py",
+        "helpers.pyi",
+    }
+
+    user = importlib.import_module("generated_pkg.models.user")
+    assert user.User().value() == 1
+    assert importlib.import_module("generated_pkg").VERSION == 1
+    assert "def value(self): ..." in (package_dir / "models/user.pyi").read_text()
+
+    pyc = importlib.util.cache_from_source(str(package_dir / "models" / "user.py"))
+    assert os.path.exists(pyc)
+
+
+def test_only_changed_files_are_written(package_dir):
+    codeg.write_package(package_dir, _modules())
+    user_path = package_dir / "models" / "user.py"
+    pyc = importlib.util.cache_from_source(str(user_path))
+    mtimes = (os.stat(user_path).st_mtime_ns, os.stat(pyc).st_mtime_ns)
+
+    assert codeg.write_package(package_dir, _modules()) == []
+    assert (os.stat(user_path).st_mtime_ns, os.stat(pyc).st_mtime_ns) == mtimes
+
+    written = codeg.write_package(package_dir, _modules(value=2))
+    assert written == [str(user_path)]
+    assert importlib.import_module("generated_pkg.models.user").User().value() == 2
+
+
+def test_missing_pyc_is_compiled(package_dir):
+    codeg.write_package(package_dir, _modules())
+    pyc = importlib.util.cache_from_source(str(package_dir / "helpers.py"))
+    os.unlink(pyc)
+    codeg.write_package(package_dir, _modules())
+    assert os.path.exists(pyc)
+
+
+def test_no_precompile(package_dir):
+    codeg.write_package(package_dir, _modules(), precompile=False)
+    assert not os.path.exists(package_dir / "__pycache__")
+
+
+def test_module_with_submodules(package_dir):
+    modules = {
+        "models.user": codeg.cls("User"),
+        "models": codeg.cls("A"),
+    }
+    written = codeg.write_package(package_dir, modules, stubs=True)
+    assert {os.path.relpath(e, package_dir) for e in written} == {
+        "__init__.py",
+        "models/__init__.py",
+        "models/__init__.pyi",
+        "models/user.py",
+        "models/user.pyi",
+    }
+    assert importlib.import_module("generated_pkg.models").A
+    assert importlib.import_module("generated_pkg.models.user").User
+
+    with pytest.raises(ValueError, match="twice"):
+        codeg.write_package(
+            package_dir, {"models": codeg.cls("A"), "models.__init__": codeg.cls("B")}
+        )
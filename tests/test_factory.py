@@ -0,0 +1,68 @@
+import linecache
+import traceback
+
+import codeg
+import pytest
+
+
+def _scale():
+    code_f = codeg.function("scale", ["x", codeg.param("offset", default=0)])
+    code_f.ret("x * factor + offset")
+    return code_f
+
+
+def test_functions_share_code():
+    factory = _scale().build_factory(["factor"])
+    double = factory(factor=2)
+    triple = factory(factor=3, name="triple")
+
+    assert double(5) == 10
+    assert triple(5, offset=1) == 16
+    assert double.__code__ is triple.__code__
+    assert (double.__name__, triple.__name__) == ("scale", "triple")
+    assert double.__qualname__ == "scale"
+
+
+def test_defaults_and_globals():
+    code_f = codeg.function("f", ["x", codeg.param("y", default=1)])
+    code_f.ret("x + y + constant")
+    factory = code_f.build_factory(globals={"constant": 100})
+
+    assert factory()(1) == 102
+    assert factory(defaults=(10,))(1) == 111
+    assert factory(globals={"constant": 0})(1) == 2
+    assert factory.freevars == ()
+
+
+def test_keyword_only_defaults():
+    code_f = codeg.function("f", ["x", codeg.param("y", default=1, kw_only=True)])
+    code_f.ret("x + y")
+    factory = code_f.build_factory()
+    assert factory()(1) == 2
+    assert factory(kwdefaults={"y": 5})(1) == 6
+
+
+def test_closure_arguments():
+    factory = _scale().build_factory(["factor", "unused"])
+    with pytest.raises(TypeError, match="Missing"):
+        factory(factor=2)
+    with pytest.raises(TypeError, match="Unknown"):
+        factory(factor=2, unused=1, other=3)
+    assert factory(factor=2, unused=None)(1) == 2
+
+
+@pytest.mark.parametrize("formatter", [None, "native"])
+def test_traceback_shows_source(formatter):
+    code_f = codeg.function("f", ["x"]).ret("x / divisor")
+    f = code_f.build_factory(["divisor"], formatter=formatter)(divisor=0)
+    try:
+        f(1)
+    except ZeroDivisionError:
+        formatted = traceback.format_exc()
+    assert "return x / divisor" in formatted
+    assert linecache.getline(f.__code__.co_filename, f.__code__.co_firstlineno)
+
+
+def test_decorators_not_supported():
+    with pytest.raises(ValueError):
+        codeg.function("f").decorator("staticmethod").build_factory()
@@ -0,0 +1,68 @@
+import codeg
+import codeg.codeg
+import pytest
+
+
+@pytest.fixture
+def format_cache():
+    codeg.format_cache.clear()
+    yield codeg.format_cache
+    codeg.format_cache.clear()
+    codeg.format_cache.enabled = True
+
+
+@pytest.fixture
+def count_black(monkeypatch):
+    import black
+
+    calls = []
+    format_str = black.format_str
+
+    def counted_format_str(*args, **kwargs):
+        calls.append(args)
+        return format_str(*args, **kwargs)
+
+    monkeypatch.setattr(black, "format_str", counted_format_str)
+    return calls
+
+
+def test_identical_sources_are_formatted_once(format_cache, count_black):
+    code_f = codeg.function("f", ["x"]).ret("x*2")
+    code = code_f.generate_code()
+    assert code_f.generate_code() == code
+    assert code_f.generate_code(format_with_black=False) != code
+
+    assert len(count_black) == 1
+    assert format_cache.stats().hits == 1
+
+
+def test_stub_is_part_of_the_key(format_cache, count_black):
+    code_cls = codeg.cls("A")
+    code_cls.method("f").ret("1")
+    code = code_cls.generate_code()
+    stub = code_cls.generate_stubcode()
+
+    assert code != stub
+    assert len(count_black) == 2
+
+
+def test_disabled(format_cache, count_black):
+    format_cache.enabled = False
+    for _ in range(2):
+        codeg.format_string_with_black("x=1")
+    assert len(count_black) == 2
+    assert len(format_cache) == 0
+
+
+def test_disk_tier(format_cache, count_black, tmp_path):
+    codeg.set_cache_dir(tmp_path)
+    try:
+        assert codeg.format_string_with_black("x=1") == "x = 1\n"
+        # New process
+        format_cache.clear()
+        assert codeg.format_string_with_black("x=1") == "x = 1\n"
+        assert format_cache.disk.stats().hits == 1
+    finally:
+        codeg.set_cache_dir(None)
+    assert len(count_black) == 1
+    assert format_cache.disk is None
@@ -0,0 +1,166 @@
+import codeg
+
+
+def _unformatted(piece):
+    return piece.generate_code(format_with_black=False)
+
+
+def _expected(piece):
+    return "\n".join(piece.iter_lines())
+
+
+def test_modification_after_generation():
+    code_cls = codeg.cls("A")
+    method = code_cls.method("f")
+    assert _unformatted(code_cls) == "class A:\n    def f(self):\n        pass"
+
+    method.line("return 1")
+    assert _unformatted(code_cls) == "class A:\n    def f(self):\n        return 1"
+
+    code_cls.method("g").decorator("property")
+    assert _unformatted(code_cls) == _expected(code_cls)
+    assert "@property" in _unformatted(code_cls)
+
+
+def test_modification_of_siblings():
+    code_function = codeg.function("f", ["x"])
+    code_if = code_function.if_("x")
+    code_if.ret("1")
+    code_else = code_if.else_()
+    _unformatted(code_function)
+
+    code_else.for_("i", "x").line("print(i)")
+    code_for = code_else.pieces[0]
+    assert _unformatted(code_function) == _expected(code_function)
+
+    code_for.line("print(i * 2)")
+    assert "print(i * 2)" in _unformatted(code_function)
+    assert _unformatted(code_function) == _expected(code_function)
+
+    code_try = code_function.try_()
+    _unformatted(code_function)
+    code_try.except_("ValueError").line("pass")
+    code_try.finally_().line("print('done')")
+    assert _unformatted(code_function) == _expected(code_function)
+
+
+def test_only_modified_pieces_are_generated_again(monkeypatch):
+    code_cls = codeg.cls("A")
+    methods = [code_cls.method(f"m{i}", ["x"]).ret("x") for i in range(100)]
+    _unformatted(code_cls)
+
+    calls = []
+    original = codeg.FunctionBlock.generate_atomic_script
+
+    def counting(self):
+        calls.append(self.name)
+        return original(self)
+
+    monkeypatch.setattr(codeg.FunctionBlock, "generate_atomic_script", counting)
+    methods[50].line("y = x")
+    code_cls.method("new")
+    _unformatted(code_cls)
+    assert calls == ["m50", "new"]
+
+    calls.clear()
+    _unformatted(code_cls)
+    assert calls == []
+    assert _unformatted(code_cls) == _expected(code_cls)
+
+
+def test_shared_piece_invalidate_all_parents():
+    code_import = codeg.import_("math")
+    script1 = codeg.script()
+    script1._add_piece(code_import)
+    script2 = codeg.script()
+    script2._add_piece(code_import)
+    assert _unformatted(script1) == _unformatted(script2) == "import math"
+
+    code_import.libs.append("sys")
+    code_import.invalidate()
+    assert _unformatted(script1) == _unformatted(script2) == "import math, sys"
+
+
+def test_different_indent_and_stub():
+    code_cls = codeg.cls("A")
+    code_cls.method("f")
+    assert code_cls.generate_code(stub=True) == "class A:\n    def f(self): ...\n"
+    assert code_cls.generate_code() == "class A:\n    def f(self):\n        pass\n"
+
+
+def test_deep_trees_are_not_fully_cached():
+    code_script = codeg.script()
+    block = code_script
+    for i in range(50):
+        block = block.if_(f"x > {i}")
+    block.line("y = 1")
+
+    assert _unformatted(code_script) == _expected(code_script)
+    # Empty cache (see _render)
+    assert code_script._fragments == {}
+    assert block._fragments
+
+
+def test_direct_modifications():
+    f = codeg.function("f")
+    assert _unformatted(f) == "def f():\n    pass"
+
+    f.pieces.append("return 1")
+    assert _unformatted(f) == "def f():\n    return 1"
+    f.name = "g"
+    assert _unformatted(f) == "def g():\n    return 1"
+    f.parameters.append(codeg.parameter("x"))
+    assert _unformatted(f) == "def g(x):\n    return 1"
+    f.decorators.insert(0, "staticmethod")
+    assert _unformatted(f) == "@staticmethod\ndef g(x):\n    return 1"
+    f.parameters = ["y"]
+    f.decorators.clear()
+    assert _unformatted(f) == "def g(y):\n    return 1"
+    # Assigned lists are copied
+    parameters = ["z"]
+    f.parameters = parameters
+    parameters.append("w")
+    assert _unformatted(f) == "def g(z):\n    return 1"
+
+
+def test_direct_modifications_of_pieces():
+    code_script = codeg.script()
+    g = code_script.function("g")
+    g.ret("1")
+    assert code_script.build()["g"]() == 1
+
+    g.pieces[0] = "return 2"
+    assert code_script.build()["g"]() == 2
+
+    del g.pieces[0]
+    code_if = g.if_("False")
+    code_if.line("return 3")
+    code_if.else_().line("return 4")
+    assert code_script.build()["g"]() == 4
+    code_else = code_if.sibling_pieces.pop()
+    assert "else:" not in _unformatted(code_script)
+    code_if.sibling_pieces.append(code_else)
+    code_else.pieces[0] = "return 5"
+    assert code_script.build()["g"]() == 5
+
+    g.pieces[:] = ["return 2"]
+    assert code_script.build()["g"]() == 2
+    code_other = codeg.function("h").ret("6")
+    code_script.pieces = [g, code_other]
+    assert code_script.build()["h"]() == 6
+    code_other.pieces.append("return 7")
+    code_other.pieces.pop(0)
+    assert code_script.build()["h"]() == 7
+
+
+def test_header_lists():
+    code_import = codeg.import_("math")
+    code_script = codeg.script()
+    code_script._add_piece(code_import)
+    assert _unformatted(code_script) == "import math"
+    code_import.libs += ["sys"]
+    assert _unformatted(code_script) == "import math, sys"
+    code_import.libs.sort(reverse=True)
+    assert _unformatted(code_script) == "import sys, math"
+    del code_import.libs[0]
+    assert _unformatted(code_script) == "import math"
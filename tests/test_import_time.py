@@ -0,0 +1,71 @@
+import os
+import subprocess
+import sys
+import time
+
+import codeg
+import pytest
+
+# Budget of a cold `import codeg`, in number of starts of an empty interpreter
+# (measured: ~5, mostly attrs). Loading asyncio or black eagerly blows it
+IMPORT_TIME_RATIO = 6
+
+
+def _run_python(*args, env=None):
+    env = dict(os.environ if env is None else env)
+    src_dir = os.path.dirname(os.path.dirname(codeg.__file__))
+    env["PYTHONPATH"] = os.pathsep.join([src_dir, env.get("PYTHONPATH", "")])
+    return subprocess.run(
+        [sys.executable, *args],
+        env=env,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        universal_newlines=True,
+        check=True,
+    )
+
+
+@pytest.fixture(scope="module")
+def bytecode_env(tmp_path_factory):
+    """Environment caching the bytecode in a temporary directory, so imports
+    are measured without compiling the sources"""
+    env = dict(os.environ)
+    env.pop("PYTHONDONTWRITEBYTECODE", None)
+    env["PYTHONPYCACHEPREFIX"] = str(tmp_path_factory.mktemp("pycache"))
+    _run_python("-c", "import codeg", env=env)
+    return env
+
+
+def _start_time(code: str, env, repeat: int = 10) -> float:
+    """Best duration of running code in a new interpreter"""
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        _run_python("-c", code, env=env)
+        duration = time.perf_counter() - start
+        best = duration if best is None else min(best, duration)
+    return best
+
+
+@pytest.mark.parametrize("module", ["black", "asyncio", "concurrent.futures"])
+def test_import_does_not_load(module):
+    result = _run_python("-c", f"import sys, codeg; print({module!r} in sys.modules)")
+    assert result.stdout.strip() == "False"
+
+
+def test_generate_without_black_does_not_load_black():
+    result = _run_python(
+        "-c",
+        "import sys, codeg;"
+        "source = codeg.function('f').ret('5').generate_code(format_with_black=False);"
+        "f = codeg.build(source)['f'];"
+        "print(f(), 'black' in sys.modules)",
+    )
+    assert result.stdout.strip() == "5 False"
+
+
+def test_import_time_budget(bytecode_env):
+    empty = _start_time("pass", bytecode_env)
+    with_codeg = _start_time("import codeg", bytecode_env)
+    ratio = with_codeg / empty
+    assert ratio < IMPORT_TIME_RATIO, f"import codeg took {ratio:.1f} empty starts"
@@ -0,0 +1,74 @@
+import importlib
+import inspect
+import sys
+import traceback
+
+import codeg
+import pytest
+
+
+@pytest.fixture
+def generated():
+    calls = []
+
+    def generate(name):
+        calls.append(name)
+        if name == "ourgen.foo":
+            code_script = codeg.script()
+            code_script.line("VALUE = 1")
+            code_script.function("fail").line("raise ValueError('fail')")
+            return code_script
+        if name == "ourgen.sub.bar":
+            return codeg.function("bar").ret("'bar'")
+        return None
+
+    importer = codeg.register_importer(
+        "ourgen", generate, is_package=lambda name: name == "ourgen.sub"
+    )
+    yield calls
+    importer.unregister()
+    for name in list(sys.modules):
+        if name == "ourgen" or name.startswith("ourgen."):
+            del sys.modules[name]
+
+
+def test_import(generated):
+    import ourgen.foo
+
+    assert ourgen.foo.VALUE == 1
+    assert generated == ["ourgen", "ourgen.foo"]
+    assert ourgen.foo.__file__ == "<codeg ourgen.foo>"
+    assert ourgen.__path__ == []
+
+    # Cached in sys.modules
+    assert importlib.import_module("ourgen.foo") is ourgen.foo
+    assert generated == ["ourgen", "ourgen.foo"]
+
+    from ourgen.sub import bar
+
+    assert bar.bar() == "bar"
+
+
+def test_missing_module(generated):
+    with pytest.raises(ModuleNotFoundError):
+        import ourgen.missing  # noqa: F401
+    with pytest.raises(ModuleNotFoundError):
+        import ourgen.foo.bar  # noqa: F401
+
+
+def test_source_and_traceback(generated):
+    import ourgen.foo
+
+    assert "VALUE = 1" in inspect.getsource(ourgen.foo)
+    with pytest.raises(ValueError) as info:
+        ourgen.foo.fail()
+    formatted = "".join(traceback.format_tb(info.tb))
+    assert "raise ValueError" in formatted
+
+
+def test_unregister(generated):
+    importer = next(e for e in sys.meta_path if isinstance(e, codeg.GeneratedImporter))
+    importer.unregister()
+    importer.unregister()
+    with pytest.raises(ModuleNotFoundError):
+        import ourgen  # noqa: F401
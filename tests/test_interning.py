@@ -0,0 +1,109 @@
+import codeg
+
+
+def _tree(n):
+    code_script = codeg.script()
+    for i in range(n):
+        code_f = code_script.function(f"f{i}", ["x"])
+        code_if = code_f.if_("x > 0")
+        code_if.line("x -= 1")
+        code_if.else_().line("x += 1")
+        code_for = code_f.for_("i", "range(x)")
+        code_for.line("print(i)")
+        code_f.ret("x")
+    return code_script
+
+
+def test_identical_subtrees_are_shared():
+    tree = _tree(50)
+    expected = tree.generate_code(format_with_black=False)
+
+    interner = codeg.Interner()
+    assert interner.intern(tree) is tree
+    assert tree.generate_code(format_with_black=False) == expected
+    assert tree.generate_code(formatter="native") == _tree(50).generate_code(
+        formatter="native"
+    )
+
+    ifs = [f.pieces[0] for f in tree.pieces]
+    assert all(e is ifs[0] for e in ifs)
+    assert {id(e) for e in ifs[0]._parents} == {id(f) for f in tree.pieces}
+    # The functions have different names, their for loops are shared
+    assert len({id(f) for f in tree.pieces}) == 50
+    assert len({id(f.pieces[1]) for f in tree.pieces}) == 1
+    # if + else + for, and the functions
+    assert len(interner) == 53
+
+
+def test_different_subtrees_are_kept():
+    tree = codeg.script()
+    tree.if_("x").line("a = 1")
+    tree.if_("x").line("a = 2")
+    tree.if_("y").line("a = 1")
+    tree.for_("x", "y").line("a = 1")
+    codeg.intern_tree(tree)
+    assert len({id(e) for e in tree.pieces}) == 4
+
+
+def test_lines_are_shared():
+    tree = codeg.script()
+    for i in range(3):
+        tree.line("".join(["x = ", "1"]))
+    codeg.intern_tree(tree)
+    assert tree.pieces[0] is tree.pieces[1] is tree.pieces[2]
+
+
+def test_interner_shared_by_trees():
+    interner = codeg.Interner()
+    tree_1 = interner.intern(_tree(2))
+    tree_2 = interner.intern(_tree(3))
+    assert tree_1.pieces[0].pieces[0] is tree_2.pieces[2].pieces[0]
+
+
+def test_cached_code_after_interning():
+    tree_1 = _tree(3)
+    tree_2 = _tree(3)
+    tree_2.pieces[0].pieces[0].pieces[0] = "x -= 2"
+    tree_2.pieces[0].pieces[0].invalidate()
+    expected = [
+        tree.generate_code(format_with_black=False) for tree in (tree_1, tree_2)
+    ]
+
+    interner = codeg.Interner()
+    interner.intern(tree_1)
+    interner.intern(tree_2)
+    assert [
+        tree.generate_code(format_with_black=False) for tree in (tree_1, tree_2)
+    ] == expected
+
+
+def test_deep_shared_pieces_are_cached():
+    tree = codeg.script()
+    for name in ("f", "g"):
+        piece = tree.function(name)
+        for i in range(10):
+            piece = piece.if_(f"x > {i}")
+        piece.line("pass")
+    codeg.intern_tree(tree)
+    tree.generate_code(format_with_black=False)
+    shared = tree.pieces[0].pieces[0]
+    assert shared is tree.pieces[1].pieces[0]
+    assert shared._fragments is not None
+
+
+def test_modify_deep_piece_of_shared_piece():
+    code_f = codeg.function("f")
+    leaf = code_f
+    for i in range(7):
+        leaf = leaf.if_(f"x > {i}")
+    leaf.line("a = 1")
+    scripts = [codeg.script(), codeg.script()]
+    for code_script in scripts:
+        code_script.add(code_f)
+        code_script.generate_code(format_with_black=False)
+
+    leaf.line("b = 2")
+    for code_script in scripts:
+        code = code_script.generate_code(format_with_black=False)
+        assert code == "\n".join(code_script.iter_lines())
+        assert "b = 2" in code
@@ -0,0 +1,92 @@
+import gc
+import linecache
+import sys
+import traceback
+
+import codeg
+
+
+def test_traceback_show_generated_lines():
+    f = codeg.function("f").line("x = 1").line("return 1 / 0").build()
+    try:
+        f()
+    except ZeroDivisionError:
+        formatted = traceback.format_exc()
+    assert "return 1 / 0" in formatted
+
+
+def test_source_kept_while_function_alive(no_code_cache):
+    f = codeg.function("f").ret("1 / 0").build()
+    filename = f.__code__.co_filename
+
+    assert filename in codeg.linecache_registry
+    assert linecache.getline(filename, 2) == "    return 1 / 0\n"
+
+    del f
+    gc.collect()
+    assert filename not in linecache.cache
+    assert filename not in codeg.linecache_registry
+
+
+def test_source_kept_while_class_alive(no_code_cache):
+    code_cls = codeg.cls("A")
+    code_cls.method("f").ret("1")
+    A = code_cls.build()
+    filename = A.f.__code__.co_filename
+
+    gc.collect()
+    assert filename in linecache.cache
+
+    del A
+    gc.collect()
+    assert filename not in linecache.cache
+
+
+def test_source_kept_while_in_code_cache():
+    codeg.code_cache.clear()
+    f = codeg.function("f").ret("1").build()
+    filename = f.__code__.co_filename
+    del f
+    gc.collect()
+    assert filename in linecache.cache
+
+    codeg.code_cache.clear()
+    gc.collect()
+    assert filename not in linecache.cache
+
+
+def test_filenames_are_reused(no_code_cache):
+    f = codeg.function("f").ret("1").build()
+    filename = f.__code__.co_filename
+    del f
+    gc.collect()
+
+    g = codeg.function("g").ret("2").build()
+    assert g.__code__.co_filename == filename
+    assert linecache.getline(filename, 1) == "def g():\n"
+
+
+def test_explicit_filename_replace_source():
+    f1 = codeg.build("def f():\n    return 1\n", filename="<same>")["f"]  # noqa
+    f2 = codeg.build("def f():\n    return 2\n", filename="<same>")["f"]  # noqa
+    assert linecache.getline("<same>", 2) == "    return 2\n"
+
+
+def test_memory_does_not_grow_with_builds():
+    def run(start, stop):
+        for i in range(start, stop):
+            f = codeg.build(f"def f():\n    return {i}\n")["f"]
+            assert f() == i
+
+    # Warm up, fill the code cache up to its maximum size
+    run(0, 20000)
+    gc.collect()
+    linecache_before = len(linecache.cache)
+    blocks_before = sys.getallocatedblocks()
+
+    run(20000, 100000)
+    gc.collect()
+
+    assert len(linecache.cache) <= linecache_before
+    # Before the registry, each build leaked ~6 blocks (480000 for 80000 builds)
+    assert sys.getallocatedblocks() - blocks_before < 1000
@@ -0,0 +1,66 @@
+import pickle
+import tracemalloc
+
+import codeg
+import pytest
+
+# Budgets in bytes (before __slots__ and lazy lists: 254 per line, 424 per piece)
+BYTES_PER_LINE = 170
+BYTES_PER_PIECE = 280
+
+
+def _tree(n_classes):
+    """10 lines and 6 pieces per class"""
+    code_script = codeg.script()
+    for i in range(n_classes):
+        code_cls = code_script.cls(f"A{i}")
+        code_cls.annotation("x", int)
+        code_f = code_cls.method("f", ["y"])
+        code_if = code_f.if_("y")
+        code_if.line("y += 1")
+        code_if.else_().line("y -= 1")
+        code_f.comment("comment")
+        code_f.ret("y")
+        code_cls.line("z = 1")
+    return code_script
+
+
+def test_memory_per_line_and_piece():
+    n_classes = 5000
+    tracemalloc.start()
+    try:
+        tree = _tree(n_classes)
+        size, _ = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    n_lines = sum(1 for _ in tree.iter_lines())
+    assert n_lines == n_classes * 10
+    assert size / n_lines < BYTES_PER_LINE
+    assert size / (n_classes * 6 + 1) < BYTES_PER_PIECE
+
+
+def test_pieces_are_compact():
+    piece = codeg.comment("comment").pieces[0]
+    assert not hasattr(piece, "__dict__")
+    # Lists are created when needed
+    assert piece._pieces == () and piece._sibling_pieces == ()
+    with pytest.raises(AttributeError):
+        piece.unknown_attribute = 1
+
+
+def test_pieces_lists_are_created_on_access():
+    code_f = codeg.function("f")
+    code_f.pieces.append("return 1")
+    assert code_f.generate_code(format_with_black=False) == "def f():\n    return 1"
+
+
+def test_pickle():
+    tree = _tree(2)
+    code = tree.generate_code(format_with_black=False)
+    copy = pickle.loads(pickle.dumps(tree))
+    assert copy.generate_code(format_with_black=False) == code
+
+    code_cls = copy.pieces[1]
+    code_cls.method("g")
+    assert "def g(self)" in copy.generate_code(format_with_black=False)
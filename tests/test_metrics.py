@@ -0,0 +1,102 @@
+import importlib
+
+import codeg
+import codeg.phases
+import pytest
+
+
+@pytest.fixture(autouse=True)
+def no_cache():
+    codeg.code_cache.clear()
+    codeg.format_cache.clear()
+    yield
+    codeg.metrics.disable()
+    codeg.metrics.reset()
+
+
+def _function():
+    code_f = codeg.function("f", ["x"])
+    code_f.if_("x").ret("1")
+    code_f.ret("2")
+    return code_f
+
+
+def test_build_phases():
+    with codeg.metrics.recording() as records:
+        f = _function().build()
+    assert f(0) == 2
+
+    assert [e.phase for e in records] == [
+        "render",
+        "black",
+        "compile",
+        "linecache",
+        "exec",
+    ]
+    assert all(e.piece_count == 2 for e in records)
+    assert all(e.duration >= 0 for e in records)
+    black_record = records[1]
+    assert black_record.line_count == 4
+    assert black_record.source_size == len(_function().generate_code())
+    assert not codeg.metrics.enabled
+
+
+def test_build_from_ast_phases():
+    with codeg.metrics.recording() as records:
+        _function().build(from_ast=True)
+    assert [e.phase for e in records] == [
+        "render",
+        "lower",
+        "compile",
+        "linecache",
+        "exec",
+    ]
+
+
+def test_build_source_phases():
+    with codeg.metrics.recording() as records:
+        codeg.build("x = 1\n")
+    assert [(e.phase, e.line_count, e.piece_count) for e in records] == [
+        ("compile", 1, 0),
+        ("linecache", 1, 0),
+        ("exec", 0, 0),
+    ]
+
+
+def test_counters():
+    codeg.metrics.enable()
+    for i in range(3):
+        codeg.function("f").ret(str(i)).build()
+    counters = codeg.metrics.counters()
+    assert counters["compile"].count == 3
+    assert counters["compile"].line_count == 6
+    assert counters["render"].piece_count == 3
+
+    codeg.metrics.reset()
+    assert codeg.metrics.counters() == {}
+
+
+def test_hook():
+    records = []
+    codeg.metrics.add_hook(records.append)
+    codeg.function("f").build(formatter="native")
+    codeg.metrics.remove_hook(records.append)
+    codeg.function("g").build(formatter="native")
+    assert "black" not in [e.phase for e in records]
+    assert len(records) == 4
+
+
+def test_disabled_does_not_measure(monkeypatch):
+    def fail(*args, **kwargs):
+        raise AssertionError("metrics are disabled")
+
+    monkeypatch.setattr(codeg.metrics, "record", fail)
+    monkeypatch.setattr(codeg.metrics, "building", fail)
+    _function().build()
+    _function().build(from_ast=True)
+
+
+def test_metrics_is_not_a_module():
+    assert isinstance(codeg.metrics, codeg.phases.Metrics)
+    with pytest.raises(ImportError):
+        importlib.import_module("codeg.metrics")
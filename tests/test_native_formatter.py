@@ -0,0 +1,120 @@
+import time
+
+import codeg
+import pytest
+
+
+def _long_parameters(n):
+    return [codeg.param(f"parameter_{i}", annotation=int, default=i) for i in range(n)]
+
+
+def _script():
+    code_script = codeg.script()
+    code_script.import_("math")
+    code_script.line("x = 1")
+    code_script.comment("comment attached to f")
+    code_f = code_script.function("f", ["x"])
+    code_f.function("g").decorator("property")
+    code_f.line("y = x")
+    code_f.function("h", _long_parameters(4))
+    code_f.ret("x")
+
+    code_cls = code_script.cls("A", ["Base"])
+    code_cls.annotation("name", str)
+    code_cls.method("short")
+    code_cls.comment("comment")
+    code_cls.method("wrapped", _long_parameters(3))
+    code_cls.method("exploded", _long_parameters(10)).ret("1")
+    code_cls.line("y = 2")
+
+    code_script.cls("B")
+    code_script.cls("C", [f"Base{i}" * 3 for i in range(10)])
+    code_script.line("z = 2")
+    code_script.function("last").decorator("decorator")
+    return code_script
+
+
+def test_native_same_as_black():
+    code_script = _script()
+    native = code_script.generate_code(formatter="native")
+    assert native == code_script.generate_code()
+    assert native.count("\n\n\n") > 1
+
+
+def test_native_wrap_long_signatures():
+    code_f = codeg.function("function_with_a_long_name", _long_parameters(3))
+    code = code_f.generate_code(formatter="native")
+    assert code.splitlines()[:3] == [
+        "def function_with_a_long_name(",
+        "    parameter_0: int = 0, parameter_1: int = 1, parameter_2: int = 2",
+        "):",
+    ]
+    code = codeg.function("f", _long_parameters(4)).generate_code(formatter="native")
+    assert code.splitlines()[:3] == [
+        "def f(",
+        "    parameter_0: int = 0,",
+        "    parameter_1: int = 1,",
+    ]
+    for line in _script().generate_code(formatter="native").splitlines():
+        assert len(line) <= codeg.LINE_LENGTH
+
+
+def test_native_stub_same_as_black():
+    code_script = _script()
+    code_script.function("other")
+    code_script.cls("D")
+    code_script.cls("E")
+    assert code_script.generate_stubcode(
+        formatter="native"
+    ) == code_script.generate_stubcode(formatter="black")
+
+
+def test_native_write_code():
+    import io
+
+    fp = io.StringIO()
+    code_script = _script()
+    code_script.write_code(fp, formatter="native")
+    assert fp.getvalue() == code_script.generate_code(formatter="native")
+
+
+def test_native_build(monkeypatch):
+    def fail(*args, **kwargs):
+        raise AssertionError("black must not be called")
+
+    monkeypatch.setattr(codeg.codeg, "format_string_with_black", fail)
+    f = codeg.function("f", _long_parameters(10)).ret("parameter_9")
+    assert f.build(formatter="native")() == 9
+
+
+def test_unknown_formatter():
+    with pytest.raises(ValueError):
+        codeg.function("f").generate_code(formatter="yapf")
+
+
+def test_native_comments_runs():
+    code_script = codeg.script()
+    code_script.line("x = 1")
+    for i in range(3):
+        code_script.comment(f"attached {i}")
+    code_script.function("f")
+    for i in range(3):
+        code_script.comment(f"not attached {i}")
+    code_script.line("y = 2")
+    code_script.comment("last")
+    expected = code_script.generate_code()
+    assert code_script.generate_code(formatter="native") == expected
+
+
+def test_native_comments_linear_time():
+    def duration(n):
+        code_script = codeg.script()
+        for i in range(n):
+            code_script.comment(f"comment {i}")
+        code_script.function("f")
+        start = time.perf_counter()
+        code_script.generate_code(formatter="native")
+        return time.perf_counter() - start
+
+    # Quadratic time would be 100 times slower
+    assert min(duration(20000) for _ in range(3)) < 30 * duration(2000)
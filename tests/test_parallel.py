@@ -0,0 +1,75 @@
+import concurrent.futures
+
+import codeg
+import codeg.parallel
+import pytest
+
+
+@pytest.fixture
+def format_cache():
+    codeg.format_cache.clear()
+    yield codeg.format_cache
+    codeg.format_cache.clear()
+
+
+def _trees(n):
+    trees = []
+    for i in range(n):
+        code_script = codeg.script()
+        code_script.function(f"f{i}", ["x"]).ret(f"x*{i}")
+        trees.append(code_script)
+    return trees
+
+
+def _expected(trees, **kwargs):
+    return [tree.generate_code(**kwargs) for tree in trees]
+
+
+def test_generate_many_in_order(format_cache):
+    trees = _trees(40)
+    expected = _expected(trees)
+    format_cache.clear()
+
+    assert list(codeg.generate_many(trees, workers=2)) == expected
+    # Results of the workers are memoized in the current process
+    assert len(format_cache) == 40
+
+
+def test_generate_many_lazy_input(format_cache):
+    trees = _trees(40)
+    expected = _expected(trees)
+    format_cache.clear()
+
+    results = codeg.generate_many(iter(trees), workers=2)
+    assert next(results) == expected[0]
+    assert list(results) == expected[1:]
+
+
+def test_generate_many_executor(format_cache):
+    trees = _trees(20)
+    expected = _expected(trees, stub=True)
+    format_cache.clear()
+
+    with concurrent.futures.ThreadPoolExecutor(2) as executor:
+        results = codeg.generate_many(trees, stub=True, executor=executor)
+        assert list(results) == expected
+
+
+def test_small_inputs_in_process(format_cache, monkeypatch):
+    def fail(*args, **kwargs):
+        raise AssertionError("no pool for small inputs")
+
+    monkeypatch.setattr(concurrent.futures, "ProcessPoolExecutor", fail)
+    trees = _trees(codeg.PARALLEL_THRESHOLD - 1)
+    assert list(codeg.generate_many(trees, workers=4)) == _expected(trees)
+
+    trees = _trees(codeg.PARALLEL_THRESHOLD * 2)
+    assert list(codeg.generate_many(trees, workers=1)) == _expected(trees)
+    assert list(codeg.generate_many(trees, formatter="native")) == _expected(
+        trees, formatter="native"
+    )
+
+
+def test_invalid_workers():
+    with pytest.raises(ValueError):
+        list(codeg.generate_many([], workers=0))
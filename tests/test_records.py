@@ -0,0 +1,81 @@
+import black
+import codeg
+import pytest
+
+
+def _point(**kwargs):
+    fields = [
+        codeg.param("x", annotation=int),
+        codeg.param("y", annotation=int, default=0),
+        codeg.param("tag", default=None, kw_only=True),
+    ]
+    return codeg.record("Point", fields, **kwargs)
+
+
+def test_record():
+    Point = _point().build()
+    p = Point(1)
+    assert (p.x, p.y, p.tag) == (1, 0, None)
+    assert Point.__slots__ == ("x", "y", "tag")
+    assert not hasattr(p, "__dict__")
+    assert Point.__annotations__ == {"x": int, "y": int}
+    assert repr(Point(1, 2, tag="a")) == "Point(x=1, y=2, tag='a')"
+    assert Point(1, 2) == Point(1, 2)
+    assert Point(1, 2) != Point(1, 3)
+    assert Point(1, 2) != (1, 2, None)
+    p.x = 5
+    assert p.x == 5
+    # Mutable with __eq__: not hashable
+    with pytest.raises(TypeError):
+        hash(p)
+
+
+def test_frozen():
+    Point = _point(frozen=True).build()
+    p = Point(1, 2)
+    assert hash(p) == hash(Point(1, 2))
+    assert {p, Point(1, 2)} == {p}
+    with pytest.raises(AttributeError, match="Point is frozen"):
+        p.x = 3
+    with pytest.raises(AttributeError):
+        del p.x
+    assert p.x == 1
+
+
+def test_options():
+    Point = _point(eq=False, repr=False).build()
+    p = Point(1)
+    assert p != Point(1)
+    assert hash(p) != hash(Point(1))
+    assert repr(p).startswith("<")
+
+    Point = _point(hash=True).build()
+    assert hash(Point(1, 2)) == hash(Point(1, 2))
+
+
+@pytest.mark.parametrize("names", [[], ["x"], ["x", "y"]])
+@pytest.mark.parametrize("frozen", [False, True])
+def test_native_format(names, frozen):
+    code = codeg.record("R", names, bases=["Base"], frozen=frozen)
+    unformatted = code.generate_code(format_with_black=False)
+    expected = black.format_str(unformatted, mode=black.FileMode())
+    assert code.generate_code(formatter="native") == expected
+    R = codeg.record("R", names, frozen=frozen).build()
+    assert R(*range(len(names))) == R(*range(len(names)))
+
+
+def test_extra_methods():
+    code = codeg.record("Point", ["x", "y"])
+    code.method("norm1").ret("abs(self.x) + abs(self.y)")
+    assert code.build()(1, -2).norm1() == 3
+
+
+def test_invalid_fields():
+    with pytest.raises(ValueError, match="twice"):
+        codeg.record("R", ["x", "x"])
+    with pytest.raises(ValueError, match="Mutable default"):
+        codeg.record("R", [codeg.param("x", default=[])])
+    with pytest.raises(ValueError, match="follows a default"):
+        codeg.record("R", [codeg.param("x", default=1), "y"])
+    # Keyword only fields can follow fields with defaults
+    codeg.record("R", [codeg.param("x", default=1), codeg.param("y", kw_only=True)])
@@ -0,0 +1,130 @@
+import copy
+import pickle
+
+import codeg
+import pytest
+from codeg.codeg import Raise
+
+
+def _tree():
+    code_script = codeg.script()
+    code_script.import_("os", ("numpy", "np"))
+    code_script.import_("Path", frm="pathlib")
+    code_script.annotation("VALUE", int)
+    code_script.comment("Title", title=True)
+    code_cls = code_script.cls("A", ["object"]).decorator("dataclass")
+    code_cls.annotation("x", "typing.List[int]")
+    code_f = code_cls.method(
+        "f",
+        [
+            codeg.param("a", annotation=int, default=[1, (2, None)]),
+            codeg.param("b", default={"k": 1.5}, kw_only=True),
+            codeg.param("c", annotation=str),
+        ],
+    )
+    code_f.decorator("staticmethod")
+    code_if = code_f.if_("a")
+    code_if.line("a += 1")
+    code_if.elif_("b").line("b += 1")
+    code_if.else_().line("pass")
+    code_try = code_f.try_()
+    code_try.line("x = 1")
+    code_try.except_("ValueError", "e").add(Raise("e"))
+    code_try.else_().line("x = 2")
+    code_try.finally_().line("x = 3")
+    code_for = code_f.for_("i", "range(3)")
+    code_for.else_().line("pass")
+    code_f.while_("a").line("a -= 1")
+    code_f.block("with open(p) as f").line("f.read()")
+    return code_script
+
+
+def _code(tree):
+    return tree.generate_code(format_with_black=False)
+
+
+def test_roundtrip():
+    tree = _tree()
+    data = codeg.dumps(tree)
+    loaded = codeg.loads(data)
+    assert _code(loaded) == _code(tree)
+    assert loaded.generate_stubcode() == tree.generate_stubcode()
+
+    code_f = loaded.pieces[4].pieces[1]
+    assert code_f.parameters == tree.pieces[4].pieces[1].parameters
+    assert code_f.parameters[0].annotation is int
+    assert code_f._parents is loaded.pieces[4]
+
+
+def test_flags():
+    code_f = codeg.loads(codeg.dumps(_tree())).pieces[4].pieces[1]
+    code_if, code_try, code_for = code_f.pieces[:3]
+    with pytest.raises(codeg.CodegSyntaxError):
+        code_if.else_()
+    with pytest.raises(codeg.CodegSyntaxError):
+        code_try.finally_()
+    with pytest.raises(codeg.CodegSyntaxError):
+        code_for.else_()
+
+
+def test_modify_loaded_tree():
+    tree = codeg.loads(codeg.dumps(_tree()))
+    _code(tree)
+    tree.pieces[4].method("g")
+    assert "def g(self)" in _code(tree)
+
+
+def test_shared_pieces():
+    tree = codeg.script()
+    for name in ("f", "g"):
+        tree.function(name).if_("x").line("return 1")
+    codeg.intern_tree(tree)
+    loaded = codeg.loads(codeg.dumps(tree))
+    assert loaded.pieces[0].pieces[0] is loaded.pieces[1].pieces[0]
+
+
+def test_shared_objects():
+    template = codeg.Template(codeg.function("get_$field", ["self"]).ret("self.$field"))
+    tree = codeg.script()
+    for i in range(200):
+        tree.add(template.instance(field=f"f{i}"))
+    data = codeg.dumps(tree)
+    # The template is written once, an instance only costs its values
+    size = (len(data) - len(codeg.dumps(tree.pieces[0]))) / 199
+    assert size < len(pickle.dumps(template)) / 4
+    loaded = codeg.loads(data)
+    assert _code(loaded) == _code(tree)
+    assert len({id(e.template) for e in loaded.pieces}) == 1
+
+
+def test_deep_tree():
+    tree = codeg.script()
+    piece = tree.function("f", ["x"])
+    for i in range(5000):
+        piece = piece.if_(f"x > {i}")
+    piece.line("pass")
+    loaded = pickle.loads(pickle.dumps(tree))
+    assert _code(loaded) == _code(tree)
+
+
+def test_pickle_and_copy():
+    tree = _tree()
+    assert _code(pickle.loads(pickle.dumps(tree))) == _code(tree)
+    assert _code(copy.deepcopy(tree)) == _code(tree)
+
+    shallow = copy.copy(tree)
+    assert shallow.pieces is not tree.pieces
+    assert all(a is b for a, b in zip(shallow.pieces, tree.pieces))
+    assert _code(shallow) == _code(tree)
+    # Modifying the copy does not invalidate nor modify the original
+    shallow.pieces.append("x = 1")
+    assert _code(shallow) != _code(tree)
+
+
+def test_version():
+    data = bytearray(codeg.dumps(_tree()))
+    data[len(b"CODEG")] = codeg.FORMAT_VERSION + 1
+    with pytest.raises(ValueError, match="version"):
+        codeg.loads(bytes(data))
+    with pytest.raises(ValueError):
+        codeg.loads(b"not a tree")
@@ -0,0 +1,60 @@
+import io
+import sys
+
+import codeg
+
+
+def _tree():
+    code_script = codeg.script()
+    code_script.import_("dataclass", frm="dataclasses")
+    code_cls = code_script.cls("A").decorator("dataclass")
+    code_cls.method("f", ["x"]).if_("x").ret("x").else_().ret("0")
+    code_script.function("g").for_("i", "range(10)").line("print(i)")
+    code_script.function("h")
+    return code_script
+
+
+def test_iter_lines():
+    assert list(codeg.function("f").ret("1").iter_lines()) == [
+        "def f():",
+        "    return 1",
+    ]
+    assert list(codeg.cls("A").decorator("d").iter_lines(stub=True)) == [
+        "@d",
+        "class A:",
+        "    ...",
+    ]
+
+
+def test_write_code_match_generate_code():
+    code_script = _tree()
+
+    fp = io.StringIO()
+    code_script.write_code(fp)
+    assert fp.getvalue() == code_script.generate_code(format_with_black=False) + "\n"
+
+    fp = io.StringIO()
+    code_script.write_code(fp, format_with_black=True)
+    assert fp.getvalue() == code_script.generate_code()
+
+
+def test_write_code_to_file(tmp_path):
+    path = tmp_path / "generated.py"
+    with open(path, "w") as fp:
+        _tree().write_code(fp)
+
+    namespace = codeg.build(path.read_text())
+    assert namespace["A"]().f(5) == 5
+
+
+def test_deep_nesting_does_not_hit_recursion_limit():
+    depth = sys.getrecursionlimit() * 2
+    code_script = codeg.script()
+    block = code_script
+    for i in range(depth):
+        block = block.if_(f"x > {i}")
+    block.line("y = 1")
+
+    lines = code_script.generate_code(format_with_black=False).splitlines()
+    assert len(lines) == depth + 1
+    assert lines[-1] == "    " * depth + "y = 1"
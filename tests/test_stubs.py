@@ -0,0 +1,96 @@
+import concurrent.futures
+import io
+
+import codeg
+
+
+def _module(i=0):
+    code_script = codeg.script()
+    code_script.import_("typing")
+    code_script.annotation("VALUE", int)
+    code_f = code_script.function(f"f{i}", [codeg.param("x", annotation=int)])
+    code_f.ret("x")
+    code_cls = code_script.cls("Outer", ["object"])
+    code_cls.annotation("a", int)
+    code_cls.method("method").ret("1")
+    code_inner = code_cls.cls("Inner")
+    code_inner.method("inner_method", ["x"]).line("y = x").ret("y")
+    code_cls.cls("Empty")
+    return code_script
+
+
+EXPECTED = """import typing
+
+VALUE: int
+
+def f0(x: int): ...
+
+class Outer(object):
+    a: int
+    def method(self): ...
+
+    class Inner:
+        def inner_method(self, x): ...
+
+    class Empty: ...
+"""
+
+
+def test_nested_classes_and_functions():
+    assert _module().generate_stubcode() == EXPECTED
+
+
+def test_native_same_as_black():
+    assert _module().generate_stubcode(formatter="native") == EXPECTED
+
+
+def test_definition_stub():
+    code_f = codeg.function("f", ["x"]).ret("x")
+    assert code_f.generate_stubcode() == "def f(x): ...\n"
+
+
+def test_template_instances_and_dispatchers():
+    template = codeg.Template(codeg.function("get_$field", ["self"]).ret("self.$field"))
+    assert template.instance(field="x").generate_stubcode() == "def get_x(self): ...\n"
+
+    code_cls = codeg.cls("A")
+    code_cls.add(template.instance(field="x"))
+    cases = {i: f"return {i}" for i in range(20)}
+    code_cls.add(codeg.dispatch("get", ["self", "kind"], "kind", cases))
+    code_cls.add(
+        codeg.dispatch("get_table", ["self", "kind"], "kind", cases, strategy="table")
+    )
+    expected = """class A:
+    def get_x(self): ...
+    def get(self, kind): ...
+    def get_table(self, kind): ...
+"""
+    for formatter in ("black", "native"):
+        assert code_cls.generate_stubcode(formatter=formatter) == expected
+    # The instances still generate their code
+    assert "return self.x" in code_cls.generate_code()
+
+
+def test_stub_script_does_not_adopt():
+    code_script = _module()
+    code_script.stub_script()
+    for piece in code_script.pieces:
+        assert piece._parents is code_script
+
+
+def test_write_stubcode():
+    fp = io.StringIO()
+    _module().write_stubcode(fp)
+    assert fp.getvalue() == EXPECTED
+
+
+def test_generate_stubs():
+    trees = [_module(i) for i in range(40)]
+    expected = [tree.generate_stubcode() for tree in trees]
+
+    assert list(codeg.generate_stubs(trees)) == expected
+    with concurrent.futures.ThreadPoolExecutor(2) as executor:
+        results = codeg.generate_stubs(
+            iter(trees), formatter="black", executor=executor
+        )
+        assert list(results) == expected
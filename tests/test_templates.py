@@ -0,0 +1,91 @@
+import pickle
+
+import codeg
+import pytest
+
+
+def _getter_template():
+    code_f = codeg.function(
+        "get_$field", ["self", codeg.param("default", annotation="$type", default=0)]
+    )
+    code_f.if_("self.$field is None").ret("default")
+    code_f.ret("self.$field * ${factor}0")
+    return codeg.Template(code_f)
+
+
+def test_holes():
+    assert _getter_template().holes == ("field", "type", "factor")
+
+
+def test_render():
+    template = _getter_template()
+    code = template.render(field="x", type="int", factor=2)
+    assert code == (
+        "def get_x(self, default: int = 0):\n"
+        "    if self.x is None:\n"
+        "        return default\n"
+        "    return self.x * 20"
+    )
+    with pytest.raises(KeyError):
+        template.render(field="x")
+
+
+def test_render_is_memoized(monkeypatch):
+    template = _getter_template()
+    first = template.render(field="x", type="int", factor=2)
+    assert template.render(field="x", type="int", factor=2) is first
+    assert template.cache.stats().hits == 1
+
+    def fail(*args):
+        raise AssertionError("the piece is only rendered once")
+
+    monkeypatch.setattr(codeg.FunctionBlock, "_render", fail)
+    template.render(field="y", type="int", factor=2)
+
+
+def test_escaped_dollar():
+    template = codeg.Template(codeg.line("x = '$$$value'"))
+    assert template.holes == ("value",)
+    assert template.render(value=1) == "x = '$1'"
+
+
+def test_invalid_hole():
+    with pytest.raises(ValueError):
+        codeg.Template(codeg.line("x = $1")).holes
+
+
+def test_instances_in_script():
+    template = _getter_template()
+    code_cls = codeg.cls("A")
+    code_cls.line("x = 3")
+    code_cls.line("y = None")
+    for field in ("x", "y"):
+        code_cls.add(template.instance(field=field, type="int", factor=1))
+
+    A = code_cls.build()
+    assert A().get_x() == 30
+    assert A().get_y(5) == 5
+
+    code = code_cls.generate_code(formatter="native")
+    assert code == code_cls.generate_code()
+    assert "\n\n    def get_y(self, default: int = 0):\n" in code
+
+
+def test_instance_build():
+    template = _getter_template()
+    instance = template.instance(field="x", type="int", factor=1)
+    assert instance.name == "get_x"
+    get_x = instance.build(from_ast=True)
+    assert get_x.__name__ == "get_x"
+
+    objects = codeg.build_many(
+        [instance, template.instance(field="y", type="int", factor=1)]
+    )
+    assert [f.__name__ for f in objects.values()] == ["get_x", "get_y"]
+
+
+def test_pickle():
+    template = _getter_template()
+    instance = template.instance(field="x", type="int", factor=1)
+    copy = pickle.loads(pickle.dumps(instance))
+    assert copy.generate_code() == instance.generate_code()
@@ -0,0 +1,119 @@
+import concurrent.futures
+import linecache
+import sys
+import threading
+
+import codeg
+import pytest
+
+N_THREADS = 8
+
+
+@pytest.fixture(autouse=True)
+def switch_often():
+    # Switch threads as often as possible to provoke races
+    interval = sys.getswitchinterval()
+    sys.setswitchinterval(1e-6)
+    yield
+    sys.setswitchinterval(interval)
+
+
+def _run_in_threads(f, n_tasks):
+    with concurrent.futures.ThreadPoolExecutor(N_THREADS) as executor:
+        return list(executor.map(f, range(n_tasks)))
+
+
+def _build(i):
+    f = codeg.function(f"f{i}").line(f"x = {i}").ret("x").build(formatter="native")
+    filename = f.__code__.co_filename
+    # The source of another build must not replace this one
+    assert linecache.getline(filename, 2) == f"    x = {i}\n"
+    return f
+
+
+def test_concurrent_builds_get_distinct_filenames(no_code_cache):
+    functions = _run_in_threads(_build, 2000)
+
+    assert [f() for f in functions] == list(range(2000))
+    filenames = {f.__code__.co_filename for f in functions}
+    assert len(filenames) == 2000
+    for i, f in enumerate(functions):
+        assert linecache.getline(f.__code__.co_filename, 2) == f"    x = {i}\n"
+
+
+def test_concurrent_builds_with_cache():
+    codeg.code_cache.clear()
+    functions = _run_in_threads(lambda i: _build(i % 10), 2000)
+    assert [f() for f in functions] == [i % 10 for i in range(2000)]
+    assert len(codeg.code_cache) <= codeg.code_cache.maxsize
+
+
+def test_concurrent_rendering_of_independent_trees():
+    def tree(i):
+        code_script = codeg.script()
+        for j in range(50):
+            code_if = code_script.function(f"f{j}", ["x"]).if_(f"x == {i}")
+            code_if.ret("1")
+            code_if.else_().ret("2")
+        return code_script
+
+    expected = [tree(i).generate_code(formatter="native") for i in range(200)]
+    codes = _run_in_threads(
+        lambda i: tree(i).generate_code(formatter="native"), len(expected)
+    )
+    assert codes == expected
+
+
+def test_concurrent_rendering_of_shared_tree():
+    code_script = codeg.script()
+    for j in range(200):
+        code_script.function(f"f{j}").ret(str(j))
+    expected = code_script.generate_code(format_with_black=False)
+    code_script.invalidate()
+
+    codes = _run_in_threads(
+        lambda i: code_script.generate_code(format_with_black=False), 100
+    )
+    assert codes == [expected] * 100
+
+
+def test_concurrent_appends_are_not_lost():
+    for _ in range(50):
+        code_f = codeg.function("f")
+        barrier = threading.Barrier(N_THREADS, timeout=30)
+
+        def add_lines(i):
+            barrier.wait()
+            for j in range(20):
+                code_f.line(f"x{i}_{j} = {j}")
+
+        _run_in_threads(add_lines, N_THREADS)
+        assert len(code_f.pieces) == N_THREADS * 20
+
+
+def test_concurrent_else_called_once():
+    for _ in range(50):
+        code_if = codeg.if_("x")
+        barrier = threading.Barrier(N_THREADS, timeout=30)
+
+        def add_else(i):
+            barrier.wait()
+            try:
+                code_if.else_()
+            except codeg.CodegSyntaxError:
+                return False
+            return True
+
+        assert sum(_run_in_threads(add_else, N_THREADS)) == 1
+        assert len(code_if.sibling_pieces) == 1
+
+
+def test_concurrent_metrics_counters():
+    codeg.metrics.enable()
+    codeg.metrics.reset()
+    try:
+        _run_in_threads(lambda i: codeg.build(f"x = {i}\n"), 500)
+        assert codeg.metrics.counters()["exec"].count == 500
+    finally:
+        codeg.metrics.disable()
+        codeg.metrics.reset()